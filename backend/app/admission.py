@@ -0,0 +1,345 @@
+# app/admission.py
+"""
+Admission control and fair scheduling for analysis jobs.
+
+Uploads go through admit() before anything is stored:
+  - a per-user token bucket limits how fast jobs can be submitted
+  - a per-user cap and a global cap bound how many jobs can wait
+Rejections raise AdmissionRejected with a Retry-After hint (HTTP 429).
+
+Admitted jobs wait in a weighted fair queue (start-time fair queuing over
+users): a user with 500 queued images gets their share, not the whole
+runner. Pro users weigh more (ADMISSION_TIERS). The queue lives in this
+process: on startup, jobs still "pending" in the database (queued when the
+previous process stopped) are queued again. A dispatcher thread hands
+jobs to Celery as long as the workers have free slots
+(ADMISSION_MAX_CELERY_IN_FLIGHT, by default the workers' total
+concurrency), or runs at most ADMISSION_MAX_RUNNING at a time in
+in-process worker threads. When in-process jobs have worn the process down (see
+memory.recycle_reason), it drains the running jobs and recycles the models
+before dispatching again.
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from . import crud, memory
+from .config import (
+    ADMISSION_MAX_CELERY_IN_FLIGHT,
+    ADMISSION_MAX_QUEUED,
+    ADMISSION_MAX_RUNNING,
+    ADMISSION_TIERS,
+)
+from .metrics import QUEUE_WAIT_SECONDS
+from .tasks import celery_available, run_analysis, run_analysis_sync, worker_capacity
+
+# used for Retry-After until real job durations have been observed
+DEFAULT_JOB_SECONDS = 5.0
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, int(retry_after))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, burst: int):
+        self.rate = rate_per_second
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take a token. Returns 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+_lock = threading.Condition()
+_buckets: Dict[int, TokenBucket] = {}
+# (finish_tag, seq, job) ordered by virtual finish time
+_heap = []
+_seq = itertools.count()
+_virtual_time = 0.0
+_user_finish: Dict[int, float] = {}
+_user_queued: Dict[int, int] = {}
+# job_id -> Celery AsyncResult (or None for in-process jobs)
+_running: Dict[int, Any] = {}
+
+_executor: Optional[ThreadPoolExecutor] = None
+_dispatcher: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+_recent_waits = deque(maxlen=1000)
+_job_seconds = DEFAULT_JOB_SECONDS
+
+METRICS = {
+    "admitted": 0,
+    "rejected_rate_limited": 0,
+    "rejected_user_queue_full": 0,
+    "rejected_queue_full": 0,
+    "dispatched": 0,
+    "wait_seconds_total": 0.0,
+    "wait_seconds_max": 0.0,
+}
+
+
+def _tier_limits(tier: str) -> Dict[str, Any]:
+    return ADMISSION_TIERS.get(tier, ADMISSION_TIERS["free"])
+
+
+def _max_running(refresh: bool = False) -> int:
+    if celery_available():
+        return ADMISSION_MAX_CELERY_IN_FLIGHT or worker_capacity(refresh)
+    return ADMISSION_MAX_RUNNING
+
+
+def _estimated_wait(queued: int) -> float:
+    return (queued / max(1, _max_running()) + 1) * _job_seconds
+
+
+# -----------------------
+# Admission
+# -----------------------
+def admit(user_id: int, tier: str) -> None:
+    """Check rate limit and queue bounds for one new job; raises AdmissionRejected."""
+    limits = _tier_limits(tier)
+    with _lock:
+        queued = len(_heap)
+        if queued >= ADMISSION_MAX_QUEUED:
+            METRICS["rejected_queue_full"] += 1
+            raise AdmissionRejected("Analysis queue is full", math.ceil(_estimated_wait(queued)))
+
+        if _user_queued.get(user_id, 0) >= limits["max_queued"]:
+            METRICS["rejected_user_queue_full"] += 1
+            raise AdmissionRejected(
+                "Too many of your images are waiting for analysis",
+                math.ceil(_estimated_wait(_user_queued[user_id])),
+            )
+
+        bucket = _buckets.get(user_id)
+        if bucket is None or bucket.capacity != limits["burst"]:
+            # new user, or their plan changed
+            bucket = _buckets[user_id] = TokenBucket(limits["rate_per_minute"] / 60.0, limits["burst"])
+        wait = bucket.take()
+        if wait > 0:
+            METRICS["rejected_rate_limited"] += 1
+            raise AdmissionRejected("Upload rate limit exceeded", math.ceil(wait))
+
+        METRICS["admitted"] += 1
+
+
+def refund(user_id: int) -> None:
+    """Give back the token admit() took, for an upload rejected or failed afterwards."""
+    with _lock:
+        bucket = _buckets.get(user_id)
+        if bucket is not None:
+            bucket.tokens = min(bucket.capacity, bucket.tokens + 1.0)
+
+
+def enqueue(job_id: int, file_path: str, user_id: int, tier: str, profile: Optional[str] = None) -> None:
+    """Queue an admitted job for its user's fair share of the runner."""
+    global _virtual_time
+    weight = _tier_limits(tier)["weight"]
+    _ensure_dispatcher()
+    with _lock:
+        start = max(_virtual_time, _user_finish.get(user_id, 0.0))
+        finish = start + 1.0 / weight
+        _user_finish[user_id] = finish
+        _user_queued[user_id] = _user_queued.get(user_id, 0) + 1
+        heapq.heappush(_heap, (finish, next(_seq), {
+            "job_id": job_id,
+            "file_path": file_path,
+            "user_id": user_id,
+            "profile": profile,
+            "enqueued_at": time.monotonic(),
+        }))
+        _lock.notify()
+
+
+# -----------------------
+# Dispatching
+# -----------------------
+def _pop_next() -> Dict[str, Any]:
+    global _virtual_time
+    finish, _, job = heapq.heappop(_heap)
+    _virtual_time = max(_virtual_time, finish)
+    uid = job["user_id"]
+    _user_queued[uid] -= 1
+    if not _user_queued[uid]:
+        del _user_queued[uid]
+        if _user_finish.get(uid, 0.0) <= _virtual_time:
+            _user_finish.pop(uid, None)
+    return job
+
+
+def _prune_running() -> None:
+    for job_id, result in list(_running.items()):
+        if result is not None and result.ready():
+            del _running[job_id]
+
+
+def _run_in_process(job: Dict[str, Any]) -> None:
+    global _job_seconds
+    t0 = time.monotonic()
+    try:
+        run_analysis_sync(job["job_id"], job["file_path"], job["profile"])
+    finally:
+        elapsed = time.monotonic() - t0
+        with _lock:
+            _running.pop(job["job_id"], None)
+            _job_seconds = 0.8 * _job_seconds + 0.2 * elapsed
+            _lock.notify()
+
+
+def _dispatch(job: Dict[str, Any]) -> None:
+    waited = time.monotonic() - job["enqueued_at"]
+    _recent_waits.append(waited)
+    QUEUE_WAIT_SECONDS.observe(waited)
+    METRICS["dispatched"] += 1
+    METRICS["wait_seconds_total"] += waited
+    METRICS["wait_seconds_max"] = max(METRICS["wait_seconds_max"], waited)
+
+    if celery_available():
+        try:
+            _running[job["job_id"]] = run_analysis.delay(job["job_id"], job["file_path"], job["profile"])
+            return
+        except Exception as e:
+            print(f"[admission] Celery dispatch failed, running in-process: {e}")
+    _running[job["job_id"]] = None
+    try:
+        _executor.submit(_run_in_process, job)
+    except Exception:
+        _running.pop(job["job_id"], None)
+        raise
+
+
+def _recycle_reason() -> Optional[str]:
+    # only jobs run in this process wear it down; Celery recycles its own children
+    if celery_available() and not any(r is None for r in _running.values()):
+        return None
+    return memory.recycle_reason()
+
+
+def _dispatch_pass() -> None:
+    # may ask the Celery workers, so not under the lock
+    limit = _max_running(refresh=True)
+    with _lock:
+        _prune_running()
+        reason = _recycle_reason()
+        if reason is None:
+            while _heap and len(_running) < limit:
+                _dispatch(_pop_next())
+        elif _running:
+            # draining: let the running jobs finish, dispatch nothing new
+            memory.STATS["state"] = "draining"
+        if reason is None or _running:
+            # Celery completions are only seen by polling their results
+            _lock.wait(timeout=0.5 if any(r is not None for r in _running.values()) else 5.0)
+            return
+    # drained; recycle without holding the lock so uploads are still admitted
+    try:
+        memory.recycle(reason)
+    except Exception as e:
+        print(f"[admission] Recycling failed, dispatching anyway: {e}")
+
+
+def _dispatch_loop() -> None:
+    while not _stop.is_set():
+        try:
+            _dispatch_pass()
+        except Exception as e:
+            # e.g. the result backend is down; a job lost here stays "pending"
+            # in the database and is queued again on the next start
+            print(f"[admission] Dispatcher error, retrying: {e}")
+            traceback.print_exc()
+            _stop.wait(1.0)
+
+
+def _ensure_dispatcher() -> None:
+    global _dispatcher, _executor
+    with _lock:
+        if _dispatcher and _dispatcher.is_alive():
+            return
+        _stop.clear()
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ADMISSION_MAX_RUNNING, thread_name_prefix="analysis")
+        _dispatcher = threading.Thread(target=_dispatch_loop, name="admission", daemon=True)
+        _dispatcher.start()
+
+
+def requeue_pending() -> int:
+    """
+    Queue the jobs left "pending" by a previous process. Other processes may
+    queue the same ones; crud.claim_job makes sure each runs once.
+    """
+    from .database import SessionLocal
+    from .payments import plan_tier
+
+    db = SessionLocal()
+    try:
+        pending = crud.get_pending_jobs(db, ADMISSION_MAX_QUEUED)
+    finally:
+        db.close()
+    with _lock:
+        known = {job["job_id"] for _, _, job in _heap} | set(_running)
+    count = 0
+    for job_id, file_path, user_id, plan in pending:
+        if job_id in known:
+            continue
+        enqueue(job_id, file_path, user_id or 0, plan_tier(plan))
+        count += 1
+    if count:
+        print(f"[admission] Re-queued {count} pending jobs")
+    return count
+
+
+def start_dispatcher() -> None:
+    _ensure_dispatcher()
+    try:
+        requeue_pending()
+    except Exception as e:
+        print(f"[admission] Could not re-queue pending jobs: {e}")
+
+
+def stop_dispatcher() -> None:
+    _stop.set()
+    with _lock:
+        _lock.notify_all()
+
+
+# -----------------------
+# Metrics
+# -----------------------
+def queue_metrics() -> Dict[str, Any]:
+    with _lock:
+        waits = sorted(_recent_waits)
+        queued_by_user = dict(_user_queued)
+        snapshot = {
+            "queued": len(_heap),
+            "running": len(_running),
+            "max_queued": ADMISSION_MAX_QUEUED,
+            "max_running": _max_running(),
+            "users_waiting": len(queued_by_user),
+            "max_user_queued": max(queued_by_user.values(), default=0),
+            "avg_job_seconds": round(_job_seconds, 3),
+            "worker_state": memory.STATS["state"],
+        }
+    snapshot["wait_seconds_p50"] = round(waits[len(waits) // 2], 3) if waits else 0.0
+    snapshot["wait_seconds_p95"] = round(waits[int(len(waits) * 0.95)], 3) if waits else 0.0
+    snapshot.update(METRICS)
+    return snapshot
@@ -1,12 +1,20 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from .config import ADMIN_USERNAMES, USER_CACHE_MAX_ENTRIES, USER_CACHE_TTL_SECONDS
 from .database import SessionLocal
+from .dependencies import get_async_db
 from . import models
 
 # JWT settings
@@ -39,7 +47,8 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire})
+    # jti gives every token its own user-cache entry
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -58,6 +67,12 @@ def get_user_by_username(db: Session, username: str):
     return db.query(models.User).filter(models.User.username == username).first()
 
 
+async def get_user_by_username_async(db: AsyncSession, username: str):
+    """Get user by username (async session)"""
+    result = await db.execute(select(models.User).where(models.User.username == username))
+    return result.scalars().first()
+
+
 def get_user_by_email(db: Session, email: str):
     """Get user by email"""
     return db.query(models.User).filter(models.User.email == email).first()
@@ -73,9 +88,56 @@ def authenticate_user(db: Session, username: str, password: str):
     return user
 
 
+# -----------------------------
+# Resolved-user cache: (sub, jti) -> detached User, bounded by TTL and token exp
+# -----------------------------
+_USER_CACHE: "OrderedDict[tuple, tuple]" = OrderedDict()
+_USER_CACHE_LOCK = threading.Lock()
+USER_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def _cache_key(payload: dict) -> tuple:
+    # older tokens have no jti; their expiry still identifies them
+    return (payload.get("sub"), payload.get("jti") or payload.get("exp"))
+
+
+def _get_cached_user(key: tuple):
+    with _USER_CACHE_LOCK:
+        entry = _USER_CACHE.get(key)
+        if entry is None:
+            return None
+        expires_at, user = entry
+        if expires_at <= time.monotonic():
+            del _USER_CACHE[key]
+            return None
+        _USER_CACHE.move_to_end(key)
+        return user
+
+
+def _cache_user(key: tuple, payload: dict, user) -> None:
+    ttl = USER_CACHE_TTL_SECONDS
+    exp = payload.get("exp")
+    if exp:
+        ttl = min(ttl, exp - time.time())
+    if ttl <= 0:
+        return
+    with _USER_CACHE_LOCK:
+        _USER_CACHE[key] = (time.monotonic() + ttl, user)
+        _USER_CACHE.move_to_end(key)
+        while len(_USER_CACHE) > USER_CACHE_MAX_ENTRIES:
+            _USER_CACHE.popitem(last=False)
+
+
+def invalidate_cached_user(username: str) -> None:
+    """Drop every cached entry for a user, e.g. after deactivating them."""
+    with _USER_CACHE_LOCK:
+        for key in [k for k in _USER_CACHE if k[0] == username]:
+            del _USER_CACHE[key]
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get current authenticated user from JWT token"""
     credentials_exception = HTTPException(
@@ -91,11 +153,21 @@ async def get_current_user(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    
-    user = get_user_by_username(db, username=username)
+
+    # signature and expiry are checked above; the DB is only hit on a cache miss
+    key = _cache_key(payload)
+    user = _get_cached_user(key)
+    if user is not None:
+        USER_CACHE_STATS["hits"] += 1
+        return user
+    USER_CACHE_STATS["misses"] += 1
+
+    user = await get_user_by_username_async(db, username=username)
     if user is None:
         raise credentials_exception
-    
+
+    db.expunge(user)
+    _cache_user(key, payload, user)
     return user
 
 
@@ -107,3 +179,16 @@ async def get_current_active_user(
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
 
+
+def is_admin(user: models.User) -> bool:
+    return user.username in ADMIN_USERNAMES
+
+
+async def get_current_admin_user(
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Active user listed in ADMIN_USERNAMES"""
+    if not is_admin(current_user):
+        raise HTTPException(status_code=403, detail="Admin access required")
+    return current_user
+
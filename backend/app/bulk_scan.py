@@ -0,0 +1,409 @@
+# app/bulk_scan.py
+"""
+Offline bulk scanner: runs MODEL_REGISTRY over directories and archives
+(.zip, .tar, .tar.gz/.tgz/.tar.bz2/.tar.xz) without the HTTP upload path.
+
+    cd backend
+    python -m app.bulk_scan /data/archive.zip /data/images --out scans/run1
+    python -m app.bulk_scan /data/images --out scans/run1 --format parquet --db --user alice
+
+Files are read and hashed in this process; decoding and fitting to each
+model input size happen in a process pool, and the decoded images go
+through every model in batches (models_interface.predict_batch). Results are
+written after every batch to <out>/results.csv, or <out>/part-NNNNN.parquet
+(needs pyarrow). Running again with the same --out resumes: content hashes
+already in the output are skipped, as are duplicate files within a run.
+
+With --db every image is also stored like an upload and recorded as a
+completed job with its model results (no heatmaps), owned by --user.
+"""
+
+import argparse
+import csv
+import glob
+import hashlib
+import io
+import multiprocessing
+import os
+import sys
+import tarfile
+import time
+import uuid
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+
+from . import models_interface as mi
+from .consensus import compute_consensus
+
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff"}
+ARCHIVE_EXTS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+BASE_FIELDS = ["source", "sha256", "bytes", "width", "height", "verdict", "consensus_score", "error", "job_id"]
+INT_FIELDS = {"bytes", "width", "height", "job_id"}
+
+
+def _is_image(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in IMAGE_EXTS
+
+
+def _is_archive(name: str) -> bool:
+    return name.lower().endswith(ARCHIVE_EXTS)
+
+
+# -----------------------
+# Sources
+# -----------------------
+def _iter_archive(path: str) -> Iterator[Tuple[str, bytes]]:
+    if path.lower().endswith(".zip"):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and _is_image(info.filename):
+                    yield f"{path}!{info.filename}", zf.read(info)
+    else:
+        # stream mode: compressed tars are read front to back exactly once
+        with tarfile.open(path, "r|*") as tf:
+            for member in tf:
+                if member.isfile() and _is_image(member.name):
+                    yield f"{path}!{member.name}", tf.extractfile(member).read()
+
+
+def iter_sources(paths: List[str]) -> Iterator[Tuple[str, bytes]]:
+    """(source, content) for every image under `paths`, in a stable order."""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    yield from iter_sources([os.path.join(root, name)])
+        elif _is_archive(path):
+            try:
+                yield from _iter_archive(path)
+            except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+                print(f"[bulk_scan] Skipping unreadable archive {path}: {e}")
+        elif _is_image(path):
+            try:
+                with open(path, "rb") as fh:
+                    yield path, fh.read()
+            except OSError as e:
+                print(f"[bulk_scan] Skipping unreadable file {path}: {e}")
+
+
+# -----------------------
+# Decoding (pool workers)
+# -----------------------
+def _decode_chunk(items: List[Tuple[str, str, bytes]], sizes: List[int], store: bool) -> List[Dict[str, Any]]:
+    """Decode and fit images to every input size; with `store`, save them like uploads."""
+    from . import storage
+
+    out = []
+    for source, sha256, data in items:
+        item: Dict[str, Any] = {"source": source, "sha256": sha256, "bytes": len(data)}
+        try:
+            img = Image.open(io.BytesIO(data)).convert("RGB")
+            item["width"], item["height"] = img.size
+            item["fitted"] = {size: np.asarray(mi._fit_image(img, size)) for size in sizes}
+            if store:
+                ext = storage.sniff_ext(data, os.path.splitext(source)[1].lower() or ".jpg")
+                _, ext, path = storage.put_bytes("uploads", data, ext)
+                storage.make_derivatives("uploads", sha256, img)
+                item["blob"] = ("uploads", sha256, ext)
+                item["file_path"] = path
+        except UnidentifiedImageError:
+            item["error"] = "decode: not a supported image"
+        except Exception as e:
+            item["error"] = f"decode: {e}"
+        out.append(item)
+    return out
+
+
+# -----------------------
+# Output
+# -----------------------
+class ResultWriter:
+    """Appends result rows to <out>; reads back the hashes already written."""
+
+    def __init__(self, out_dir: str, fmt: str, fieldnames: List[str]):
+        self.out_dir = out_dir
+        self.fmt = fmt
+        self.fieldnames = fieldnames
+        self.done: Set[str] = set()
+        os.makedirs(out_dir, exist_ok=True)
+        if fmt == "parquet":
+            self._open_parquet()
+        else:
+            self._open_csv()
+
+    def _check_fields(self, existing: List[str]) -> None:
+        if existing and existing != self.fieldnames:
+            raise SystemExit(
+                f"[bulk_scan] {self.out_dir} was written with different models "
+                f"({', '.join(existing)}); use a new --out"
+            )
+
+    def _open_csv(self) -> None:
+        self.path = os.path.join(self.out_dir, "results.csv")
+        if os.path.exists(self.path):
+            with open(self.path, newline="") as fh:
+                reader = csv.DictReader(fh)
+                self._check_fields(reader.fieldnames or [])
+                for row in reader:
+                    # a row cut short by an interruption has no usable hash
+                    if row.get("sha256") and len(row["sha256"]) == 64:
+                        self.done.add(row["sha256"])
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+        self._fh = open(self.path, "a", newline="")
+        self._csv = csv.DictWriter(self._fh, fieldnames=self.fieldnames)
+        if new:
+            self._csv.writeheader()
+
+    def _open_parquet(self) -> None:
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("[bulk_scan] --format parquet needs pyarrow (pip install pyarrow)")
+        self._pq = pq
+        parts = sorted(glob.glob(os.path.join(self.out_dir, "part-*.parquet")))
+        for part in parts:
+            table = pq.read_table(part)
+            self._check_fields(table.column_names)
+            self.done.update(table.column("sha256").to_pylist())
+        self._next_part = len(parts)
+
+    def write(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        if self.fmt == "parquet":
+            import pyarrow as pa
+
+            # explicit types, so parts whose columns happen to be all empty still match
+            schema = pa.schema([
+                (f, pa.int64() if f in INT_FIELDS else
+                 pa.float64() if f == "consensus_score" or f.endswith(".fake") else pa.string())
+                for f in self.fieldnames
+            ])
+            table = pa.Table.from_pylist([{f: r.get(f) for f in self.fieldnames} for r in rows], schema=schema)
+            path = os.path.join(self.out_dir, f"part-{self._next_part:05d}.parquet")
+            # written under a temporary name so a part is either complete or absent
+            self._pq.write_table(table, path + ".tmp")
+            os.replace(path + ".tmp", path)
+            self._next_part += 1
+        else:
+            self._csv.writerows(rows)
+            self._fh.flush()
+            os.fsync(self._fh.fileno())
+        self.done.update(r["sha256"] for r in rows)
+
+    def close(self) -> None:
+        if self.fmt == "csv":
+            self._fh.close()
+
+
+# -----------------------
+# Inference
+# -----------------------
+def _model_row(entry: Dict[str, Any], probs, time_ms: float) -> Dict[str, Any]:
+    if probs is None:
+        real, fake, label = 0.5, 0.5, "error"
+    else:
+        real, fake, label = mi._confidences(probs)
+    return {
+        "model_name": entry["name"],
+        "version": entry.get("version", "1.0"),
+        "confidence_real": round(real, 6),
+        "confidence_fake": round(fake, 6),
+        "label": label,
+        "heatmap_path": "N/A",
+        "heatmap_ready": False,
+        "time_ms": round(time_ms, 2),
+        "inference_ms": round(time_ms, 2),
+    }
+
+
+def run_batch(items: List[Dict[str, Any]], registry: List[Dict[str, Any]], models: Dict[str, Any]) -> None:
+    """Run every model over the decoded items; fills item["results"] and the consensus."""
+    ok = [item for item in items if "error" not in item]
+    for item in ok:
+        item["results"] = []
+    if not ok:
+        return
+    for entry in registry:
+        size = int(entry.get("input_size", 224))
+        t0 = time.time()
+        try:
+            probs = mi.predict_batch(entry, models[entry["name"]], np.stack([i["fitted"][size] for i in ok]))
+        except Exception as e:
+            print(f"[bulk_scan] {entry['name']} failed on a batch of {len(ok)}: {e}")
+            probs = [None] * len(ok)
+        per_image_ms = (time.time() - t0) * 1000.0 / len(ok)
+        for item, p in zip(ok, probs):
+            item["results"].append(_model_row(entry, p, per_image_ms))
+    for item in ok:
+        consensus = compute_consensus(item["results"])
+        item["verdict"] = consensus["decision"]
+        item["consensus_score"] = round(consensus["score"], 6)
+
+
+def _output_row(item: Dict[str, Any]) -> Dict[str, Any]:
+    row = {f: item.get(f) for f in BASE_FIELDS}
+    for r in item.get("results", []):
+        row[f"{r['model_name']}.label"] = r["label"]
+        row[f"{r['model_name']}.fake"] = r["confidence_fake"]
+    return row
+
+
+# -----------------------
+# Driver
+# -----------------------
+class _Progress:
+    def __init__(self, every: float):
+        self.every = every
+        self.started = self.last = time.time()
+        self.counts = {"scanned": 0, "skipped": 0, "duplicates": 0, "errors": 0, "bytes": 0}
+
+    def maybe_print(self, force: bool = False) -> None:
+        now = time.time()
+        if not force and now - self.last < self.every:
+            return
+        self.last = now
+        c = self.counts
+        elapsed = max(now - self.started, 1e-6)
+        print(
+            f"[bulk_scan] {c['scanned']} scanned ({c['errors']} errors), {c['skipped']} already done, "
+            f"{c['duplicates']} duplicates | {c['scanned'] / elapsed:.1f} img/s, "
+            f"{c['bytes'] / elapsed / 1e6:.1f} MB/s, {elapsed:.0f}s"
+        )
+
+
+def scan(args) -> Dict[str, int]:
+    from . import model_registry
+
+    model_registry.load()
+    registry = list(mi.MODEL_REGISTRY)
+    sizes = sorted({int(e.get("input_size", 224)) for e in registry})
+    fieldnames = BASE_FIELDS + [f"{e['name']}.{col}" for e in registry for col in ("label", "fake")]
+    writer = ResultWriter(args.out, args.format, fieldnames)
+    print(f"[bulk_scan] {len(writer.done)} images already in {args.out}")
+
+    db = user_id = None
+    if args.db:
+        from . import crud
+        from .database import SessionLocal, engine, sync_schema
+        from .models import Base, User
+
+        Base.metadata.create_all(bind=engine)
+        sync_schema()
+        db = SessionLocal()
+        if args.user:
+            user = db.query(User).filter(User.username == args.user).first()
+            if not user:
+                raise SystemExit(f"[bulk_scan] No user {args.user!r}")
+            user_id = user.id
+
+    # the pool is started before any framework is loaded here
+    pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"))
+    models = {}
+    for entry in registry:
+        try:
+            models[entry["name"]] = mi._load_model_entry(entry)
+        except Exception as e:
+            pool.shutdown(cancel_futures=True)
+            raise SystemExit(f"[bulk_scan] Could not load {entry['name']}: {e}")
+
+    progress = _Progress(args.progress_seconds)
+    seen: Set[str] = set()
+    pending: deque = deque()
+    decoded: List[Dict[str, Any]] = []
+
+    def flush(items):
+        run_batch(items, registry, models)
+        if db is not None:
+            stored = [i for i in items if "results" in i]
+            # jobs are committed before the output row is written; after an
+            # interruption between the two, the resumed run finds them here
+            existing = crud.get_completed_job_ids({i["file_path"] for i in stored}, db, user_id=user_id)
+            for item in stored:
+                if item["file_path"] in existing:
+                    item["job_id"] = existing[item["file_path"]]
+            stored = [i for i in stored if "job_id" not in i]
+            ids = crud.create_completed_jobs([
+                {**i, "image_id": uuid.uuid4().hex, "storage_bytes": i["bytes"]} for i in stored
+            ], db, user_id=user_id)
+            for item, job_id in zip(stored, ids):
+                item["job_id"] = job_id
+        writer.write([_output_row(i) for i in items])
+        progress.counts["scanned"] += len(items)
+        progress.counts["errors"] += sum(1 for i in items if "error" in i)
+
+    def collect(block: bool):
+        # results are taken in submission order, so output order is stable
+        while pending and (block or pending[0].done()):
+            decoded.extend(pending.popleft().result())
+            while len(decoded) >= args.batch_size:
+                flush(decoded[:args.batch_size])
+                del decoded[:args.batch_size]
+            progress.maybe_print()
+
+    chunk: List[Tuple[str, str, bytes]] = []
+    try:
+        for source, data in iter_sources(args.paths):
+            sha256 = hashlib.sha256(data).hexdigest()
+            if sha256 in writer.done:
+                progress.counts["skipped"] += 1
+                continue
+            if sha256 in seen:
+                progress.counts["duplicates"] += 1
+                continue
+            seen.add(sha256)
+            progress.counts["bytes"] += len(data)
+            chunk.append((source, sha256, data))
+            if len(chunk) >= args.chunk_size:
+                pending.append(pool.submit(_decode_chunk, chunk, sizes, args.db))
+                chunk = []
+                # bounded read-ahead: wait for the oldest chunk once enough are in flight
+                collect(block=len(pending) >= args.workers * 2)
+            if args.limit and len(seen) >= args.limit:
+                break
+        if chunk:
+            pending.append(pool.submit(_decode_chunk, chunk, sizes, args.db))
+        collect(block=True)
+        if decoded:
+            flush(decoded)
+    except KeyboardInterrupt:
+        print(f"[bulk_scan] Interrupted; finished batches are saved, rerun with --out {args.out} to resume")
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        writer.close()
+        if db is not None:
+            db.close()
+    pool.shutdown()
+    progress.maybe_print(force=True)
+    return progress.counts
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Scan directories and archives with every registered model")
+    parser.add_argument("paths", nargs="+", help="image files, directories or archives")
+    parser.add_argument("--out", required=True, help="output directory (reuse it to resume)")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="decode processes")
+    parser.add_argument("--batch-size", type=int, default=32, help="images per model call")
+    parser.add_argument("--chunk-size", type=int, default=16, help="images per decode task")
+    parser.add_argument("--db", action="store_true", help="also store images and record completed jobs")
+    parser.add_argument("--user", help="username owning the jobs written with --db")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many new images")
+    parser.add_argument("--progress-seconds", type=float, default=5.0)
+    args = parser.parse_args(argv)
+    try:
+        scan(args)
+    except KeyboardInterrupt:
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
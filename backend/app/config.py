@@ -35,3 +35,139 @@ else:
 # Check if Redis is available (for local dev)
 # Default to "false" for local development (no Redis needed)
 USE_CELERY = os.getenv("USE_CELERY", "false")  # auto, true, false
+
+# PROCESS ROLE
+#   api:       serve HTTP and hand analysis to Celery workers (never imports the frameworks)
+#   worker:    Celery worker (preloads the models)
+#   inprocess: serve HTTP and run analysis in this process
+APP_ROLE = os.getenv("APP_ROLE") or ("inprocess" if USE_CELERY == "false" else "api")
+
+# FILE STORAGE
+# Uploads and heatmaps are stored under <project root>/data by default
+# (a relative DATA_DIR is resolved against the working directory at startup)
+DATA_DIR = os.path.abspath(os.getenv(
+    "DATA_DIR",
+    os.path.join(os.path.dirname(__file__), "..", "..", "data"),
+))
+
+# Public base URL used when building file links in API responses
+API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000").rstrip("/")
+
+# In-memory LRU for hot upload/heatmap bytes (see app/file_cache.py)
+FILE_CACHE_MAX_BYTES = int(os.getenv("FILE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+FILE_CACHE_MAX_ENTRY_BYTES = int(os.getenv("FILE_CACHE_MAX_ENTRY_BYTES", str(2 * 1024 * 1024)))
+# entries of any size (larger files only keep their ETag)
+FILE_CACHE_MAX_ENTRIES = int(os.getenv("FILE_CACHE_MAX_ENTRIES", "10000"))
+
+# RETENTION / GARBAGE COLLECTION (see app/retention.py)
+# off by default: passes delete users' old jobs and enforce quotas, so opt in
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "false") == "true"
+RETENTION_INTERVAL_SECONDS = int(os.getenv("RETENTION_INTERVAL_SECONDS", "300"))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "200"))
+# files younger than this are never treated as orphans (uploads/heatmaps in flight)
+RETENTION_ORPHAN_GRACE_SECONDS = int(os.getenv("RETENTION_ORPHAN_GRACE_SECONDS", "3600"))
+RETENTION_FAILED_JOB_DAYS = int(os.getenv("RETENTION_FAILED_JOB_DAYS", "1"))
+# jobs still "processing"/"partial:*" this long after upload lost their worker; they are marked failed
+RETENTION_STALE_JOB_HOURS = int(os.getenv("RETENTION_STALE_JOB_HOURS", "6"))
+# per tier (see payments.plan_tier): max job age in days and disk quota in MB
+RETENTION_POLICIES = {
+    "free": {
+        "max_age_days": int(os.getenv("RETENTION_FREE_MAX_AGE_DAYS", "30")),
+        "quota_mb": int(os.getenv("RETENTION_FREE_QUOTA_MB", "500")),
+    },
+    "pro": {
+        "max_age_days": int(os.getenv("RETENTION_PRO_MAX_AGE_DAYS", "365")),
+        "quota_mb": int(os.getenv("RETENTION_PRO_QUOTA_MB", "10240")),
+    },
+}
+
+# DATABASE ENGINE PROFILES (see app/database.py)
+# SQLite: WAL journal so background writers don't block API readers
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# Postgres connection pool, sized per process (API worker or Celery child)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true") == "true"
+
+# AUTH: resolved users are cached per token for this long (see auth.get_current_user)
+USER_CACHE_TTL_SECONDS = int(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+# JOB PROGRESS EVENTS (see app/events.py): auto = redis when Celery is used, else memory
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "auto")
+
+# ADMISSION CONTROL (see app/admission.py)
+# analysis jobs waiting across all users before uploads get 429
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "500"))
+# jobs run by in-process worker threads at the same time
+ADMISSION_MAX_RUNNING = int(os.getenv("ADMISSION_MAX_RUNNING", "2"))
+# jobs handed to Celery and not finished yet; 0 = the workers' total
+# concurrency as reported by the workers (see tasks.worker_capacity)
+ADMISSION_MAX_CELERY_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_CELERY_IN_FLIGHT", "0"))
+# per tier (see payments.plan_tier): token bucket, per-user queue cap and fair-share weight
+ADMISSION_TIERS = {
+    "free": {
+        "rate_per_minute": float(os.getenv("ADMISSION_FREE_RATE_PER_MINUTE", "6")),
+        "burst": int(os.getenv("ADMISSION_FREE_BURST", "10")),
+        "max_queued": int(os.getenv("ADMISSION_FREE_MAX_QUEUED", "20")),
+        "weight": float(os.getenv("ADMISSION_FREE_WEIGHT", "1")),
+    },
+    "pro": {
+        "rate_per_minute": float(os.getenv("ADMISSION_PRO_RATE_PER_MINUTE", "60")),
+        "burst": int(os.getenv("ADMISSION_PRO_BURST", "50")),
+        "max_queued": int(os.getenv("ADMISSION_PRO_MAX_QUEUED", "200")),
+        "weight": float(os.getenv("ADMISSION_PRO_WEIGHT", "4")),
+    },
+}
+
+# CELERY WORKER TUNING (long, CPU-bound analysis tasks)
+# load MODEL_REGISTRY in the worker parent so prefork children share it copy-on-write
+CELERY_PRELOAD_MODELS = os.getenv("CELERY_PRELOAD_MODELS", "true") == "true"
+# warming up runs inference, which starts torch OpenMP / TF thread pools that
+# don't survive a fork; so by default each child warms up after it starts
+CELERY_PRELOAD_WARMUP = os.getenv("CELERY_PRELOAD_WARMUP", "false") == "true"
+CELERY_CHILD_WARMUP = os.getenv("CELERY_CHILD_WARMUP", "true") == "true"
+# intra-op threads per child; default concurrency keeps children * threads ~ cores
+CELERY_CHILD_THREADS = int(os.getenv("CELERY_CHILD_THREADS", "2"))
+CELERY_WORKER_CONCURRENCY = int(
+    os.getenv("CELERY_WORKER_CONCURRENCY", str(max(1, (os.cpu_count() or 1) // CELERY_CHILD_THREADS)))
+)
+# reserve one task at a time and ack after it ran, so a long job never
+# holds others hostage in a busy child's prefetch buffer
+CELERY_PREFETCH_MULTIPLIER = int(os.getenv("CELERY_PREFETCH_MULTIPLIER", "1"))
+CELERY_ACKS_LATE = os.getenv("CELERY_ACKS_LATE", "true") == "true"
+# a job whose worker keeps dying on it (OOM on one image) is failed after this many starts
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+# MODEL REGISTRY (see app/model_registry.py): JSON/YAML model list replacing the
+# built-in MODEL_REGISTRY ("" = built-in), polled for changes every
+# MODEL_REGISTRY_WATCH_SECONDS (0 = read once at startup)
+MODEL_REGISTRY_FILE = os.getenv(
+    "MODEL_REGISTRY_FILE",
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "models", "registry.json")),
+)
+MODEL_REGISTRY_WATCH_SECONDS = float(os.getenv("MODEL_REGISTRY_WATCH_SECONDS", "5"))
+
+# MEMORY WATCHDOG (see app/memory.py): recycle a worker after WORKER_MAX_JOBS jobs
+# or once its RSS passes WORKER_MAX_RSS_MB (0 = off). Celery replaces prefork
+# children; in-process, the dispatcher drains running jobs, drops and reloads
+# the models, then resumes. RSS is sampled every MEMORY_SAMPLE_SECONDS during jobs.
+WORKER_MAX_JOBS = int(os.getenv("WORKER_MAX_JOBS", "500"))
+WORKER_MAX_RSS_MB = int(os.getenv("WORKER_MAX_RSS_MB", "0"))
+MEMORY_SAMPLE_SECONDS = float(os.getenv("MEMORY_SAMPLE_SECONDS", "0.5"))
+
+# METRICS (see app/metrics.py): Celery worker children serve /metrics on
+# METRICS_WORKER_PORT + their pool index (0 = off); the API serves /metrics itself
+METRICS_WORKER_PORT = int(os.getenv("METRICS_WORKER_PORT", "0"))
+
+# PROFILING (see app/profiling.py): "" (off), "trace" or "sample" for every job;
+# admins can also opt single uploads in with the X-Profile header
+PROFILE_JOBS = os.getenv("PROFILE_JOBS", "")
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+
+# ADMIN: comma-separated usernames allowed to use /api/admin endpoints
+ADMIN_USERNAMES = {u.strip() for u in os.getenv("ADMIN_USERNAMES", "").split(",") if u.strip()}
@@ -0,0 +1,30 @@
+# app/consensus.py
+"""
+Majority-vote consensus over per-model results.
+
+Kept free of framework imports so both the inference pipeline and the API
+read path can use it.
+"""
+
+from typing import Any, Dict, Iterable
+
+
+def compute_consensus(results: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    `results` are dicts with label / confidence_real / confidence_fake.
+    Returns {"decision", "score"}; decision is FAKE, REAL or UNCERTAIN.
+    """
+    results = list(results)
+    labels = [r.get("label", "unknown") for r in results]
+    fake_count = labels.count("fake")
+    real_count = labels.count("real")
+    if fake_count > real_count:
+        decision = "FAKE"
+        score = float(sum(r.get("confidence_fake", 0.5) for r in results) / max(1, len(results)))
+    elif real_count > fake_count:
+        decision = "REAL"
+        score = float(sum(r.get("confidence_real", 0.5) for r in results) / max(1, len(results)))
+    else:
+        decision = "UNCERTAIN"
+        score = 0.5
+    return {"decision": decision, "score": score}
@@ -1,6 +1,15 @@
-from sqlalchemy.orm import Session
-from . import models
-from .auth import get_password_hash
+import base64
+import os
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from . import models, profiling, storage
+from .consensus import compute_consensus
+from .auth import get_password_hash, invalidate_cached_user
 
 
 def create_user(username: str, email: str, password: str, db: Session):
@@ -17,8 +26,28 @@ def create_user(username: str, email: str, password: str, db: Session):
     return user
 
 
-def create_job(img_id: str, filename: str, db: Session, user_id: int = None):
-    job = models.Job(image_id=img_id, file_path=filename, user_id=user_id)
+def set_user_active(user_id: int, is_active: bool, db: Session):
+    """Activate/deactivate a user and drop their cached auth entries."""
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if user:
+        user.is_active = is_active
+        db.commit()
+        invalidate_cached_user(user.username)
+    return user
+
+
+def set_user_plan(user_id: int, plan: str, db: Session):
+    """Change a user's plan (see payments.PLAN_TIERS); cached auth entries carry the old one."""
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if user:
+        user.plan = plan
+        db.commit()
+        invalidate_cached_user(user.username)
+    return user
+
+
+def create_job(img_id: str, filename: str, db: Session, user_id: int = None, storage_bytes: int = 0):
+    job = models.Job(image_id=img_id, file_path=filename, user_id=user_id, storage_bytes=storage_bytes)
     db.add(job)
     db.commit()
     db.refresh(job)
@@ -28,14 +57,15 @@ def create_job(img_id: str, filename: str, db: Session, user_id: int = None):
 def get_job(job_id: int, db: Session):
     return (
         db.query(models.Job)
+        .options(selectinload(models.Job.results))
         .filter(models.Job.id == job_id)
         .first()
     )
 
 
 def get_recent_jobs(db: Session, user_id: int = None):
-    """Get recent jobs, optionally filtered by user"""
-    query = db.query(models.Job)
+    """Get recent jobs with their results (one extra query for all results), optionally filtered by user"""
+    query = db.query(models.Job).options(selectinload(models.Job.results))
     if user_id:
         query = query.filter(models.Job.user_id == user_id)
     return (
@@ -46,6 +76,107 @@ def get_recent_jobs(db: Session, user_id: int = None):
     )
 
 
+def encode_cursor(job) -> str:
+    raw = f"{job.created_at.isoformat()}|{job.id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor. Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, job_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(job_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _job_history_stmt(user_id: int, limit: int, cursor: str = None,
+                      status: str = None, verdict: str = None,
+                      created_after: datetime = None, created_before: datetime = None):
+    stmt = (
+        select(models.Job)
+        .options(selectinload(models.Job.results))
+        .where(models.Job.user_id == user_id)
+    )
+    if status:
+        stmt = stmt.where(models.Job.status == status)
+    if verdict:
+        stmt = stmt.where(models.Job.verdict == verdict.upper())
+    if created_after:
+        stmt = stmt.where(models.Job.created_at >= created_after)
+    if created_before:
+        stmt = stmt.where(models.Job.created_at < created_before)
+    if cursor:
+        after_created, after_id = decode_cursor(cursor)
+        stmt = stmt.where(
+            or_(
+                models.Job.created_at < after_created,
+                and_(models.Job.created_at == after_created, models.Job.id < after_id),
+            )
+        )
+    # one extra row tells us whether there is a next page
+    return stmt.order_by(models.Job.created_at.desc(), models.Job.id.desc()).limit(limit + 1)
+
+
+def _history_page(jobs, limit: int):
+    next_cursor = encode_cursor(jobs[limit - 1]) if len(jobs) > limit else None
+    return jobs[:limit], next_cursor
+
+
+def get_job_history(db: Session, user_id: int, limit: int = 20, cursor: str = None, **filters):
+    """
+    Keyset-paginated job history, newest first. Returns (jobs, next_cursor).
+    Each page seeks past (created_at, id) of the previous page's last row via
+    the (user_id, ..., created_at, id) indexes, so deep pages cost the same as
+    the first one. Filters: status, verdict, created_after, created_before.
+    """
+    stmt = _job_history_stmt(user_id, limit, cursor, **filters)
+    return _history_page(db.execute(stmt).scalars().all(), limit)
+
+
+EXPORT_JOB_COLUMNS = ("job_id", "image_id", "user_id", "username", "created_at", "status", "verdict",
+                      "consensus_score", "storage_bytes")
+EXPORT_RESULT_COLUMNS = ("model_name", "version", "label", "confidence_real", "confidence_fake",
+                         "heatmap_ready", "time_ms", "load_ms", "decode_ms", "preprocess_ms",
+                         "inference_ms", "heatmap_ms")
+
+
+def iter_export_rows(db: Session, user_id: int = None, created_after: datetime = None,
+                     created_before: datetime = None, status: str = None, verdict: str = None,
+                     batch_size: int = 1000):
+    """
+    Jobs joined with their model results, oldest first, one row mapping per
+    result (jobs without results give one row with empty result columns).
+    Rows are fetched `batch_size` at a time through a server-side cursor, so
+    memory stays flat however many rows match. user_id=None exports all users.
+    """
+    J, R, U = models.Job, models.ModelResult, models.User
+    stmt = (
+        select(
+            J.id.label("job_id"), J.image_id, J.user_id, U.username, J.created_at, J.status,
+            J.verdict, J.consensus_score, J.storage_bytes,
+            *(getattr(R, c) for c in EXPORT_RESULT_COLUMNS),
+        )
+        .select_from(J)
+        .outerjoin(R, R.job_id == J.id)
+        .outerjoin(U, U.id == J.user_id)
+    )
+    if user_id is not None:
+        stmt = stmt.where(J.user_id == user_id)
+    if created_after:
+        stmt = stmt.where(J.created_at >= created_after)
+    if created_before:
+        stmt = stmt.where(J.created_at < created_before)
+    if status:
+        stmt = stmt.where(J.status == status)
+    if verdict:
+        stmt = stmt.where(J.verdict == verdict.upper())
+    stmt = stmt.order_by(J.created_at, J.id, R.id).execution_options(yield_per=batch_size)
+    for row in db.execute(stmt):
+        yield row._mapping
+
+
 def add_model_result(job_id, model_name, confidence_real,
                      confidence_fake, label, heatmap_path, db: Session):
 
@@ -68,5 +199,302 @@ def update_job_status(job_id, status, db: Session):
     if job:
         job.status = status
         db.commit()
-        db.refresh(job)
+    return job
+
+
+def get_pending_jobs(db: Session, limit: int):
+    """Oldest jobs still waiting to run, with their owner's plan: (id, file_path, user_id, plan)."""
+    return db.execute(
+        select(models.Job.id, models.Job.file_path, models.Job.user_id, models.User.plan)
+        .outerjoin(models.User, models.User.id == models.Job.user_id)
+        .where(models.Job.status == "pending")
+        .order_by(models.Job.created_at, models.Job.id)
+        .limit(limit)
+    ).all()
+
+
+def claim_job(job_id, db: Session, takeover: bool = False, max_attempts: int = 3) -> bool:
+    """
+    Move a job to "processing" before running it; False if someone else has
+    it or it already finished, so duplicate deliveries are no-ops.
+
+    takeover (a redelivered task whose worker died) also claims a job left in
+    "processing"/"partial:*" and drops the results that run saved. A job that
+    has used up max_attempts is marked failed instead.
+    """
+    claimable = models.Job.status == "pending"
+    if takeover:
+        claimable = or_(claimable, models.Job.status == "processing", models.Job.status.like("partial:%"))
+    try:
+        claimed = db.execute(
+            update(models.Job)
+            .where(models.Job.id == job_id, claimable, models.Job.attempts < max_attempts)
+            .values(status="processing", attempts=models.Job.attempts + 1)
+        ).rowcount
+        if not claimed:
+            # out of attempts: give up on it rather than loop
+            db.execute(
+                update(models.Job)
+                .where(models.Job.id == job_id, claimable, models.Job.attempts >= max_attempts)
+                .values(status="failed")
+            )
+            db.commit()
+            return False
+
+        # complete_job counted each heatmap's size on the job; take it back off
+        held = 0
+        stale = db.query(models.ModelResult).filter(models.ModelResult.job_id == job_id).all()
+        for result in stale:
+            blob = storage.parse_blob_path(result.heatmap_path)
+            if blob:
+                if os.path.exists(result.heatmap_path):
+                    held += os.path.getsize(result.heatmap_path)
+                release_blob(blob[0], blob[1], db, commit=False)
+            db.delete(result)
+        if stale:
+            db.execute(
+                update(models.Job)
+                .where(models.Job.id == job_id)
+                .values(verdict=None, consensus_score=None, storage_bytes=models.Job.storage_bytes - held)
+            )
+        db.commit()
+        return True
+    except Exception:
+        db.rollback()
+        raise
+
+
+def complete_job(job_id, results, db: Session, status: str = "completed",
+                 verdict: str = None, consensus_score: float = None):
+    """
+    Persist all model results, their heatmap references and the final job
+    status in a single transaction: one executemany INSERT for the rows, one
+    UPDATE per distinct heatmap blob and one UPDATE for the job.
+
+    `results` are plain dicts of ModelResult columns (model_name,
+    confidence_*, label, heatmap_path, version, timings, ...).
+    """
+    heatmaps = Counter()
+    heatmap_info = {}
+    heatmap_bytes = 0
+    for r in results:
+        blob = storage.parse_blob_path(r.get("heatmap_path"))
+        if blob:
+            kind, sha256, ext = blob
+            size = os.path.getsize(r["heatmap_path"])
+            heatmaps[(kind, sha256)] += 1
+            heatmap_info[(kind, sha256)] = (ext, size)
+            heatmap_bytes += size
+
+    try:
+        if results:
+            db.execute(insert(models.ModelResult), [dict(r, job_id=job_id) for r in results])
+        for (kind, sha256), count in heatmaps.items():
+            ext, size = heatmap_info[(kind, sha256)]
+            acquire_blob(kind, sha256, ext, size, db, commit=False, count=count)
+        db.execute(
+            update(models.Job)
+            .where(models.Job.id == job_id)
+            .values(
+                status=status,
+                verdict=verdict,
+                consensus_score=consensus_score,
+                storage_bytes=models.Job.storage_bytes + heatmap_bytes,
+            )
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+
+def save_partial_result(job_id, row, done: int, total: int, db: Session,
+                        verdict: str = None, consensus_score: float = None):
+    """
+    Persist one model's result as soon as it finishes and move the job to
+    "partial:<done>/<total>" with the consensus of the results so far.
+    """
+    complete_job(
+        job_id, [row], db,
+        status=f"partial:{done}/{total}",
+        verdict=verdict,
+        consensus_score=consensus_score,
+    )
+
+
+def get_completed_job_ids(file_paths, db: Session, user_id: int = None):
+    """file_path -> id of a user's completed job on that stored upload, for the given paths."""
+    if not file_paths:
+        return {}
+    owner = models.Job.user_id.is_(None) if user_id is None else models.Job.user_id == user_id
+    rows = db.execute(
+        select(models.Job.file_path, models.Job.id)
+        .where(models.Job.file_path.in_(list(file_paths)), models.Job.status == "completed", owner)
+        .order_by(models.Job.id)
+    ).all()
+    return {path: job_id for path, job_id in rows}
+
+
+def create_completed_jobs(items, db: Session, user_id: int = None):
+    """
+    Insert finished jobs in one transaction (offline bulk scans). Each item
+    is a dict with image_id, blob (kind, sha256, ext), file_path,
+    storage_bytes, verdict, consensus_score and results (ModelResult
+    column dicts). Returns the new job ids in order.
+    """
+    try:
+        jobs = []
+        for item in items:
+            kind, sha256, ext = item["blob"]
+            acquire_blob(kind, sha256, ext, item["storage_bytes"], db, commit=False)
+            job = models.Job(
+                image_id=item["image_id"],
+                file_path=item["file_path"],
+                user_id=user_id,
+                status="completed",
+                verdict=item["verdict"],
+                consensus_score=item["consensus_score"],
+                storage_bytes=item["storage_bytes"],
+            )
+            db.add(job)
+            jobs.append(job)
+        db.flush()
+        rows = [dict(r, job_id=job.id) for job, item in zip(jobs, items) for r in item["results"]]
+        if rows:
+            db.execute(insert(models.ModelResult), rows)
+        db.commit()
+        return [job.id for job in jobs]
+    except Exception:
+        db.rollback()
+        raise
+
+
+def delete_job(job: models.Job, db: Session) -> None:
+    """
+    Delete a job with its results and drop its references on stored files.
+    Does not commit; files go once retention collects the unreferenced blobs.
+    """
+    blob = storage.parse_blob_path(job.file_path)
+    if blob:
+        release_blob(blob[0], blob[1], db, commit=False)
+    for result in job.results:
+        blob = storage.parse_blob_path(result.heatmap_path)
+        if blob:
+            release_blob(blob[0], blob[1], db, commit=False)
+        db.delete(result)
+    profiling.delete_traces(job.id)
+    db.delete(job)
+
+
+def acquire_blob(kind: str, sha256: str, ext: str, size: int, db: Session,
+                 commit: bool = True, count: int = 1):
+    """Take `count` references on a stored blob, creating its row on first use."""
+    updated = (
+        db.query(models.Blob)
+        .filter(models.Blob.kind == kind, models.Blob.sha256 == sha256)
+        .update({models.Blob.ref_count: models.Blob.ref_count + count}, synchronize_session=False)
+    )
+    if not updated:
+        try:
+            with db.begin_nested():
+                db.add(models.Blob(kind=kind, sha256=sha256, ext=ext, size=size, ref_count=count))
+        except IntegrityError:
+            # another request inserted the same content first
+            db.query(models.Blob).filter(
+                models.Blob.kind == kind, models.Blob.sha256 == sha256
+            ).update({models.Blob.ref_count: models.Blob.ref_count + count}, synchronize_session=False)
+    if commit:
+        db.commit()
+
+
+def release_blob(kind: str, sha256: str, db: Session, commit: bool = True) -> None:
+    """
+    Drop a reference on a blob. The decrement is a single UPDATE so it can't
+    overwrite a concurrent acquire_blob; rows left at zero, and their files,
+    are removed by retention after the transaction has committed.
+    """
+    db.query(models.Blob).filter(
+        models.Blob.kind == kind, models.Blob.sha256 == sha256, models.Blob.ref_count > 0
+    ).update({models.Blob.ref_count: models.Blob.ref_count - 1}, synchronize_session=False)
+    if commit:
+        db.commit()
+
+
+def backfill_consensus(db: Session, batch_size: int = 500) -> int:
+    """
+    Store the consensus on completed jobs finished before it was persisted,
+    so the read path never has to recompute it. Returns the number of jobs updated.
+    """
+    total = 0
+    while True:
+        jobs = (
+            db.query(models.Job)
+            .options(selectinload(models.Job.results))
+            .filter(models.Job.status == "completed", models.Job.verdict.is_(None))
+            .limit(batch_size)
+            .all()
+        )
+        if not jobs:
+            return total
+        for job in jobs:
+            consensus = compute_consensus(
+                {"label": r.label, "confidence_real": r.confidence_real, "confidence_fake": r.confidence_fake}
+                for r in job.results
+            )
+            job.verdict = consensus["decision"]
+            job.consensus_score = consensus["score"]
+        db.commit()
+        total += len(jobs)
+
+
+# -----------------------
+# Async variants for the request path (AsyncSessionLocal)
+# -----------------------
+async def get_job_async(job_id: int, db: AsyncSession):
+    result = await db.execute(
+        select(models.Job)
+        .options(selectinload(models.Job.results))
+        .where(models.Job.id == job_id)
+    )
+    return result.scalars().first()
+
+
+async def get_recent_jobs_async(db: AsyncSession, user_id: int = None):
+    stmt = select(models.Job).options(selectinload(models.Job.results))
+    if user_id:
+        stmt = stmt.where(models.Job.user_id == user_id)
+    result = await db.execute(stmt.order_by(models.Job.created_at.desc()).limit(20))
+    return result.scalars().all()
+
+
+async def get_job_history_async(db: AsyncSession, user_id: int, limit: int = 20, cursor: str = None, **filters):
+    """Async get_job_history."""
+    result = await db.execute(_job_history_stmt(user_id, limit, cursor, **filters))
+    return _history_page(result.scalars().all(), limit)
+
+
+async def create_upload_job_async(img_id: str, filename: str, db: AsyncSession, user_id: int,
+                                  blob, storage_bytes: int):
+    """
+    Take the upload's blob reference and create its job in one transaction.
+    `blob` is (kind, sha256, ext) as returned by storage.parse_blob_path.
+    """
+    kind, sha256, ext = blob
+    bump = (
+        update(models.Blob)
+        .where(models.Blob.kind == kind, models.Blob.sha256 == sha256)
+        .values(ref_count=models.Blob.ref_count + 1)
+    )
+    updated = (await db.execute(bump)).rowcount
+    if not updated:
+        try:
+            async with db.begin_nested():
+                db.add(models.Blob(kind=kind, sha256=sha256, ext=ext, size=storage_bytes, ref_count=1))
+        except IntegrityError:
+            # another request inserted the same content first
+            await db.execute(bump)
+
+    job = models.Job(image_id=img_id, file_path=filename, user_id=user_id, storage_bytes=storage_bytes)
+    db.add(job)
+    await db.commit()
     return job
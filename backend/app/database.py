@@ -1,13 +1,135 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, make_url, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
-from .config import DATABASE_URL
+from sqlalchemy.sql.elements import TextClause
+from .config import (
+    DATABASE_URL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_JOURNAL_MODE,
+    SQLITE_SYNCHRONOUS,
+)
 
-# SQLite needs check_same_thread=False
-if DATABASE_URL.startswith("sqlite"):
-    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-else:
-    engine = create_engine(DATABASE_URL)
+
+# -----------------------
+# Engine profiles
+# -----------------------
+def _apply_sqlite_pragmas(sync_engine, url: str, journal_mode: str, synchronous: str):
+    @event.listens_for(sync_engine, "connect")
+    def _set_sqlite_pragmas(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        if ":memory:" not in url:
+            # WAL lets readers run while a background job is writing
+            cur.execute(f"PRAGMA journal_mode={journal_mode}")
+        cur.execute(f"PRAGMA synchronous={synchronous}")
+        cur.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cur.close()
+
+
+def _sqlite_engine(url: str, journal_mode: str = SQLITE_JOURNAL_MODE, synchronous: str = SQLITE_SYNCHRONOUS):
+    # SQLite needs check_same_thread=False; busy timeout makes writers wait instead of failing
+    eng = create_engine(
+        url,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000.0},
+    )
+    _apply_sqlite_pragmas(eng, url, journal_mode, synchronous)
+    return eng
+
+
+_POOL_OPTIONS = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+)
+
+
+def _server_engine(url: str):
+    return create_engine(url, **_POOL_OPTIONS)
+
+
+def make_engine(url: str = DATABASE_URL, **sqlite_options):
+    """Engine for `url` with the matching profile from app/config.py."""
+    if url.startswith("sqlite"):
+        return _sqlite_engine(url, **sqlite_options)
+    return _server_engine(url)
+
+
+engine = make_engine()
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+# -----------------------
+# Async engine for the FastAPI request path
+# (the Celery worker and background tasks keep using SessionLocal)
+# -----------------------
+def async_database_url(url: str = DATABASE_URL) -> str:
+    """Same database, async driver: aiosqlite for SQLite, asyncpg for Postgres."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    if backend == "postgresql":
+        return parsed.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+    return url
+
+
+def make_async_engine(url: str = DATABASE_URL):
+    async_url = async_database_url(url)
+    if url.startswith("sqlite"):
+        eng = create_async_engine(async_url, connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000.0})
+        _apply_sqlite_pragmas(eng.sync_engine, url, SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS)
+        return eng
+    return create_async_engine(async_url, **_POOL_OPTIONS)
+
+
+async_engine = make_async_engine()
+
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
+
+
+def sync_schema(metadata=None):
+    """
+    create_all() only creates missing tables. This also adds columns and
+    indexes introduced after a table was first created, so existing SQLite and
+    Postgres databases keep working without a migration tool. New columns must
+    be nullable or carry a server_default.
+    """
+    metadata = metadata or Base.metadata
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if not insp.has_table(table.name):
+                continue
+            existing = {c["name"] for c in insp.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=engine.dialect)}"
+                if column.server_default is not None:
+                    arg = column.server_default.arg
+                    ddl += f" DEFAULT {arg.text}" if isinstance(arg, TextClause) else f" DEFAULT '{arg}'"
+                conn.execute(text(ddl))
+                print(f"[database] Added column {table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
+
+def pool_metrics(eng=None):
+    """Connection pool gauges for the given engine (defaults to the app engine)."""
+    eng = eng or engine
+    pool = getattr(eng, "sync_engine", eng).pool
+    stats = {"pool_class": type(pool).__name__, "dialect": eng.dialect.name}
+    for key in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, key, None)
+        if callable(fn):
+            stats[key] = fn()
+    return stats
@@ -0,0 +1,137 @@
+# app/events.py
+"""
+Job progress pub/sub feeding the streaming endpoint (/api/jobs/{id}/events).
+
+Publishers (the analysis task) call publish() from any thread or process;
+subscribers are asyncio queues held by open SSE connections in the API.
+
+Two backends:
+  - memory: publish() hands events straight to local subscribers. Enough
+    when jobs run in the API process (BackgroundTasks).
+  - redis:  publish() goes through a Redis channel per job, and a listener
+    thread in the API forwards messages to local subscribers. Used when
+    Celery workers run the jobs in separate processes.
+"""
+
+import asyncio
+import json
+import threading
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+from .config import EVENTS_BACKEND, REDIS_URL
+
+CHANNEL_PREFIX = "job-events:"
+# per-connection buffer; a client that falls this far behind starts losing events
+SUBSCRIBER_QUEUE_SIZE = 256
+
+_subscribers: Dict[int, Set[Tuple[asyncio.AbstractEventLoop, asyncio.Queue]]] = {}
+_lock = threading.Lock()
+
+_backend = "memory"
+_redis = None
+_listener: Optional[threading.Thread] = None
+
+
+def configure(use_redis: bool) -> None:
+    """Pick the backend; EVENTS_BACKEND=memory|redis overrides the default."""
+    global _backend
+    if EVENTS_BACKEND in ("memory", "redis"):
+        _backend = EVENTS_BACKEND
+    else:
+        _backend = "redis" if use_redis else "memory"
+    print(f"[events] Using {_backend} backend")
+
+
+def _get_redis():
+    global _redis
+    if _redis is None:
+        import redis
+        _redis = redis.Redis.from_url(REDIS_URL)
+    return _redis
+
+
+# -----------------------
+# Publishing
+# -----------------------
+def publish(job_id: int, event_type: str, data: Dict[str, Any]) -> None:
+    """Send an event to everyone watching a job. Never raises."""
+    event = {"type": event_type, "job_id": job_id, "data": data}
+    if _backend == "redis":
+        try:
+            _get_redis().publish(f"{CHANNEL_PREFIX}{job_id}", json.dumps(event, default=str))
+            return
+        except Exception as e:
+            print(f"[events] Redis publish failed, delivering locally only: {e}")
+    _dispatch(job_id, event)
+
+
+def _dispatch(job_id: int, event: Dict[str, Any]) -> None:
+    with _lock:
+        targets = list(_subscribers.get(job_id, ()))
+    for loop, queue in targets:
+        try:
+            loop.call_soon_threadsafe(_offer, queue, event)
+        except RuntimeError:
+            # loop already closed; the subscriber is going away
+            pass
+
+
+def _offer(queue: asyncio.Queue, event: Dict[str, Any]) -> None:
+    try:
+        queue.put_nowait(event)
+    except asyncio.QueueFull:
+        pass
+
+
+# -----------------------
+# Subscribing
+# -----------------------
+def subscribe(job_id: int) -> asyncio.Queue:
+    """Register a queue for a job's events; call from the event loop."""
+    if _backend == "redis":
+        _ensure_listener()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    with _lock:
+        _subscribers.setdefault(job_id, set()).add((asyncio.get_running_loop(), queue))
+    return queue
+
+
+def unsubscribe(job_id: int, queue: asyncio.Queue) -> None:
+    with _lock:
+        subs = _subscribers.get(job_id)
+        if not subs:
+            return
+        subs.difference_update({s for s in subs if s[1] is queue})
+        if not subs:
+            del _subscribers[job_id]
+
+
+def subscriber_count() -> int:
+    with _lock:
+        return sum(len(s) for s in _subscribers.values())
+
+
+def _listen() -> None:
+    while True:
+        try:
+            pubsub = _get_redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.psubscribe(f"{CHANNEL_PREFIX}*")
+            for message in pubsub.listen():
+                try:
+                    event = json.loads(message["data"])
+                    _dispatch(int(event["job_id"]), event)
+                except Exception as e:
+                    print(f"[events] Dropping malformed event: {e}")
+        except Exception as e:
+            print(f"[events] Redis listener error, reconnecting: {e}")
+            time.sleep(1)
+
+
+def _ensure_listener() -> None:
+    global _listener
+    with _lock:
+        if _listener and _listener.is_alive():
+            return
+        _listener = threading.Thread(target=_listen, name="events-redis", daemon=True)
+        _listener.start()
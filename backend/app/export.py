@@ -0,0 +1,109 @@
+# app/export.py
+"""
+Streaming exports of jobs and their model results (/api/export/jobs and
+/api/admin/export/jobs).
+
+Rows come from crud.iter_export_rows through a server-side cursor and are
+written out as they arrive, in ~64 KiB chunks, gzip-compressed on the fly
+when the client accepts it, so memory use doesn't grow with the export.
+
+  ndjson  one line per job, its results nested under "models"
+  csv     one line per model result, job columns repeated
+"""
+
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from . import crud
+from .database import SessionLocal
+
+CHUNK_BYTES = 64 * 1024
+MEDIA_TYPES = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def _plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _csv_lines(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    columns = crud.EXPORT_JOB_COLUMNS + crud.EXPORT_RESULT_COLUMNS
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([_plain(row[c]) for c in columns])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    yield buf.getvalue()
+
+
+def _ndjson_lines(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    # rows arrive ordered by job, so one job is held at a time
+    job: Optional[Dict[str, Any]] = None
+    for row in rows:
+        if job is None or job["job_id"] != row["job_id"]:
+            if job is not None:
+                yield json.dumps(job) + "\n"
+            job = {c: _plain(row[c]) for c in crud.EXPORT_JOB_COLUMNS}
+            job["models"] = []
+        if row["model_name"] is not None:
+            job["models"].append({c: row[c] for c in crud.EXPORT_RESULT_COLUMNS})
+    if job is not None:
+        yield json.dumps(job) + "\n"
+
+
+def _chunks(lines: Iterable[str]) -> Iterator[bytes]:
+    parts, size = [], 0
+    for line in lines:
+        parts.append(line)
+        size += len(line)
+        if size >= CHUNK_BYTES:
+            yield "".join(parts).encode()
+            parts, size = [], 0
+    if parts:
+        yield "".join(parts).encode()
+
+
+def _gzipped(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        out = compressor.compress(chunk)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    for part in (accept_encoding or "").lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        if coding.strip() in ("gzip", "*"):
+            return params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000")
+    return False
+
+
+def stream(fmt: str, gzip: bool = False, **filters) -> Iterator[bytes]:
+    """
+    Export body for crud.iter_export_rows(**filters). A plain generator: the
+    response iterates it in a worker thread, and its own session is closed
+    when the export finishes or the client goes away.
+    """
+    db = SessionLocal()
+    try:
+        rows = crud.iter_export_rows(db, **filters)
+        lines = _csv_lines(rows) if fmt == "csv" else _ndjson_lines(rows)
+        body = _chunks(lines)
+        yield from (_gzipped(body) if gzip else body)
+    except Exception as e:
+        # headers are long gone; all we can do is cut the export short
+        print(f"[export] Export failed mid-stream: {e}")
+        raise
+    finally:
+        db.close()
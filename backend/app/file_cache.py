@@ -0,0 +1,185 @@
+# app/file_cache.py
+"""
+HTTP serving for immutable stored files (uploads, heatmaps and derivatives).
+
+Blobs are content-addressed, so their bytes never change: responses carry a
+strong ETag (the content hash), `Cache-Control: immutable`, answer
+If-None-Match with 304 and support single byte ranges. Small, hot files are
+kept in an in-memory LRU so repeated views skip the disk entirely.
+"""
+
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request
+from fastapi.responses import FileResponse, Response
+
+from .config import FILE_CACHE_MAX_BYTES, FILE_CACHE_MAX_ENTRIES, FILE_CACHE_MAX_ENTRY_BYTES
+
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_SHA_PREFIX_RE = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]+)*$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# path -> (mtime_ns, etag, bytes or None); bytes are None for files above the entry limit
+_LRU: "OrderedDict[str, Tuple[int, str, Optional[bytes]]]" = OrderedDict()
+_LRU_LOCK = threading.Lock()
+_LRU_BYTES = 0
+CACHE_STATS = {"hits": 0, "misses": 0, "not_modified": 0}
+
+
+def _etag_from_name(path: str) -> Optional[str]:
+    """Blob and derivative filenames start with their sha256; no hashing needed."""
+    name = os.path.basename(path)
+    m = _SHA_PREFIX_RE.match(name)
+    if not m:
+        return None
+    variant = name[64:].split(".")
+    # "<sha>.<ext>" -> sha, "<sha>.<variant>.<ext>" -> sha-variant-ext: a
+    # derivative re-encoded in another format (WebP/JPEG) is a different body
+    return m.group(1) if len(variant) <= 2 else "-".join([m.group(1)] + variant[1:])
+
+
+def _cache_get(path: str, mtime_ns: int):
+    with _LRU_LOCK:
+        entry = _LRU.get(path)
+        if entry is None or entry[0] != mtime_ns:
+            CACHE_STATS["misses"] += 1
+            return None
+        _LRU.move_to_end(path)
+        CACHE_STATS["hits"] += 1
+        return entry
+
+
+def _cache_put(path: str, mtime_ns: int, etag: str, data: Optional[bytes]) -> None:
+    global _LRU_BYTES
+    size = len(data) if data is not None else 0
+    with _LRU_LOCK:
+        old = _LRU.pop(path, None)
+        if old is not None and old[2] is not None:
+            _LRU_BYTES -= len(old[2])
+        _LRU[path] = (mtime_ns, etag, data)
+        _LRU_BYTES += size
+        while _LRU and (_LRU_BYTES > FILE_CACHE_MAX_BYTES or len(_LRU) > FILE_CACHE_MAX_ENTRIES):
+            _, (_, _, evicted) = _LRU.popitem(last=False)
+            if evicted is not None:
+                _LRU_BYTES -= len(evicted)
+
+
+def evict(path: str) -> None:
+    """Drop a file from the LRU (e.g. after it was deleted from disk)."""
+    global _LRU_BYTES
+    with _LRU_LOCK:
+        old = _LRU.pop(path, None)
+        if old is not None and old[2] is not None:
+            _LRU_BYTES -= len(old[2])
+
+
+def _load(path: str, stat: os.stat_result) -> Tuple[str, Optional[bytes]]:
+    """Return (etag, bytes-if-cacheable) for a file, using the LRU when possible."""
+    entry = _cache_get(path, stat.st_mtime_ns)
+    if entry is not None:
+        return entry[1], entry[2]
+
+    etag = _etag_from_name(path)
+    data = None
+    if stat.st_size <= FILE_CACHE_MAX_ENTRY_BYTES:
+        with open(path, "rb") as fh:
+            data = fh.read()
+        if etag is None:
+            etag = hashlib.sha256(data).hexdigest()
+    elif etag is None:
+        h = hashlib.sha256()
+        with open(path, "rb") as fh:
+            for chunk in iter(lambda: fh.read(1 << 20), b""):
+                h.update(chunk)
+        etag = h.hexdigest()
+    _cache_put(path, stat.st_mtime_ns, etag, data)
+    return etag, data
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate.strip('"') == etag:
+            return True
+    return False
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=` range into inclusive (start, end). Returns None when
+    the header should be ignored (multi-range, unknown unit) and raises
+    ValueError when it is unsatisfiable.
+    """
+    m = _RANGE_RE.match(header.strip())
+    if not m:
+        return None
+    first, last = m.group(1), m.group(2)
+    if first == "" and last == "":
+        return None
+    if first == "":
+        # suffix range: last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("unsatisfiable range")
+    return start, min(end, size - 1)
+
+
+def serve_file(request: Request, path: str, media_type: Optional[str] = None) -> Response:
+    """Build a cacheable response for an immutable file on disk."""
+    try:
+        stat = os.stat(path)
+        etag, data = _load(path, stat)
+    except FileNotFoundError:
+        # deleted since it was resolved (e.g. by retention)
+        evict(path)
+        raise HTTPException(status_code=404, detail="File not found")
+    media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        CACHE_STATS["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip('"') == etag):
+        try:
+            byte_range = _parse_range(range_header, stat.st_size)
+        except ValueError:
+            headers["Content-Range"] = f"bytes */{stat.st_size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is not None:
+            start, end = byte_range
+            if data is not None:
+                chunk = data[start:end + 1]
+            else:
+                with open(path, "rb") as fh:
+                    fh.seek(start)
+                    chunk = fh.read(end - start + 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+            return Response(content=chunk, status_code=206, media_type=media_type, headers=headers)
+
+    if data is not None:
+        return Response(content=data, media_type=media_type, headers=headers)
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
@@ -1,47 +1,71 @@
 # app/main.py
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 from fastapi import (
     FastAPI,
     UploadFile,
     File,
     Depends,
-    BackgroundTasks,
+    Header,
     HTTPException,
+    Query,
+    Request,
 )
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import timedelta
+from datetime import datetime, timedelta
+from typing import Optional
+import asyncio
+import json
 import os
+import sys
+import threading
 import uuid
 from dotenv import load_dotenv
 
 load_dotenv()
 
-from .database import engine
+from .database import AsyncSessionLocal, SessionLocal, engine, pool_metrics, sync_schema
 from .models import Base, User
-from . import crud
-from .dependencies import get_db
-from .tasks import run_analysis, run_analysis_sync, celery
+from . import admission, crud, events, export, file_cache, memory, metrics, model_registry, profiling, storage
+from .file_cache import serve_file
+from .metrics import HTTP_REQUEST_SECONDS, UPLOAD_STORE_SECONDS
+from .config import API_BASE_URL, APP_ROLE, RETENTION_ENABLED
+from .dependencies import get_async_db, get_db
 
 # ---- LOCAL JWT AUTH (the good one) ----
 from .auth import (
     authenticate_user,
     create_access_token,
     get_current_active_user,
+    get_current_admin_user,
+    is_admin,
+    USER_CACHE_STATS,
     get_user_by_username,
     get_user_by_email,
     ACCESS_TOKEN_EXPIRE_MINUTES,
 )
 from .schemas_auth import UserCreate, UserResponse, Token, LoginRequest
 
+from .retention import TOTALS as retention_totals, start_retention_thread, stop_retention_thread
 from .support import router as support_router
-from .payments import router as payments_router
+from .payments import plan_tier, router as payments_router
 
 
 # -------------------------------------
 # INIT
 # -------------------------------------
+STARTUP_REPORT = {"role": APP_ROLE, "import_ms": round((time.perf_counter() - _IMPORT_STARTED) * 1000.0, 2)}
+
+_t0 = time.perf_counter()
 Base.metadata.create_all(bind=engine)
+sync_schema()
+STARTUP_REPORT["schema_ms"] = round((time.perf_counter() - _t0) * 1000.0, 2)
 app = FastAPI(title="DeepVerify API")
 
 
@@ -57,16 +81,95 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    t0 = time.perf_counter()
+    response = await call_next(request)
+    # route template, not the raw path, so job ids don't explode the label set
+    route = request.scope.get("route")
+    HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - t0,
+        method=request.method,
+        route=getattr(route, "path", "unmatched"),
+        status=response.status_code,
+    )
+    return response
+
+
 # -------------------------------------
-# FILE SETUP
+# METRICS (scrape-time gauges/counters from the modules that own them)
 # -------------------------------------
-backend_dir = os.path.dirname(os.path.dirname(__file__))
+def _runtime_metrics():
+    for key, value in file_cache.CACHE_STATS.items():
+        yield "deepverify_file_cache_total", "counter", "Stored-file LRU lookups", {"result": key}, value
+    for key, value in USER_CACHE_STATS.items():
+        yield "deepverify_user_cache_total", "counter", "Authenticated-user cache lookups", {"result": key}, value
+    queue = admission.queue_metrics()
+    for key in ("queued", "running", "users_waiting"):
+        yield f"deepverify_queue_{key}", "gauge", f"Analysis queue: {key.replace('_', ' ')}", {}, queue[key]
+    for key in ("rejected_rate_limited", "rejected_user_queue_full", "rejected_queue_full"):
+        yield "deepverify_admission_rejected_total", "counter", "Uploads rejected with 429", {"reason": key[9:]}, queue[key]
+    yield "deepverify_admission_admitted_total", "counter", "Uploads admitted", {}, queue["admitted"]
+    for key in ("reclaimed_bytes", "orphans_deleted", "jobs_deleted", "passes"):
+        yield f"deepverify_retention_{key}_total", "counter", f"Retention: {key.replace('_', ' ')}", {}, retention_totals[key]
+    pool = pool_metrics()
+    for key in ("size", "checkedin", "checkedout", "overflow"):
+        if key in pool:
+            yield f"deepverify_db_pool_{key}", "gauge", f"DB pool: {key}", {"pool": pool["pool_class"]}, pool[key]
+    yield "deepverify_event_subscribers", "gauge", "Open job progress streams", {}, events.subscriber_count()
+    yield "deepverify_process_rss_bytes", "gauge", "Resident memory of this process", {}, memory.rss_bytes()
+    yield "deepverify_worker_recycles_total", "counter", "In-process model recycles", {}, memory.STATS["recycles"]
+    yield "deepverify_worker_jobs_since_recycle", "gauge", "In-process jobs since the last recycle", {}, memory.STATS["jobs_since_recycle"]
+
+
+metrics.register_collector(_runtime_metrics)
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def _backfill_consensus():
+    # jobs completed before verdicts were stored; off the import path and
+    # off the startup path, a no-op once they are all filled in
+    try:
+        with SessionLocal() as db:
+            updated = crud.backfill_consensus(db)
+        if updated:
+            print(f"[main] Stored the consensus of {updated} older jobs")
+    except Exception as e:
+        print(f"[main] Consensus backfill failed: {e}")
+
+
+@app.on_event("startup")
+def start_background_services():
+    # models run in this process unless jobs go to Celery workers, so only then
+    # is a changed model loaded and warmed before it is swapped in
+    model_registry.load()
+    model_registry.start_watcher(warm_up=APP_ROLE == "inprocess")
+    admission.start_dispatcher()
+    threading.Thread(target=_backfill_consensus, name="backfill-consensus", daemon=True).start()
+    if RETENTION_ENABLED:
+        start_retention_thread()
+
+    STARTUP_REPORT["ready_ms"] = round((time.perf_counter() - _IMPORT_STARTED) * 1000.0, 2)
+    # heavy modules that ended up imported anyway (should be none for role=api)
+    STARTUP_REPORT["heavy_modules"] = [
+        m for m in ("torch", "tensorflow", "matplotlib", "celery") if m in sys.modules
+    ]
+    print(
+        f"[main] Ready in {STARTUP_REPORT['ready_ms']}ms (role={APP_ROLE}, "
+        f"imports {STARTUP_REPORT['import_ms']}ms, schema {STARTUP_REPORT['schema_ms']}ms, "
+        f"heavy modules: {', '.join(STARTUP_REPORT['heavy_modules']) or 'none'})"
+    )
 
-UPLOAD_DIR = os.path.abspath(os.path.join(backend_dir, "..", "data", "uploads"))
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-HEATMAP_DIR = os.path.abspath(os.path.join(backend_dir, "..", "data", "heatmaps"))
-os.makedirs(HEATMAP_DIR, exist_ok=True)
+@app.on_event("shutdown")
+def stop_background_services():
+    admission.stop_dispatcher()
+    model_registry.stop_watcher()
+    stop_retention_thread()
 
 
 @app.get("/")
@@ -74,6 +177,31 @@ def root():
     return {"message": "DeepVerify backend running"}
 
 
+@app.get("/api/health/db")
+def db_health():
+    return pool_metrics()
+
+
+@app.get("/api/health/startup")
+def startup_health():
+    return STARTUP_REPORT
+
+
+@app.get("/api/health/queue")
+def queue_health():
+    return admission.queue_metrics()
+
+
+@app.get("/api/health/models")
+def models_health():
+    return model_registry.status()
+
+
+@app.get("/api/health/memory")
+def memory_health():
+    return memory.status()
+
+
 # =================================================================
 # AUTHENTICATION — LOCAL FASTAPI JWT SYSTEM (CORRECT + CLEAN)
 # =================================================================
@@ -122,7 +250,7 @@ def login(login_data: LoginRequest, db: Session = Depends(get_db)):
 
 
 @app.get("/api/auth/me", response_model=UserResponse)
-def get_me(current_user: User = Depends(get_current_active_user)):
+async def get_me(current_user: User = Depends(get_current_active_user)):
     return current_user
 
 
@@ -130,44 +258,89 @@ def get_me(current_user: User = Depends(get_current_active_user)):
 # UPLOAD — MUST BE LOGGED IN
 # =================================================================
 
+def _store_upload(content: bytes, ext: str):
+    """
+    Store an upload and its derivatives; raises storage.InvalidImage for
+    non-images. Returns (sha256, ext, path, created) where `created` says this
+    call wrote the blob.
+    """
+    storage.check_image(content)
+    with UPLOAD_STORE_SECONDS.time():
+        ext = storage.sniff_ext(content, ext)
+        sha256 = storage.hash_bytes(content)
+        existed = os.path.exists(storage.blob_path("uploads", sha256, ext))
+        sha256, ext, save_path = storage.put_bytes("uploads", content, ext, sha256=sha256)
+        # thumbnails/previews are made once here so views never ship the original
+        try:
+            storage.make_derivatives("uploads", sha256, save_path)
+        except Exception as e:
+            # the blob has no row yet; don't leave it behind for the orphan scan
+            if not existed:
+                storage.delete_blob("uploads", sha256, ext)
+            raise storage.InvalidImage(f"could not decode image ({e.__class__.__name__})") from e
+    return sha256, ext, save_path, not existed
+
+
 @app.post("/api/upload")
 @app.post("/upload")
 async def upload_image(
     file: UploadFile = File(...),
-    background_tasks: BackgroundTasks = BackgroundTasks(),
+    x_profile: Optional[str] = Header(None),
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
+    # rate limit and queue bounds are checked before anything is read or stored
+    tier = plan_tier(current_user.plan)
+    try:
+        admission.admit(current_user.id, tier)
+    except admission.AdmissionRejected as e:
+        raise HTTPException(
+            status_code=429,
+            detail=e.reason,
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    stored = None
     try:
         filename = file.filename or "upload"
-        ext = os.path.splitext(filename)[1] or ".jpg"
+        ext = os.path.splitext(filename)[1].lower() or ".jpg"
 
         image_id = uuid.uuid4().hex
-        save_path = os.path.join(UPLOAD_DIR, f"{image_id}{ext}")
 
+        # identical images share one file on disk; the blob row counts its users
         content = await file.read()
-        with open(save_path, "wb") as f:
-            f.write(content)
-
-        job = crud.create_job(
+        try:
+            sha256, ext, save_path, created = await run_in_threadpool(_store_upload, content, ext)
+        except storage.InvalidImage as e:
+            admission.refund(current_user.id)
+            raise HTTPException(status_code=400, detail=f"Invalid image: {e}")
+        stored = (sha256, ext, created)
+
+        job = await crud.create_upload_job_async(
             img_id=image_id,
             filename=save_path,
             db=db,
             user_id=current_user.id,
+            blob=("uploads", sha256, ext),
+            storage_bytes=len(content),
         )
+        stored = None
+
+        # admins can capture a trace of this job with "X-Profile: trace|sample"
+        profile = x_profile if x_profile and is_admin(current_user) else None
 
-        # Prefer Celery if available
-        if celery:
-            try:
-                run_analysis.delay(job.id, save_path)
-            except Exception:
-                background_tasks.add_task(run_analysis_sync, job.id, save_path)
-        else:
-            background_tasks.add_task(run_analysis_sync, job.id, save_path)
+        # the admission dispatcher hands it to Celery or an in-process worker
+        admission.enqueue(job.id, save_path, current_user.id, tier, profile)
 
         return {"jobId": job.id}
 
+    except HTTPException:
+        raise
     except Exception as e:
+        # the job never got queued: give the token back and drop a blob no row refers to
+        admission.refund(current_user.id)
+        if stored and stored[2]:
+            await run_in_threadpool(storage.delete_blob, "uploads", stored[0], stored[1])
         raise HTTPException(status_code=500, detail=f"Upload error: {str(e)}")
 
 
@@ -175,32 +348,67 @@ async def upload_image(
 # JOB TRANSFORM
 # =================================================================
 
-def transform_job_for_frontend(job):
-    consensus = None
-
-    if job.results:
-        labels = [r.label for r in job.results]
-        fake_count = labels.count("fake")
-        real_count = labels.count("real")
-
-        if fake_count > real_count:
-            decision = "FAKE"
-            avg_conf = sum(r.confidence_fake for r in job.results) / len(job.results)
-        elif real_count > fake_count:
-            decision = "REAL"
-            avg_conf = sum(r.confidence_real for r in job.results) / len(job.results)
-        else:
-            decision = "UNCERTAIN"
-            avg_conf = 0.5
+def _file_url(kind, path, variant=None):
+    fname = os.path.basename(path)
+    if variant:
+        return f"{API_BASE_URL}/api/{kind}/{fname}/{variant}"
+    return f"{API_BASE_URL}/api/{kind}/{fname}"
+
+
+def _has_file(path):
+    return bool(path) and path != "N/A"
+
+
+def _heatmap_ready(result):
+    # rows written before heatmap_ready existed only have the path to go on
+    if result.heatmap_ready is None:
+        return _has_file(result.heatmap_path)
+    return result.heatmap_ready
+
+
+def _model_for_frontend(
+    model_name, version, label, confidence_real, confidence_fake,
+    heatmap_path, time_ms, timings, image_url,
+):
+    score = confidence_fake if label == "fake" else confidence_real
+
+    # URLs come from the persisted paths alone; no filesystem checks on read
+    heatmap_url = heatmap_full_url = None
+    if _has_file(heatmap_path):
+        heatmap_url = _file_url("heatmaps", heatmap_path, "preview")
+        heatmap_full_url = _file_url("heatmaps", heatmap_path)
+
+    return {
+        "model_name": model_name,
+        "version": version or "1.0",
+        "score": score,
+        "heatmap_url": heatmap_url,
+        "heatmap_full_url": heatmap_full_url,
+        "image_url": image_url,
+        "run_time_ms": time_ms,
+        "timings": timings,
+        "labels": {
+            "confidence_real": confidence_real,
+            "confidence_fake": confidence_fake,
+            "label": label,
+        },
+    }
+
 
+def transform_job_for_frontend(job):
+    """Serialize a job row (results eagerly loaded); consensus is read as stored."""
+    if job.verdict:
         consensus = {
-            "decision": decision,
-            "score": avg_conf,
+            "decision": job.verdict,
+            "score": job.consensus_score if job.consensus_score is not None else 0.5,
             "explanation": [
                 f"{len(job.results)} model(s) analyzed",
-                f"Majority vote: {decision.lower()}",
+                f"Majority vote: {job.verdict.lower()}",
             ],
         }
+        if job.status and job.status.startswith("partial:"):
+            done_total = job.status.split(":", 1)[1]
+            consensus["explanation"].append(f"Partial result ({done_total} models), more models still running")
     else:
         consensus = {
             "decision": "PENDING",
@@ -208,44 +416,36 @@ def transform_job_for_frontend(job):
             "explanation": ["Analysis in progress..."],
         }
 
-    models = []
-    if job.results:
-        for result in job.results:
-            score = (
-                result.confidence_fake
-                if result.label == "fake"
-                else result.confidence_real
-            )
-
-            heatmap_url = None
-            if result.heatmap_path and os.path.exists(result.heatmap_path):
-                fname = os.path.basename(result.heatmap_path)
-                heatmap_url = f"http://localhost:8000/api/heatmaps/{fname}"
-
-            img_url = None
-            if job.file_path and os.path.exists(job.file_path):
-                fname = os.path.basename(job.file_path)
-                img_url = f"http://localhost:8000/api/uploads/{fname}"
-
-            models.append(
-                {
-                    "model_name": result.model_name,
-                    "version": "1.0",
-                    "score": score,
-                    "heatmap_url": heatmap_url,
-                    "image_url": img_url,
-                    "labels": {
-                        "confidence_real": result.confidence_real,
-                        "confidence_fake": result.confidence_fake,
-                        "label": result.label,
-                    },
-                }
-            )
+    image_url = _file_url("uploads", job.file_path, "preview") if _has_file(job.file_path) else None
+
+    models = [
+        _model_for_frontend(
+            model_name=result.model_name,
+            version=result.version,
+            label=result.label,
+            confidence_real=result.confidence_real,
+            confidence_fake=result.confidence_fake,
+            heatmap_path=result.heatmap_path if _heatmap_ready(result) else None,
+            time_ms=result.time_ms,
+            timings={
+                "load_ms": result.load_ms,
+                "decode_ms": result.decode_ms,
+                "preprocess_ms": result.preprocess_ms,
+                "inference_ms": result.inference_ms,
+                "heatmap_ms": result.heatmap_ms,
+            },
+            image_url=image_url,
+        )
+        for result in job.results
+    ]
 
     image = None
-    if job.file_path and os.path.exists(job.file_path):
-        fname = os.path.basename(job.file_path)
-        image = {"thumbnail_url": f"http://localhost:8000/api/uploads/{fname}"}
+    if _has_file(job.file_path):
+        image = {
+            "thumbnail_url": _file_url("uploads", job.file_path, "thumb"),
+            "preview_url": _file_url("uploads", job.file_path, "preview"),
+            "original_url": _file_url("uploads", job.file_path),
+        }
 
     return {
         "job_id": job.id,
@@ -260,27 +460,178 @@ def transform_job_for_frontend(job):
     }
 
 
+# =================================================================
+# JOB HISTORY (AUTH REQUIRED, KEYSET PAGINATED)
+# =================================================================
+
+@app.get("/api/jobs")
+async def list_jobs(
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    verdict: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        jobs, next_cursor = await crud.get_job_history_async(
+            db,
+            user_id=current_user.id,
+            limit=limit,
+            cursor=cursor,
+            status=status,
+            verdict=verdict,
+            created_after=created_after,
+            created_before=created_before,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {
+        "items": [transform_job_for_frontend(job) for job in jobs],
+        "next_cursor": next_cursor,
+    }
+
+
+# =================================================================
+# EXPORTS (STREAMED CSV / NDJSON, see app/export.py)
+# =================================================================
+
+def _export_response(request: Request, format: str, **filters):
+    if format not in export.MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="format must be csv or ndjson")
+    use_gzip = export.accepts_gzip(request.headers.get("accept-encoding"))
+    headers = {
+        "Content-Disposition": f'attachment; filename="jobs-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"',
+        "Vary": "Accept-Encoding",
+    }
+    if use_gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export.stream(format, gzip=use_gzip, **filters),
+        media_type=export.MEDIA_TYPES[format],
+        headers=headers,
+    )
+
+
+@app.get("/api/export/jobs")
+def export_jobs(
+    request: Request,
+    format: str = "ndjson",
+    status: Optional[str] = None,
+    verdict: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    current_user: User = Depends(get_current_active_user),
+):
+    """All of the caller's jobs with their model results, oldest first."""
+    return _export_response(
+        request, format, user_id=current_user.id, status=status, verdict=verdict,
+        created_after=created_after, created_before=created_before,
+    )
+
+
 # =================================================================
 # GET JOB
 # =================================================================
 
 @app.get("/api/jobs/{job_id}")
 @app.get("/jobs/{job_id}")
-def get_job(job_id: int, db: Session = Depends(get_db)):
-    job = crud.get_job(job_id, db)
+async def get_job(job_id: int, db: AsyncSession = Depends(get_async_db)):
+    job = await crud.get_job_async(job_id, db)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     return transform_job_for_frontend(job)
 
 
+# =================================================================
+# JOB PROGRESS STREAM (SERVER-SENT EVENTS)
+# =================================================================
+
+TERMINAL_STATUSES = ("completed", "failed")
+SSE_KEEPALIVE_SECONDS = 15
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def _model_event_for_frontend(m, image_url):
+    """Same shape as a transform_job_for_frontend model, from a runner result dict."""
+    return _model_for_frontend(
+        model_name=m.get("name") or m.get("model_name") or "unknown",
+        version=m.get("version"),
+        label=m.get("label"),
+        confidence_real=m.get("confidence_real"),
+        confidence_fake=m.get("confidence_fake"),
+        heatmap_path=m.get("heatmap_path") if m.get("heatmap_ready") else None,
+        time_ms=m.get("time_ms"),
+        timings=m.get("timings") or {},
+        image_url=image_url,
+    )
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: int, request: Request):
+    """
+    Stream a job's progress: a `job` snapshot first, then `status` and `model`
+    events as they happen, and a final `job` snapshot once it finishes.
+    """
+    # subscribe before reading the snapshot so no event falls in between
+    queue = events.subscribe(job_id)
+    # a dependency session would only be closed when the stream ends, holding
+    # a pooled connection per open tab; this one is returned right away
+    async with AsyncSessionLocal() as db:
+        job = await crud.get_job_async(job_id, db)
+        snapshot = transform_job_for_frontend(job) if job else None
+    if not snapshot:
+        events.unsubscribe(job_id, queue)
+        raise HTTPException(status_code=404, detail="Job not found")
+    image_url = snapshot["image"]["preview_url"] if snapshot["image"] else None
+
+    async def stream():
+        try:
+            yield _sse("job", snapshot)
+            if snapshot["status"] in TERMINAL_STATUSES:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), SSE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+
+                if event["type"] == "model":
+                    yield _sse("model", _model_event_for_frontend(event["data"], image_url))
+                elif event["type"] == "status":
+                    yield _sse("status", event["data"])
+                    if event["data"].get("status") in TERMINAL_STATUSES:
+                        async with AsyncSessionLocal() as session:
+                            final = await crud.get_job_async(job_id, session)
+                        if final:
+                            yield _sse("job", transform_job_for_frontend(final))
+                        return
+        finally:
+            events.unsubscribe(job_id, queue)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 # =================================================================
 # DASHBOARD (AUTH REQUIRED)
 # =================================================================
 
 @app.get("/api/dashboard")
 @app.get("/dashboard")
-def dashboard(current_user: User = Depends(get_current_active_user), db: Session = Depends(get_db)):
-    jobs = crud.get_recent_jobs(db, user_id=current_user.id)
+async def dashboard(current_user: User = Depends(get_current_active_user), db: AsyncSession = Depends(get_async_db)):
+    jobs = await crud.get_recent_jobs_async(db, user_id=current_user.id)
     return [transform_job_for_frontend(job) for job in jobs]
 
 
@@ -289,19 +640,95 @@ def dashboard(current_user: User = Depends(get_current_active_user), db: Session
 # =================================================================
 
 @app.get("/api/uploads/{filename}")
-def get_uploaded_file(filename: str):
-    file_path = os.path.join(UPLOAD_DIR, filename)
-    if not os.path.exists(file_path):
+def get_uploaded_file(filename: str, request: Request):
+    file_path = storage.resolve("uploads", filename)
+    if not file_path:
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path)
+    return serve_file(request, file_path)
 
 
 @app.get("/api/heatmaps/{filename}")
-def get_heatmap_file(filename: str):
-    file_path = os.path.join(HEATMAP_DIR, filename)
-    if not os.path.exists(file_path):
+def get_heatmap_file(filename: str, request: Request):
+    file_path = storage.resolve("heatmaps", filename)
+    if not file_path:
         raise HTTPException(status_code=404, detail="Heatmap not found")
-    return FileResponse(file_path)
+    return serve_file(request, file_path)
+
+
+@app.get("/api/uploads/{filename}/{variant}")
+def get_uploaded_file_derivative(filename: str, variant: str, request: Request):
+    file_path = storage.resolve_derivative("uploads", filename, variant)
+    if not file_path:
+        raise HTTPException(status_code=404, detail="File not found")
+    return serve_file(request, file_path)
+
+
+@app.get("/api/heatmaps/{filename}/{variant}")
+def get_heatmap_file_derivative(filename: str, variant: str, request: Request):
+    file_path = storage.resolve_derivative("heatmaps", filename, variant)
+    if not file_path:
+        raise HTTPException(status_code=404, detail="Heatmap not found")
+    return serve_file(request, file_path)
+
+
+# =================================================================
+# ADMIN: JOB TRACES (see app/profiling.py)
+# =================================================================
+
+@app.get("/api/admin/traces")
+def list_job_traces(admin: User = Depends(get_current_admin_user)):
+    return profiling.list_traces()
+
+
+@app.get("/api/admin/jobs/{job_id}/trace")
+def download_job_trace(job_id: int, admin: User = Depends(get_current_admin_user)):
+    path = profiling.trace_path(job_id)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="No trace for this job")
+    return FileResponse(path, media_type="application/json", filename=os.path.basename(path))
+
+
+@app.get("/api/admin/jobs/{job_id}/profile")
+def download_job_profile(job_id: int, admin: User = Depends(get_current_admin_user)):
+    path = profiling.profile_path(job_id)
+    if not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="No sampling profile for this job")
+    return FileResponse(path, media_type="text/plain", filename=os.path.basename(path))
+
+
+@app.get("/api/admin/export/jobs")
+def admin_export_jobs(
+    request: Request,
+    format: str = "ndjson",
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    user_id: Optional[int] = None,
+    status: Optional[str] = None,
+    verdict: Optional[str] = None,
+    admin: User = Depends(get_current_admin_user),
+):
+    """Jobs of every user (or one, with user_id) created in a time range."""
+    return _export_response(
+        request, format, user_id=user_id, status=status, verdict=verdict,
+        created_after=created_after, created_before=created_before,
+    )
+
+
+@app.post("/api/admin/users/{user_id}/deactivate", response_model=UserResponse)
+def deactivate_user(user_id: int, admin: User = Depends(get_current_admin_user), db: Session = Depends(get_db)):
+    """Lock a user out; their cached tokens stop working at once in this process."""
+    user = crud.set_user_active(user_id, False, db)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+@app.post("/api/admin/users/{user_id}/activate", response_model=UserResponse)
+def activate_user(user_id: int, admin: User = Depends(get_current_admin_user), db: Session = Depends(get_db)):
+    user = crud.set_user_active(user_id, True, db)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 
 
 app.include_router(support_router)
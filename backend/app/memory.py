@@ -0,0 +1,221 @@
+# app/memory.py
+"""
+Memory watchdog for processes that run analysis jobs.
+
+While jobs run, a sampler thread reads this process's RSS every
+MEMORY_SAMPLE_SECONDS and keeps each job's peak, which is logged and
+observed in deepverify_job_peak_rss_bytes when the job finishes (with
+several jobs in flight, each sees the peak of the whole process).
+
+Recycling bounds what long-lived workers accumulate (Keras retracing,
+occlusion-loop allocations, fragmentation):
+
+  - Celery prefork: children are replaced after WORKER_MAX_JOBS tasks or
+    past WORKER_MAX_RSS_MB (worker_max_tasks_per_child /
+    worker_max_memory_per_child, see tasks.py); the new child starts from
+    the parent's preloaded models.
+  - in-process: the admission dispatcher stops dispatching once
+    recycle_reason() says so, waits for running jobs to finish, then calls
+    recycle(): models and framework state are dropped, freed memory is
+    handed back to the OS and the models are loaded and warmed again
+    before the next job is dispatched.
+"""
+
+import ctypes
+import os
+import resource
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+from .config import MEMORY_SAMPLE_SECONDS, WORKER_MAX_JOBS, WORKER_MAX_RSS_MB
+from .metrics import JOB_PEAK_RSS_BYTES
+
+MB = 1024 * 1024
+
+_lock = threading.Lock()
+# job_id -> {"start": rss, "peak": rss}
+_active: Dict[int, Dict[str, int]] = {}
+_wake = threading.Event()
+_sampler: Optional[threading.Thread] = None
+
+_recent_jobs = deque(maxlen=100)
+
+# after a failed recycle, or one that didn't bring RSS under the limit,
+# recycling is held off for a while (doubling up to the max)
+BACKOFF_SECONDS = 30.0
+BACKOFF_MAX_SECONDS = 900.0
+_backoff = {"until": 0.0, "seconds": 0.0}
+
+STATS: Dict[str, Any] = {
+    "state": "ok",  # ok | draining | recycling
+    "jobs_since_recycle": 0,
+    "recycles": 0,
+    "last_recycle": None,
+    "last_error": None,
+}
+
+try:
+    _PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (ValueError, OSError, AttributeError):
+    _PAGE_SIZE = 4096
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # bytes on macOS, kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _mb(n: int) -> float:
+    return round(n / MB, 1)
+
+
+# -----------------------
+# Per-job peaks
+# -----------------------
+def _sample_loop() -> None:
+    while True:
+        _wake.wait()
+        rss = rss_bytes()
+        with _lock:
+            if not _active:
+                _wake.clear()
+                continue
+            for job in _active.values():
+                job["peak"] = max(job["peak"], rss)
+        time.sleep(MEMORY_SAMPLE_SECONDS)
+
+
+def job_started(job_id: int) -> None:
+    global _sampler
+    rss = rss_bytes()
+    with _lock:
+        _active[job_id] = {"start": rss, "peak": rss}
+        if _sampler is None or not _sampler.is_alive():
+            _sampler = threading.Thread(target=_sample_loop, name="memory-sampler", daemon=True)
+            _sampler.start()
+    _wake.set()
+
+
+def job_finished(job_id: int) -> Optional[Dict[str, float]]:
+    """Stop tracking a job; returns (and logs) its peak RSS in MB."""
+    rss = rss_bytes()
+    with _lock:
+        job = _active.pop(job_id, None)
+        STATS["jobs_since_recycle"] += 1
+    if job is None:
+        return None
+    peak = max(job["peak"], rss)
+    JOB_PEAK_RSS_BYTES.observe(peak)
+    report = {
+        "job_id": job_id,
+        "peak_rss_mb": _mb(peak),
+        "growth_mb": _mb(peak - job["start"]),
+        "end_rss_mb": _mb(rss),
+    }
+    _recent_jobs.append(report)
+    print(
+        f"[memory] job_id={job_id} peak RSS {report['peak_rss_mb']}MB "
+        f"(+{report['growth_mb']}MB during the job, {report['end_rss_mb']}MB after)"
+    )
+    return report
+
+
+# -----------------------
+# Recycling (in-process execution)
+# -----------------------
+def recycle_reason() -> Optional[str]:
+    """Why this process should be recycled before taking more jobs, if it should."""
+    # a freshly recycled process is as small as it gets; recycling it again won't help
+    if not STATS["jobs_since_recycle"] or time.monotonic() < _backoff["until"]:
+        return None
+    if WORKER_MAX_JOBS and STATS["jobs_since_recycle"] >= WORKER_MAX_JOBS:
+        return f"{STATS['jobs_since_recycle']} jobs since last recycle"
+    if WORKER_MAX_RSS_MB:
+        rss = rss_bytes()
+        if rss >= WORKER_MAX_RSS_MB * MB:
+            return f"RSS {_mb(rss)}MB over {WORKER_MAX_RSS_MB}MB"
+    return None
+
+
+def _release_to_os() -> None:
+    # glibc keeps freed arenas mapped; hand them back so RSS actually drops
+    try:
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+def _back_off(why: str) -> None:
+    _backoff["seconds"] = min(BACKOFF_MAX_SECONDS, (_backoff["seconds"] * 2) or BACKOFF_SECONDS)
+    _backoff["until"] = time.monotonic() + _backoff["seconds"]
+    print(f"[memory] {why}; not recycling again for {_backoff['seconds']:.0f}s")
+
+
+def recycle(reason: str, warm_up: bool = True) -> Dict[str, Any]:
+    """
+    Drop models and framework state, then load and warm the models again.
+    The caller makes sure no job is running.
+    """
+    from .models_interface import preload_models, reset_model_state
+
+    STATS["state"] = "recycling"
+    t0 = time.time()
+    before = rss_bytes()
+    print(f"[memory] Recycling in-process worker: {reason}")
+    try:
+        reset_model_state()
+        _release_to_os()
+        trimmed = rss_bytes()
+        preload_models(warm_up=warm_up)
+    except Exception as e:
+        STATS["jobs_since_recycle"] = 0
+        STATS["last_error"] = str(e)
+        _back_off(f"Recycling failed: {e}")
+        raise
+    finally:
+        STATS["state"] = "ok"
+    report = {
+        "reason": reason,
+        "at": time.time(),
+        "seconds": round(time.time() - t0, 2),
+        "rss_before_mb": _mb(before),
+        "rss_trimmed_mb": _mb(trimmed),
+        "rss_after_mb": _mb(rss_bytes()),
+    }
+    STATS["jobs_since_recycle"] = 0
+    STATS["recycles"] += 1
+    STATS["last_recycle"] = report
+    STATS["last_error"] = None
+    print(
+        f"[memory] Recycled in {report['seconds']}s: RSS {report['rss_before_mb']}MB -> "
+        f"{report['rss_trimmed_mb']}MB (models dropped) -> {report['rss_after_mb']}MB (reloaded)"
+    )
+    if WORKER_MAX_RSS_MB and report["rss_after_mb"] >= WORKER_MAX_RSS_MB:
+        _back_off(
+            f"RSS with models reloaded is {report['rss_after_mb']}MB, over "
+            f"WORKER_MAX_RSS_MB={WORKER_MAX_RSS_MB}; raise the limit"
+        )
+    else:
+        _backoff.update(until=0.0, seconds=0.0)
+    return report
+
+
+def status() -> Dict[str, Any]:
+    return {
+        **STATS,
+        "rss_mb": _mb(rss_bytes()),
+        "max_rss_mb": WORKER_MAX_RSS_MB or None,
+        "max_jobs": WORKER_MAX_JOBS or None,
+        "recycle_paused_seconds": round(max(0.0, _backoff["until"] - time.monotonic()), 1),
+        "running_jobs": len(_active),
+        "recent_jobs": list(_recent_jobs)[-20:],
+    }
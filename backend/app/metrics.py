@@ -0,0 +1,207 @@
+# app/metrics.py
+"""
+Prometheus metrics in the text exposition format, without a client library.
+
+Histograms and counters are observed on the hot paths (one lock and a
+bisect per observation); gauges for caches, the queue and the DB pool are
+read from their modules only when /metrics is scraped.
+
+Metrics are per process. The API serves them at /metrics; Celery worker
+children can serve their own with METRICS_WORKER_PORT (see tasks.py).
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, List, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; covers sub-ms cache hits up to multi-minute CPU inference
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_registry: List["_Metric"] = []
+_collectors: List[Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]] = []
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, seconds: float, **labels) -> None:
+        key = self._key(labels)
+        idx = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[idx] += 1
+            row[-1] += seconds
+
+    @contextmanager
+    def time(self, **labels):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - t0, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        lines = []
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += count
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(row[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+def register_collector(fn: Callable[[], Iterable[Tuple[str, str, str, Dict[str, str], float]]]) -> None:
+    """
+    Add a scrape-time source of samples. `fn` yields
+    (name, type, help, labels, value) tuples; type is "gauge" or "counter".
+    """
+    _collectors.append(fn)
+
+
+def render() -> str:
+    lines: List[str] = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+
+    seen = set()
+    for fn in _collectors:
+        try:
+            samples = list(fn())
+        except Exception as e:
+            print(f"[metrics] Collector {getattr(fn, '__name__', fn)} failed: {e}")
+            continue
+        for name, kind, help_text, labels, value in samples:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+            names = tuple(labels)
+            lines.append(f"{name}{_labels(names, tuple(labels[n] for n in names))} {_fmt(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def serve(port: int) -> None:
+    """Serve render() on a background thread (Celery worker children)."""
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    print(f"[metrics] Serving on :{port}")
+
+
+# -----------------------
+# Pipeline metrics
+# -----------------------
+HTTP_REQUEST_SECONDS = Histogram(
+    "deepverify_http_request_seconds", "API request latency", ("method", "route", "status"),
+)
+UPLOAD_STORE_SECONDS = Histogram(
+    "deepverify_upload_store_seconds", "Writing an upload and its derivatives to storage",
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "deepverify_queue_wait_seconds", "Time an admitted job waited before being dispatched",
+)
+MODEL_STAGE_SECONDS = Histogram(
+    "deepverify_model_stage_seconds",
+    "Per-model pipeline stage time (load, decode, preprocess, inference, heatmap)",
+    ("model", "stage"),
+)
+DB_PERSIST_SECONDS = Histogram(
+    "deepverify_db_persist_seconds", "Persisting model results and job status", ("kind",),
+)
+JOB_SECONDS = Histogram(
+    "deepverify_job_seconds", "End-to-end analysis time of a job", ("status",),
+)
+JOBS_TOTAL = Counter(
+    "deepverify_jobs_total", "Analysis jobs finished, by final status", ("status",),
+)
+MODEL_ERRORS_TOTAL = Counter(
+    "deepverify_model_errors_total", "Model runs that returned an error result", ("model",),
+)
+JOB_PEAK_RSS_BYTES = Histogram(
+    "deepverify_job_peak_rss_bytes",
+    "Peak resident memory of the process running a job",
+    buckets=tuple(mb * 1024 * 1024 for mb in (256, 512, 1024, 1536, 2048, 3072, 4096, 6144, 8192, 12288, 16384)),
+)
@@ -0,0 +1,200 @@
+# app/model_registry.py
+"""
+MODEL_REGISTRY from a config file, reloaded while the app runs.
+
+MODEL_REGISTRY_FILE (JSON, or YAML if PyYAML is installed) holds a list of
+entries in the MODEL_REGISTRY format (see models_interface.py), or
+{"models": [...]}. Without the file the built-in list is used.
+
+A watcher thread polls the file. When it changes, new and changed entries
+(different name, path, version, ...) are loaded and warmed up on the watcher
+thread while jobs keep running on the current models; then the registry is
+swapped in one step. Jobs that already started finish on the entries they
+started with, and models that left the registry are released from
+_MODEL_CACHE when the last of those jobs is done. If any new model fails to
+load, the old registry stays in place.
+"""
+
+import json
+import os
+import threading
+import time
+import traceback
+from typing import Any, Dict, List, Optional
+
+from . import models_interface as mi
+from .config import MODEL_REGISTRY_FILE, MODEL_REGISTRY_WATCH_SECONDS
+
+REQUIRED_FIELDS = ("name", "path")
+
+_swap_lock = threading.Lock()
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+STATE: Dict[str, Any] = {
+    "file": MODEL_REGISTRY_FILE or None,
+    "source": "built-in",
+    "signature": None,
+    "loaded_at": None,
+    "reloads": 0,
+    "last_error": None,
+}
+
+
+def _signature(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def read_registry_file(path: str) -> List[Dict[str, Any]]:
+    """Parse and validate a registry file; raises ValueError on bad content."""
+    with open(path) as fh:
+        text = fh.read()
+    if path.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("PyYAML is not installed; use a .json registry or pip install pyyaml")
+        data = yaml.safe_load(text)
+    else:
+        data = json.loads(text)
+
+    if isinstance(data, dict):
+        data = data.get("models")
+    if not isinstance(data, list) or not data:
+        raise ValueError("registry must be a non-empty list of models (or {\"models\": [...]})")
+
+    entries, names = [], set()
+    for i, raw in enumerate(data):
+        if not isinstance(raw, dict):
+            raise ValueError(f"entry {i} is not an object")
+        missing = [f for f in REQUIRED_FIELDS if not raw.get(f)]
+        if missing:
+            raise ValueError(f"entry {i} is missing {', '.join(missing)}")
+        if raw["name"] in names:
+            raise ValueError(f"duplicate model name {raw['name']!r}")
+        names.add(raw["name"])
+        entry = dict(raw)
+        entry["input_size"] = int(entry.get("input_size", 224))
+        entry["version"] = str(entry.get("version", "1.0"))
+        entries.append(entry)
+    return entries
+
+
+def apply(entries: List[Dict[str, Any]], warm_up: bool = True) -> Dict[str, Any]:
+    """
+    Make `entries` the registry. With warm_up, new/changed models are loaded
+    and warmed before the swap (and a failure leaves the registry as it was);
+    without it they load lazily on first use.
+    """
+    with _swap_lock:
+        current = {mi._model_cache_key(e): e for e in mi.MODEL_REGISTRY}
+        new_keys = [mi._model_cache_key(e) for e in entries]
+        added = [e for e, key in zip(entries, new_keys) if key not in current]
+        retired = [key for key in current if key not in new_keys]
+
+        report: Dict[str, Any] = {"added": [], "retired": retired}
+        try:
+            for entry in added:
+                t0 = time.time()
+                if warm_up:
+                    model = mi._load_model_entry(entry)
+                    mi.warm_up_model(entry, model)
+                report["added"].append({
+                    "name": entry["name"],
+                    "version": entry["version"],
+                    "ready_ms": round((time.time() - t0) * 1000.0, 2),
+                })
+        except Exception:
+            # don't keep half a new registry's models around
+            mi.retire_models([mi._model_cache_key(e) for e in added])
+            raise
+
+        # jobs that took their snapshot before this hold refs, so retiring
+        # waits for them; later ones see only the new entries
+        mi.set_registry(entries)
+        mi.retire_models(retired, active=new_keys)
+    return report
+
+
+def load(warm_up: bool = False) -> bool:
+    """Read MODEL_REGISTRY_FILE if it exists and apply it. Returns whether it did."""
+    path = MODEL_REGISTRY_FILE
+    if not path or not os.path.exists(path):
+        return False
+    signature = _signature(path)
+    try:
+        report = apply(read_registry_file(path), warm_up=warm_up)
+    except Exception as e:
+        STATE.update(signature=signature, last_error=str(e))
+        print(f"[model_registry] Keeping current registry, {path} not applied: {e}")
+        if not isinstance(e, ValueError):
+            traceback.print_exc()
+        return False
+
+    first = STATE["source"] == "built-in"
+    STATE.update(source="file", signature=signature, loaded_at=time.time(), last_error=None)
+    if first:
+        print(f"[model_registry] Loaded {len(mi.MODEL_REGISTRY)} models from {path}")
+    elif report["added"] or report["retired"]:
+        STATE["reloads"] += 1
+        added = ", ".join(f"{a['name']}@{a['version']} ({a['ready_ms']}ms)" for a in report["added"])
+        print(
+            f"[model_registry] Swapped registry: added {added or 'none'}; "
+            f"retired {', '.join(report['retired']) or 'none'}"
+        )
+    return True
+
+
+def check_for_changes(warm_up: bool = True) -> bool:
+    """Reload if the file changed since it was last read."""
+    path = MODEL_REGISTRY_FILE
+    if not path:
+        return False
+    signature = _signature(path)
+    if signature is None or signature == STATE["signature"]:
+        return False
+    return load(warm_up=warm_up)
+
+
+def status() -> Dict[str, Any]:
+    return {
+        **{k: v for k, v in STATE.items() if k != "signature"},
+        "models": [
+            {"name": e.get("name"), "version": e.get("version"), "input_size": e.get("input_size")}
+            for e in list(mi.MODEL_REGISTRY)
+        ],
+    }
+
+
+# -----------------------
+# Watcher
+# -----------------------
+def _loop(interval: float, warm_up: bool) -> None:
+    while not _stop.wait(interval):
+        try:
+            check_for_changes(warm_up=warm_up)
+        except Exception:
+            traceback.print_exc()
+
+
+def start_watcher(interval: float = MODEL_REGISTRY_WATCH_SECONDS, warm_up: bool = True) -> None:
+    """
+    Poll the registry file. warm_up=False swaps entries without loading them
+    (for processes that rarely run models themselves, like the Celery API).
+    """
+    global _thread
+    if not MODEL_REGISTRY_FILE or interval <= 0:
+        return
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, args=(interval, warm_up), name="model-registry", daemon=True)
+    _thread.start()
+
+
+def stop_watcher() -> None:
+    _stop.set()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 
@@ -14,12 +14,21 @@ class User(Base):
     hashed_password = Column(String, nullable=False)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    plan = Column(String, default="free", server_default="free")  # key of payments.PLAN_PRICE_MAP or "free"
 
     jobs = relationship("Job", back_populates="owner")
 
 
 class Job(Base):
     __tablename__ = "jobs"
+    # keyset pagination of a user's history: (user_id, [filter,] created_at, id)
+    __table_args__ = (
+        Index("ix_jobs_user_created_id", "user_id", "created_at", "id"),
+        Index("ix_jobs_user_status_created_id", "user_id", "status", "created_at", "id"),
+        Index("ix_jobs_user_verdict_created_id", "user_id", "verdict", "created_at", "id"),
+        # admin exports over a time range, across users
+        Index("ix_jobs_created_id", "created_at", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     image_id = Column(String, unique=True, index=True)
@@ -27,20 +36,49 @@ class Job(Base):
     status = Column(String, default="pending")
     created_at = Column(DateTime, default=datetime.utcnow)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
+    # bytes of upload + heatmaps this job holds on disk, used for quota checks
+    storage_bytes = Column(Integer, default=0, server_default="0")
+    verdict = Column(String, nullable=True)  # consensus decision once completed: FAKE / REAL / UNCERTAIN
+    consensus_score = Column(Float, nullable=True)
+    # times a worker started this job; redelivered tasks stop at JOB_MAX_ATTEMPTS
+    attempts = Column(Integer, default=0, server_default="0")
 
     owner = relationship("User", back_populates="jobs")
-    results = relationship("ModelResult", back_populates="job")
+    results = relationship("ModelResult", back_populates="job", order_by="ModelResult.id")
 
 
 class ModelResult(Base):
     __tablename__ = "model_results"
 
     id = Column(Integer, primary_key=True, index=True)
-    job_id = Column(Integer, ForeignKey("jobs.id"))
+    job_id = Column(Integer, ForeignKey("jobs.id"), index=True)
     model_name = Column(String)
     confidence_real = Column(Float)
     confidence_fake = Column(Float)
     label = Column(String)
     heatmap_path = Column(String)
+    heatmap_ready = Column(Boolean, default=False)
+    version = Column(String, nullable=True)
+    # wall time per pipeline stage, in ms (time_ms covers decode..heatmap)
+    time_ms = Column(Float, nullable=True)
+    load_ms = Column(Float, nullable=True)
+    decode_ms = Column(Float, nullable=True)
+    preprocess_ms = Column(Float, nullable=True)
+    inference_ms = Column(Float, nullable=True)
+    heatmap_ms = Column(Float, nullable=True)
 
     job = relationship("Job", back_populates="results")
+
+
+class Blob(Base):
+    """Reference-counted entry for a content-addressed file (see app/storage.py)."""
+    __tablename__ = "blobs"
+    __table_args__ = (UniqueConstraint("kind", "sha256", name="uq_blobs_kind_sha256"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)  # "uploads" or "heatmaps"
+    sha256 = Column(String(64), nullable=False)
+    ext = Column(String, default="")
+    size = Column(Integer, default=0)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
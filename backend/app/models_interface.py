@@ -15,48 +15,73 @@ Register models in MODEL_REGISTRY. Each entry:
 
 Produces for each model:
 {
-  "name","version","confidence_real","confidence_fake","label","time_ms","heatmap_path"
+  "name","version","confidence_real","confidence_fake","label","time_ms","heatmap_path",
+  "heatmap_ready", "timings": {"load_ms","decode_ms","preprocess_ms","inference_ms","heatmap_ms"}
 }
 """
 
+import gc
+import io
 import os
 import time
 import threading
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from typing import Optional, Dict, Any, List
+from typing import Callable, Optional, Dict, Any, List
 import traceback
 
 import numpy as np
 from PIL import Image, ImageOps
-import matplotlib.pyplot as plt
-
-# PyTorch imports (import when needed)
-try:
-    import torch
-    import torchvision.transforms as T
-    TORCH_AVAILABLE = True
-    DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-except Exception:
-    torch = None
-    T = None
-    TORCH_AVAILABLE = False
-    DEVICE = None
-
-# TensorFlow / Keras imports (import when needed)
-try:
-    import tensorflow as tf
-    TF_AVAILABLE = True
-    # Configure TF to avoid hogging GPU memory if present (optional)
-    try:
-        gpus = tf.config.list_physical_devices("GPU")
-        if gpus:
-            for g in gpus:
-                tf.config.experimental.set_memory_growth(g, True)
-    except Exception:
-        pass
-except Exception:
-    tf = None
-    TF_AVAILABLE = False
+
+from . import profiling, storage
+from .consensus import compute_consensus
+from .metrics import MODEL_ERRORS_TOTAL, MODEL_STAGE_SECONDS
+
+# Frameworks are imported on first use (see _import_frameworks): an API
+# process that hands inference to Celery never pays for torch/TF/matplotlib.
+# None = not probed yet.
+torch = None
+T = None
+tf = None
+TORCH_AVAILABLE: Optional[bool] = None
+TF_AVAILABLE: Optional[bool] = None
+DEVICE = None
+_FRAMEWORKS_LOCK = threading.Lock()
+
+
+def _import_frameworks() -> None:
+    global torch, T, tf, TORCH_AVAILABLE, TF_AVAILABLE, DEVICE
+    if TORCH_AVAILABLE is not None and TF_AVAILABLE is not None:
+        return
+    with _FRAMEWORKS_LOCK:
+        if TORCH_AVAILABLE is None:
+            t0 = time.time()
+            try:
+                import torch as _torch
+                import torchvision.transforms as _T
+                torch, T = _torch, _T
+                DEVICE = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+                TORCH_AVAILABLE = True
+                print(f"[models_interface] Imported torch in {round((time.time() - t0) * 1000.0, 2)}ms (device={DEVICE})")
+            except Exception:
+                TORCH_AVAILABLE = False
+
+        if TF_AVAILABLE is None:
+            t0 = time.time()
+            try:
+                import tensorflow as _tf
+                tf = _tf
+                # Configure TF to avoid hogging GPU memory if present (optional)
+                try:
+                    gpus = tf.config.list_physical_devices("GPU")
+                    if gpus:
+                        for g in gpus:
+                            tf.config.experimental.set_memory_growth(g, True)
+                except Exception:
+                    pass
+                TF_AVAILABLE = True
+                print(f"[models_interface] Imported tensorflow in {round((time.time() - t0) * 1000.0, 2)}ms")
+            except Exception:
+                TF_AVAILABLE = False
 
 # Paths (robust)
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))  # backend root
@@ -67,12 +92,12 @@ APP_MODELS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "models
 os.makedirs(MODELS_DIR, exist_ok=True)
 os.makedirs(os.path.dirname(BASE_DIR), exist_ok=True)  # ensure parent exists
 
-HEATMAP_DIR = os.path.abspath(os.path.join(BASE_DIR, "data", "heatmaps"))
-os.makedirs(HEATMAP_DIR, exist_ok=True)
 
 # -----------------------
 # MODEL REGISTRY — Use filenames or relative path under backend/models.
 # You can replace the `path` with an absolute path if you prefer.
+# Built-in default; MODEL_REGISTRY_FILE replaces it at startup and on change
+# (see app/model_registry.py). Always swapped in place, never rebound.
 # -----------------------
 MODEL_REGISTRY: List[Dict[str, Any]] = [
     {"name": "BestModelPT", "path": "best_model-v3.pt", "framework": "torch", "input_size": 224, "version": "1.0"},
@@ -82,9 +107,71 @@ MODEL_REGISTRY: List[Dict[str, Any]] = [
     {"name": "Model2_Keras", "path": "model2.keras", "framework": "keras", "input_size": 224, "version": "1.0"},
 ]
 
-# Lightweight cache to avoid reload
+# Lightweight cache to avoid reload, keyed by _model_cache_key(entry)
 _MODEL_CACHE: Dict[str, Any] = {}
 _MODEL_CACHE_LOCK = threading.Lock()
+# cache key -> number of running jobs using that model; retired keys are
+# dropped from the cache when their last job finishes
+_MODEL_REFS: Dict[str, int] = {}
+_RETIRED_MODELS: set = set()
+
+
+def _model_cache_key(entry: Dict[str, Any]) -> str:
+    return f"{entry.get('name', 'unknown')}:{entry.get('path')}:{entry.get('version', '1.0')}"
+
+
+def _acquire_registry() -> List[Dict[str, Any]]:
+    """
+    Snapshot MODEL_REGISTRY and take a reference on each entry in one step,
+    so a swap (model_registry.apply, also under the lock) can't retire an
+    entry between the two.
+    """
+    with _MODEL_CACHE_LOCK:
+        registry = list(MODEL_REGISTRY)
+        for entry in registry:
+            key = _model_cache_key(entry)
+            _MODEL_REFS[key] = _MODEL_REFS.get(key, 0) + 1
+    return registry
+
+
+def set_registry(entries: List[Dict[str, Any]]) -> None:
+    """Replace MODEL_REGISTRY's contents, atomically with respect to _acquire_registry."""
+    with _MODEL_CACHE_LOCK:
+        MODEL_REGISTRY[:] = entries
+
+
+def _release_models(entries: List[Dict[str, Any]]) -> None:
+    released = False
+    with _MODEL_CACHE_LOCK:
+        for entry in entries:
+            key = _model_cache_key(entry)
+            _MODEL_REFS[key] -= 1
+            if _MODEL_REFS[key] <= 0:
+                del _MODEL_REFS[key]
+                if key in _RETIRED_MODELS:
+                    _RETIRED_MODELS.discard(key)
+                    released = _MODEL_CACHE.pop(key, None) is not None or released
+    if released:
+        gc.collect()
+
+
+def retire_models(keys: List[str], active: List[str] = ()) -> None:
+    """
+    Drop models that left the registry from the cache: now if no job is
+    using them, otherwise when the last job using them finishes. `active`
+    keys (back in the registry, e.g. after a rollback) are kept.
+    """
+    released = []
+    with _MODEL_CACHE_LOCK:
+        _RETIRED_MODELS.difference_update(active)
+        for key in keys:
+            if _MODEL_REFS.get(key):
+                _RETIRED_MODELS.add(key)
+            elif _MODEL_CACHE.pop(key, None) is not None:
+                released.append(key)
+    if released:
+        gc.collect()
+        print(f"[models_interface] Released {', '.join(released)}")
 
 # -----------------------
 # Loaders
@@ -122,11 +209,17 @@ def _load_model_entry(entry: Dict[str, Any]):
     Tries multiple likely locations to account for developer copy mistakes.
     Prints candidates it tried.
     """
+    _import_frameworks()
     name = entry.get("name", "unknown")
     raw_path = entry.get("path")
     if not raw_path:
         raise RuntimeError(f"Model entry for '{name}' missing 'path'")
 
+    cache_key = _model_cache_key(entry)
+    with _MODEL_CACHE_LOCK:
+        if cache_key in _MODEL_CACHE:
+            return _MODEL_CACHE[cache_key]
+
     # Build candidate paths to try (in order)
     candidates = []
 
@@ -179,11 +272,6 @@ def _load_model_entry(entry: Dict[str, Any]):
     loader = entry.get("loader", None)
     framework = (entry.get("framework") or os.path.splitext(path)[1].lower().lstrip(".")).lower()
 
-    cache_key = f"{name}:{path}"
-    with _MODEL_CACHE_LOCK:
-        if cache_key in _MODEL_CACHE:
-            return _MODEL_CACHE[cache_key]
-
     if loader and callable(loader):
         model = loader(path, DEVICE)
     else:
@@ -208,9 +296,13 @@ def _load_model_entry(entry: Dict[str, Any]):
 # -----------------------
 # Preprocessing helpers
 # -----------------------
+def _fit_image(img_pil: Image.Image, input_size: int) -> Image.Image:
+    # resize & center-crop to input_size
+    return ImageOps.fit(img_pil.convert("RGB"), (input_size, input_size), Image.LANCZOS)
+
 def _preprocess_for_torch(img_pil: Image.Image, input_size: int):
     # resize & center-crop to input_size, normalize w/ ImageNet mean/std
-    img = ImageOps.fit(img_pil.convert("RGB"), (input_size, input_size), Image.LANCZOS)
+    img = _fit_image(img_pil, input_size)
     arr = np.array(img).astype(np.float32) / 255.0  # HWC
     arr = np.transpose(arr, (2,0,1))  # CHW
     tensor = torch.tensor(arr, dtype=torch.float32, device=DEVICE).unsqueeze(0)
@@ -220,7 +312,7 @@ def _preprocess_for_torch(img_pil: Image.Image, input_size: int):
     return tensor
 
 def _preprocess_for_keras(img_pil: Image.Image, input_size: int):
-    img = ImageOps.fit(img_pil.convert("RGB"), (input_size, input_size), Image.LANCZOS)
+    img = _fit_image(img_pil, input_size)
     arr = np.array(img).astype(np.float32)
     arr = arr / 255.0
     inp = np.expand_dims(arr, axis=0)
@@ -271,6 +363,53 @@ def _predict_with_keras(model, input_np):
         probs = exp / exp.sum()
     return probs
 
+def _confidences(probs):
+    """(confidence_real, confidence_fake, label) from one model output row."""
+    probs = np.asarray(probs).astype(np.float32)
+    if probs.size >= 2:
+        confidence_real = float(probs[0])
+        confidence_fake = float(probs[1])
+    else:
+        confidence_fake = float(probs[0])
+        confidence_real = 1.0 - confidence_fake
+    label = "fake" if confidence_fake > confidence_real else "real"
+    return confidence_real, confidence_fake, label
+
+# -----------------------
+# Batched prediction (offline bulk scans, see app/bulk_scan.py)
+# -----------------------
+def predict_batch(entry: Dict[str, Any], model, fitted: np.ndarray) -> np.ndarray:
+    """
+    Predict a batch of images already fitted to the entry's input size
+    ((n, size, size, 3) uint8, see _fit_image), normalized like the
+    single-image path. Returns (n, classes) probabilities.
+    """
+    arr = fitted.astype(np.float32) / 255.0
+    if _is_torch_entry(entry):
+        if not TORCH_AVAILABLE:
+            raise RuntimeError("Torch not installed on server")
+        tensor = torch.from_numpy(arr).permute(0, 3, 1, 2).contiguous().to(DEVICE)
+        mean = torch.tensor([0.485,0.456,0.406], device=DEVICE).view(1,3,1,1)
+        std = torch.tensor([0.229,0.224,0.225], device=DEVICE).view(1,3,1,1)
+        model.eval()
+        with torch.no_grad():
+            out = model((tensor - mean) / std)
+            if isinstance(out, dict):
+                out = out["logits"] if "logits" in out else [v for v in out.values() if torch.is_tensor(v)][0]
+            if isinstance(out, np.ndarray):
+                out = torch.from_numpy(out)
+            return torch.softmax(out.reshape(out.size(0), -1), dim=1).cpu().numpy()
+
+    if not TF_AVAILABLE:
+        raise RuntimeError("TensorFlow not installed on server")
+    pred = np.array(model.predict(arr, verbose=0), dtype=np.float32).reshape(len(arr), -1)
+    # rows that aren't probabilities yet (logits) get a softmax, as in _predict_with_keras
+    raw = np.any((pred < 0) | (pred > 1), axis=1)
+    if raw.any():
+        exp = np.exp(pred[raw] - pred[raw].max(axis=1, keepdims=True))
+        pred[raw] = exp / exp.sum(axis=1, keepdims=True)
+    return pred
+
 # -----------------------
 # Simple occlusion heatmap generation
 # -----------------------
@@ -300,7 +439,8 @@ def _generate_occlusion_heatmap_generic(predict_fn, img_pil: Image.Image, input_
     heatmap = np.clip(heatmap, 0.0, None)
     if heatmap.max() > 0:
         heatmap = heatmap / heatmap.max()
-    cmap = plt.get_cmap("jet")
+    from matplotlib import colormaps  # only needed once a heatmap is drawn; no pyplot/GUI backend
+    cmap = colormaps["jet"]
     colored = cmap(heatmap)[:, :, :3]
     colored = (colored * 255).astype(np.uint8)
     heat_pil = Image.fromarray(colored).resize((w,h), Image.BILINEAR)
@@ -309,53 +449,70 @@ def _generate_occlusion_heatmap_generic(predict_fn, img_pil: Image.Image, input_
 # -----------------------
 # Runner for single model
 # -----------------------
+def _error_result(name: str, version: str, timings: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    return {
+        "name": name,
+        "version": version,
+        "confidence_real": 0.5,
+        "confidence_fake": 0.5,
+        "label": "error",
+        "time_ms": 0.0,
+        "heatmap_path": "N/A",
+        "heatmap_ready": False,
+        "timings": timings or {},
+    }
+
+
+def _stage_done(timings: Dict[str, float], stage: str, start: float, job_id: Optional[int], model: str) -> float:
+    """Record a finished stage in `timings` (and the job's trace, if profiled). Returns now."""
+    end = time.time()
+    timings[f"{stage}_ms"] = round((end - start) * 1000.0, 2)
+    profiling.record(job_id, f"{model}: {stage}", start, end, model=model)
+    return end
+
+
 def _run_single_model(entry: Dict[str, Any], file_path: str, job_id: Optional[int] = None) -> Dict[str, Any]:
+    _import_frameworks()
     name = entry.get("name", "unknown")
     version = entry.get("version", "1.0")
     input_size = int(entry.get("input_size", 224))
     framework = entry.get("framework", None)
+    # per-stage wall time in ms: load, decode, preprocess, inference, heatmap
+    timings: Dict[str, float] = {}
+
+    profiling.attach_thread(job_id)
+    t_start = time.time()
     try:
         model = _load_model_entry(entry)
     except Exception as e:
         traceback.print_exc()
-        return {
-            "name": name,
-            "version": version,
-            "confidence_real": 0.5,
-            "confidence_fake": 0.5,
-            "label": "error",
-            "time_ms": 0.0,
-            "heatmap_path": "N/A",
-        }
+        return _error_result(name, version)
+    _stage_done(timings, "load", t_start, job_id, name)
 
     t0 = time.time()
     img = Image.open(file_path).convert("RGB")
+    t_mark = _stage_done(timings, "decode", t0, job_id, name)
     try:
         ext = (framework or os.path.splitext(entry.get("path",""))[1].lower()).lstrip(".")
         if ext in ("pt","pth","torch","torchscript"):
             if not TORCH_AVAILABLE:
                 raise RuntimeError("Torch not installed on server")
             inp = _preprocess_for_torch(img, input_size)
+            t_mark = _stage_done(timings, "preprocess", t_mark, job_id, name)
             probs = _predict_with_torch(model, inp)
         else:
             if not TF_AVAILABLE:
                 raise RuntimeError("TensorFlow not installed on server")
             inp_np = _preprocess_for_keras(img, input_size)
+            t_mark = _stage_done(timings, "preprocess", t_mark, job_id, name)
             probs = _predict_with_keras(model, inp_np)
+        _stage_done(timings, "inference", t_mark, job_id, name)
 
-        probs = np.asarray(probs).astype(np.float32)
-        if probs.size >= 2:
-            confidence_real = float(probs[0])
-            confidence_fake = float(probs[1]) if probs.size > 1 else (1.0 - confidence_real)
-            label = "fake" if confidence_fake > confidence_real else "real"
-            target_idx = 1 if label == "fake" else 0
-        else:
-            confidence_fake = float(probs[0])
-            confidence_real = 1.0 - confidence_fake
-            label = "fake" if confidence_fake > confidence_real else "real"
-            target_idx = 1 if label == "fake" else 0
+        confidence_real, confidence_fake, label = _confidences(probs)
+        target_idx = 1 if label == "fake" else 0
 
         heatmap_path = "N/A"
+        t_mark = time.time()
         try:
             def predict_fn_for_heat(pil_img):
                 ext_local = (framework or os.path.splitext(entry.get("path",""))[1].lower()).lstrip(".")
@@ -367,12 +524,13 @@ def _run_single_model(entry: Dict[str, Any], file_path: str, job_id: Optional[in
                     return _predict_with_keras(model, inp_np_local)
 
             heat_img = _generate_occlusion_heatmap_generic(predict_fn_for_heat, img, input_size, target_class_idx=target_idx)
-            fname = f"heatmap_{name}_{int(time.time()*1000)}_{os.getpid()}.png"
-            heatpath = os.path.join(HEATMAP_DIR, fname)
-            heat_img.save(heatpath)
-            heatmap_path = heatpath
+            buf = io.BytesIO()
+            heat_img.save(buf, format="PNG")
+            heat_sha, _, heatmap_path = storage.put_bytes("heatmaps", buf.getvalue(), ".png")
+            storage.make_derivatives("heatmaps", heat_sha, heat_img)
         except Exception:
             heatmap_path = "N/A"
+        _stage_done(timings, "heatmap", t_mark, job_id, name)
 
         t1 = time.time()
         time_ms = (t1 - t0) * 1000.0
@@ -384,60 +542,170 @@ def _run_single_model(entry: Dict[str, Any], file_path: str, job_id: Optional[in
             "label": label,
             "time_ms": round(time_ms, 2),
             "heatmap_path": heatmap_path,
+            "heatmap_ready": heatmap_path != "N/A",
+            "timings": timings,
         }
     except Exception:
         traceback.print_exc()
-        return {
-            "name": name,
-            "version": version,
-            "confidence_real": 0.5,
-            "confidence_fake": 0.5,
-            "label": "error",
-            "time_ms": 0.0,
-            "heatmap_path": "N/A",
-        }
+        return _error_result(name, version, timings)
 
 # -----------------------
 # Async runner used by tasks.py
 # -----------------------
-async def run_models_on_image(file_path: str, job_id: Optional[int] = None) -> Dict[str, Any]:
-    if not MODEL_REGISTRY:
+async def run_models_on_image(
+    file_path: str,
+    job_id: Optional[int] = None,
+    on_result: Optional[Callable[[Dict[str, Any], List[Dict[str, Any]], int], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Run every registered model on the image. As each model finishes,
+    `on_result(result, results_so_far, total)` is called from this thread.
+    The job runs on the registry as it was when it started, even if a reload
+    swaps it meanwhile.
+    """
+    registry = _acquire_registry()
+    if not registry:
         raise RuntimeError("MODEL_REGISTRY empty. Edit app/models_interface.py and add models.")
+    try:
+        results = _run_registry(registry, file_path, job_id, on_result)
+    finally:
+        _release_models(registry)
+
+    # consensus
+    try:
+        consensus = compute_consensus(results)
+        consensus["explanation"] = ["Analyzed by models"]
+    except Exception:
+        consensus = {"decision": "PENDING", "score": 0.0, "explanation": []}
+
+    return {"models": results, "consensus": consensus}
+
+
+def _run_registry(
+    registry: List[Dict[str, Any]],
+    file_path: str,
+    job_id: Optional[int],
+    on_result: Optional[Callable[[Dict[str, Any], List[Dict[str, Any]], int], None]],
+) -> List[Dict[str, Any]]:
     results: List[Dict[str, Any]] = []
-    with ThreadPoolExecutor(max_workers=min(4, len(MODEL_REGISTRY))) as ex:
-        futures = [ex.submit(_run_single_model, entry, file_path, job_id) for entry in MODEL_REGISTRY]
+    total = len(registry)
+    with ThreadPoolExecutor(max_workers=min(4, total)) as ex:
+        futures = [ex.submit(_run_single_model, entry, file_path, job_id) for entry in registry]
         for fut in as_completed(futures):
             try:
                 r = fut.result()
             except Exception as e:
                 traceback.print_exc()
-                r = {
-                    "name": "unknown",
-                    "version": "1.0",
-                    "confidence_real": 0.5,
-                    "confidence_fake": 0.5,
-                    "label": "error",
-                    "time_ms": 0.0,
-                    "heatmap_path": "N/A",
-                }
+                r = _error_result("unknown", "1.0")
             results.append(r)
+            # stage timings were measured by the runner already; just record them
+            for stage, ms in (r.get("timings") or {}).items():
+                MODEL_STAGE_SECONDS.observe(ms / 1000.0, model=r["name"], stage=stage[:-3])
+            if r.get("label") == "error":
+                MODEL_ERRORS_TOTAL.inc(model=r["name"])
+            if on_result:
+                try:
+                    on_result(r, results, total)
+                except Exception:
+                    traceback.print_exc()
+    return results
 
-    # consensus
-    try:
-        labels = [r.get("label","unknown") for r in results]
-        fake_count = labels.count("fake")
-        real_count = labels.count("real")
-        if fake_count > real_count:
-            decision = "FAKE"
-            avg_conf = float(sum(r.get("confidence_fake",0.5) for r in results)/max(1,len(results)))
-        elif real_count > fake_count:
-            decision = "REAL"
-            avg_conf = float(sum(r.get("confidence_real",0.5) for r in results)/max(1,len(results)))
-        else:
-            decision = "UNCERTAIN"
-            avg_conf = 0.5
-        consensus = {"decision": decision, "score": avg_conf, "explanation": ["Analyzed by models"]}
-    except Exception:
-        consensus = {"decision": "PENDING", "score": 0.0, "explanation": []}
 
-    return {"models": results, "consensus": consensus}
+# -----------------------
+# Preloading (Celery worker parent, before the prefork pool starts)
+# -----------------------
+def _is_torch_entry(entry: Dict[str, Any]) -> bool:
+    ext = (entry.get("framework") or os.path.splitext(entry.get("path", ""))[1].lower()).lstrip(".")
+    return ext in ("pt", "pth", "torch", "torchscript")
+
+
+def warm_up_models() -> None:
+    """
+    One dummy prediction per MODEL_REGISTRY model, loading it if needed
+    (a prefork child warming the models it inherited from the parent).
+    """
+    t_start = time.time()
+    for entry in list(MODEL_REGISTRY):
+        try:
+            warm_up_model(entry, _load_model_entry(entry))
+        except Exception as e:
+            print(f"[models_interface] Warm-up failed for {entry.get('name', 'unknown')}: {e}")
+    print(f"[models_interface] Warmed up models in {round((time.time() - t_start) * 1000.0, 2)}ms")
+
+
+def set_inference_threads(n: int) -> None:
+    """Cap framework intra-op threads, e.g. per prefork child."""
+    _import_frameworks()
+    if TORCH_AVAILABLE:
+        torch.set_num_threads(n)
+    if TF_AVAILABLE:
+        try:
+            tf.config.threading.set_intra_op_parallelism_threads(n)
+        except RuntimeError:
+            # TF refuses once its runtime is initialised (e.g. warmed up in the parent)
+            pass
+
+
+def reset_model_state() -> None:
+    """
+    Drop every cached model and the frameworks' global state (Keras graphs
+    and traced functions, the CUDA cache). Only call it when no job is running.
+    """
+    with _MODEL_CACHE_LOCK:
+        _MODEL_CACHE.clear()
+        _RETIRED_MODELS.clear()
+    if TF_AVAILABLE and tf is not None:
+        tf.keras.backend.clear_session()
+    if TORCH_AVAILABLE and torch is not None and torch.cuda.is_available():
+        torch.cuda.empty_cache()
+    # models preloaded before were frozen out of the collector's reach
+    gc.unfreeze()
+    gc.collect()
+
+
+def warm_up_model(entry: Dict[str, Any], model) -> None:
+    """One dummy prediction, so first-call framework setup isn't paid by a job."""
+    size = int(entry.get("input_size", 224))
+    dummy = Image.new("RGB", (size, size))
+    if _is_torch_entry(entry):
+        _predict_with_torch(model, _preprocess_for_torch(dummy, size))
+    else:
+        _predict_with_keras(model, _preprocess_for_keras(dummy, size))
+
+
+def preload_models(warm_up: bool = True) -> Dict[str, Dict[str, Any]]:
+    """
+    Load every MODEL_REGISTRY entry into the model cache and optionally run
+    one dummy prediction each. Called in a prefork parent, children inherit
+    the loaded weights copy-on-write instead of loading their own copies.
+    Returns per-model load/warm-up times (or the error).
+    """
+    report: Dict[str, Dict[str, Any]] = {}
+    t_start = time.time()
+    for entry in MODEL_REGISTRY:
+        name = entry.get("name", "unknown")
+        t0 = time.time()
+        try:
+            model = _load_model_entry(entry)
+            report[name] = {"load_ms": round((time.time() - t0) * 1000.0, 2)}
+            if warm_up:
+                t1 = time.time()
+                warm_up_model(entry, model)
+                report[name]["warm_ms"] = round((time.time() - t1) * 1000.0, 2)
+        except Exception as e:
+            report[name] = {"error": str(e)}
+
+    # move everything loaded so far out of the collector's reach: GC passes in
+    # forked children would otherwise write to (and so copy) the shared pages
+    gc.collect()
+    gc.freeze()
+
+    loaded = sum(1 for r in report.values() if "error" not in r)
+    print(
+        f"[models_interface] Preloaded {loaded}/{len(MODEL_REGISTRY)} models "
+        f"in {round((time.time() - t_start) * 1000.0, 2)}ms"
+    )
+    for name, r in report.items():
+        if "error" in r:
+            print(f"[models_interface]   {name}: {r['error']}")
+    return report
@@ -1,11 +1,20 @@
 # app/payments.py
+import json
 import os
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
 import stripe
 
+from . import crud
+from .auth import get_current_active_user
+from .dependencies import get_db
+from .models import User
+
 router = APIRouter()
 stripe.api_key = os.getenv("STRIPE_SECRET_KEY")  # Set in your env
+# signing secret of the Stripe webhook endpoint pointed at /stripe-webhook
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
 
 class CreateCheckoutRequest(BaseModel):
     plan: str  # e.g., "pro_monthly" or "pro_yearly"
@@ -25,8 +34,18 @@ PLAN_PRICE_MAP = {
     },
 }
 
+# Capacity tier for each plan; users without a paid plan are on "free"
+PLAN_TIERS = {plan: "pro" for plan in PLAN_PRICE_MAP}
+
+
+def plan_tier(plan):
+    return PLAN_TIERS.get(plan or "", "free")
+
 @router.post("/create-checkout-session")
-async def create_checkout_session(payload: CreateCheckoutRequest):
+async def create_checkout_session(
+    payload: CreateCheckoutRequest,
+    current_user: User = Depends(get_current_active_user),
+):
     plan = payload.plan
     if plan not in PLAN_PRICE_MAP:
         raise HTTPException(status_code=400, detail="Unknown plan")
@@ -50,9 +69,33 @@ async def create_checkout_session(payload: CreateCheckoutRequest):
             ],
             success_url=os.getenv("FRONTEND_URL", "http://localhost:3000") + "/?checkout=success",
             cancel_url=os.getenv("FRONTEND_URL", "http://localhost:3000") + "/membership?checkout=cancel",
-            # optional: attach metadata or customer email
-            # metadata={"plan": plan},
+            # the webhook uses these to upgrade the right user once paid
+            client_reference_id=str(current_user.id),
+            metadata={"plan": plan},
         )
         return {"url": session.url}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/stripe-webhook")
+async def stripe_webhook(request: Request, db: Session = Depends(get_db)):
+    """Stripe events: a paid checkout moves its user to the plan they bought."""
+    if not STRIPE_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Stripe webhook not configured")
+    body = await request.body()
+    try:
+        stripe.Webhook.construct_event(body, request.headers.get("stripe-signature", ""), STRIPE_WEBHOOK_SECRET)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid webhook: {e}")
+    # signature checked; plain dicts are simpler than StripeObjects across SDK versions
+    event = json.loads(body)
+
+    if event["type"] == "checkout.session.completed":
+        session = event["data"]["object"]
+        plan = (session.get("metadata") or {}).get("plan")
+        user_id = session.get("client_reference_id")
+        if session.get("payment_status") == "paid" and plan in PLAN_PRICE_MAP and user_id:
+            if crud.set_user_plan(int(user_id), plan, db):
+                print(f"[payments] user_id={user_id} is now on {plan}")
+    return {"received": True}
@@ -0,0 +1,214 @@
+# app/profiling.py
+"""
+Opt-in per-job profiling.
+
+A profiled job records its pipeline stages (per model: load, decode,
+preprocess, inference, heatmap; plus DB persistence) as a Chrome trace-event
+JSON file, viewable in chrome://tracing or https://ui.perfetto.dev. In
+"sample" mode a background thread also samples the stacks of the threads
+working on the job, written as folded stacks (flamegraph.pl / speedscope).
+
+Files live in <DATA_DIR>/traces/job-<id>.trace.json and job-<id>.folded and
+are downloaded through the admin endpoints. When no job is being profiled,
+every hook is a single dict lookup.
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from .config import DATA_DIR, PROFILE_JOBS, PROFILE_SAMPLE_INTERVAL_MS
+
+TRACE_DIR = os.path.join(DATA_DIR, "traces")
+MODES = ("trace", "sample")
+
+# job_id -> _JobTrace, only while a profiled job runs
+_active: Dict[int, "_JobTrace"] = {}
+_active_lock = threading.Lock()
+
+
+def resolve_mode(requested: Optional[str]) -> Optional[str]:
+    """Profiling mode for a job: the request's choice, else PROFILE_JOBS."""
+    value = (requested or PROFILE_JOBS or "").strip().lower()
+    if value in ("1", "true", "on"):
+        return "trace"
+    return value if value in MODES else None
+
+
+def trace_path(job_id: int) -> str:
+    return os.path.join(TRACE_DIR, f"job-{job_id}.trace.json")
+
+
+def profile_path(job_id: int) -> str:
+    return os.path.join(TRACE_DIR, f"job-{job_id}.folded")
+
+
+class _JobTrace:
+    def __init__(self, job_id: int, mode: str):
+        self.job_id = job_id
+        self.mode = mode
+        self.started = time.time()
+        self.events: List[Dict[str, Any]] = []
+        self.threads: Dict[int, str] = {}
+        self.samples: Counter = Counter()
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+
+    def add(self, name: str, start: float, end: float, cat: str, args: Dict[str, Any]) -> None:
+        tid = threading.get_ident()
+        with self.lock:
+            self.threads.setdefault(tid, threading.current_thread().name)
+            self.events.append({
+                "name": name,
+                "cat": cat,
+                "ph": "X",
+                "ts": round((start - self.started) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": tid,
+                "args": args,
+            })
+
+    # -----------------------
+    # Sampling
+    # -----------------------
+    def start_sampler(self) -> None:
+        self._sampler = threading.Thread(target=self._sample_loop, name=f"sampler-{self.job_id}", daemon=True)
+        self._sampler.start()
+
+    def _sample_loop(self) -> None:
+        interval = PROFILE_SAMPLE_INTERVAL_MS / 1000.0
+        while not self._stop.wait(interval):
+            frames = sys._current_frames()
+            with self.lock:
+                threads = list(self.threads.items())
+            for tid, thread_name in threads:
+                frame = frames.get(tid)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)})")
+                    frame = frame.f_back
+                if stack:
+                    self.samples[";".join([thread_name] + stack[::-1])] += 1
+
+    def stop_sampler(self) -> None:
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join(timeout=1)
+
+    def to_chrome(self) -> Dict[str, Any]:
+        pid = os.getpid()
+        meta = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in self.threads.items()
+        ]
+        return {
+            "traceEvents": meta + self.events,
+            "displayTimeUnit": "ms",
+            "otherData": {
+                "job_id": self.job_id,
+                "mode": self.mode,
+                "started_at": self.started,
+                "samples": sum(self.samples.values()),
+            },
+        }
+
+
+# -----------------------
+# Hooks used by the pipeline
+# -----------------------
+def start(job_id: int, mode: Optional[str]) -> bool:
+    """Begin profiling a job; no-op (False) unless mode is "trace" or "sample"."""
+    if mode not in MODES:
+        return False
+    trace = _JobTrace(job_id, mode)
+    with _active_lock:
+        _active[job_id] = trace
+    attach_thread(job_id)
+    if mode == "sample":
+        trace.start_sampler()
+    print(f"[profiling] Profiling job_id={job_id} ({mode})")
+    return True
+
+
+def attach_thread(job_id: int) -> None:
+    """Include the calling thread in the job's stack samples."""
+    trace = _active.get(job_id)
+    if trace is not None:
+        with trace.lock:
+            trace.threads.setdefault(threading.get_ident(), threading.current_thread().name)
+
+
+def record(job_id: Optional[int], name: str, start: float, end: float, cat: str = "stage", **args) -> None:
+    """Record a finished span (time.time() timestamps) if the job is profiled."""
+    trace = _active.get(job_id)
+    if trace is not None:
+        trace.add(name, start, end, cat, args)
+
+
+@contextmanager
+def span(job_id: Optional[int], name: str, cat: str = "stage", **args):
+    trace = _active.get(job_id)
+    if trace is None:
+        yield
+        return
+    t0 = time.time()
+    try:
+        yield
+    finally:
+        trace.add(name, t0, time.time(), cat, args)
+
+
+def finish(job_id: int) -> Optional[str]:
+    """Stop profiling a job and write its files. Returns the trace path."""
+    with _active_lock:
+        trace = _active.pop(job_id, None)
+    if trace is None:
+        return None
+    trace.stop_sampler()
+    os.makedirs(TRACE_DIR, exist_ok=True)
+    path = trace_path(job_id)
+    with open(path, "w") as fh:
+        json.dump(trace.to_chrome(), fh)
+    if trace.samples:
+        with open(profile_path(job_id), "w") as fh:
+            for stack, count in trace.samples.most_common():
+                fh.write(f"{stack} {count}\n")
+    print(f"[profiling] Wrote trace for job_id={job_id}: {path}")
+    return path
+
+
+# -----------------------
+# Stored traces
+# -----------------------
+def list_traces() -> List[Dict[str, Any]]:
+    if not os.path.isdir(TRACE_DIR):
+        return []
+    out = []
+    for name in sorted(os.listdir(TRACE_DIR)):
+        if not name.endswith(".trace.json"):
+            continue
+        job_id = int(name[len("job-"):-len(".trace.json")])
+        stat = os.stat(os.path.join(TRACE_DIR, name))
+        out.append({
+            "job_id": job_id,
+            "size": stat.st_size,
+            "created_at": stat.st_mtime,
+            "has_profile": os.path.exists(profile_path(job_id)),
+        })
+    return out
+
+
+def delete_traces(job_id: int) -> None:
+    for path in (trace_path(job_id), profile_path(job_id)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
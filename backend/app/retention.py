@@ -0,0 +1,411 @@
+# app/retention.py
+"""
+Retention and garbage collection for stored uploads and heatmaps.
+
+Every pass does a bounded amount of work (RETENTION_BATCH_SIZE rows, users
+or legacy files / one shard directory per kind) so it never holds the DB or
+the disk for long; the quota check and the file scans carry on where the
+previous pass stopped:
+
+  0. jobs stuck in "processing"/"partial:*" for RETENTION_STALE_JOB_HOURS
+     (their worker died mid-job) are marked failed
+  1. failed jobs older than RETENTION_FAILED_JOB_DAYS are deleted
+  2. finished jobs older than their owner's tier max age are deleted
+  3. users over their tier quota lose their oldest finished jobs (the next
+     RETENTION_BATCH_SIZE users are checked per pass)
+  4. blob rows whose reference count reached zero are removed with their files
+  5. one shard per kind is scanned for orphans: files no blob row, job or
+     model result refers to (e.g. heatmaps of jobs that failed mid-way), and
+     the next RETENTION_BATCH_SIZE flat files from before sharding
+
+Deleting a job drops its blob references; a file only goes away once no job
+uses it any more. The API runs passes on a background thread
+(start_retention_thread); `python -m app.retention --once` runs one by hand.
+"""
+
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import func, or_, update
+from sqlalchemy.orm import Session, selectinload
+
+from . import crud, storage
+from .config import (
+    RETENTION_BATCH_SIZE,
+    RETENTION_FAILED_JOB_DAYS,
+    RETENTION_INTERVAL_SECONDS,
+    RETENTION_ORPHAN_GRACE_SECONDS,
+    RETENTION_POLICIES,
+    RETENTION_STALE_JOB_HOURS,
+)
+from .database import SessionLocal
+from .models import Blob, Job, ModelResult, User
+from .payments import PLAN_TIERS, plan_tier
+
+# jobs still being analysed are never touched
+FINISHED_STATUSES = ("completed", "failed")
+
+_SHARDS = [f"{i:02x}" for i in range(256)]
+_scan_cursor = {kind: 0 for kind in storage.KINDS}
+# open os.scandir iterators over the flat pre-sharding roots, resumed each pass
+_legacy_scan: Dict[str, Any] = {}
+# last user whose quota was checked
+_quota_cursor = {"user_id": 0}
+
+TOTALS = {"passes": 0, "reclaimed_bytes": 0, "orphans_deleted": 0, "jobs_deleted": 0}
+LAST_REPORT: Dict[str, Any] = {}
+
+_thread: Optional[threading.Thread] = None
+_stop = threading.Event()
+
+
+# -----------------------
+# Job policies
+# -----------------------
+def _delete_jobs(db: Session, jobs: List[Job], report: Dict[str, Any]) -> None:
+    for job in jobs:
+        crud.delete_job(job, db)
+        report["jobs_deleted"] += 1
+    db.commit()
+
+
+def _finished_jobs(db: Session):
+    return (
+        db.query(Job)
+        .options(selectinload(Job.results))
+        .filter(Job.status.in_(FINISHED_STATUSES))
+    )
+
+
+def _tier_filter(tier: str):
+    paid_plans = list(PLAN_TIERS)
+    if tier == "free":
+        return or_(Job.user_id.is_(None), User.plan.is_(None), User.plan.notin_(paid_plans))
+    return User.plan.in_([p for p, t in PLAN_TIERS.items() if t == tier])
+
+
+def _fail_stale_jobs(db: Session, report: Dict[str, Any]) -> None:
+    # a partial verdict is kept; the job just stops looking like it's running
+    cutoff = datetime.utcnow() - timedelta(hours=RETENTION_STALE_JOB_HOURS)
+    result = db.execute(
+        update(Job)
+        .where(or_(Job.status == "processing", Job.status.like("partial:%")), Job.created_at < cutoff)
+        .values(status="failed")
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    report["stale_jobs_failed"] = result.rowcount or 0
+
+
+def _expire_failed_jobs(db: Session, limit: int, report: Dict[str, Any]) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=RETENTION_FAILED_JOB_DAYS)
+    jobs = (
+        db.query(Job)
+        .options(selectinload(Job.results))
+        .filter(Job.status == "failed", Job.created_at < cutoff)
+        .order_by(Job.created_at)
+        .limit(limit)
+        .all()
+    )
+    _delete_jobs(db, jobs, report)
+    return len(jobs)
+
+
+def _expire_old_jobs(db: Session, limit: int, report: Dict[str, Any]) -> int:
+    deleted = 0
+    for tier, policy in RETENTION_POLICIES.items():
+        if deleted >= limit:
+            break
+        cutoff = datetime.utcnow() - timedelta(days=policy["max_age_days"])
+        jobs = (
+            _finished_jobs(db)
+            .outerjoin(User, Job.user_id == User.id)
+            .filter(Job.created_at < cutoff, _tier_filter(tier))
+            .order_by(Job.created_at)
+            .limit(limit - deleted)
+            .all()
+        )
+        _delete_jobs(db, jobs, report)
+        deleted += len(jobs)
+    return deleted
+
+
+def _enforce_quotas(db: Session, limit: int, report: Dict[str, Any]) -> int:
+    users = (
+        db.query(User.id, User.plan)
+        .filter(User.id > _quota_cursor["user_id"])
+        .order_by(User.id)
+        .limit(RETENTION_BATCH_SIZE)
+        .all()
+    )
+    if not users:
+        # end of the table: start over next pass
+        _quota_cursor["user_id"] = 0
+        return 0
+    usage = dict(
+        db.query(Job.user_id, func.coalesce(func.sum(Job.storage_bytes), 0))
+        .filter(Job.user_id.in_([u for u, _ in users]))
+        .group_by(Job.user_id)
+        .all()
+    )
+    deleted = 0
+    for user_id, plan in users:
+        if deleted >= limit:
+            break
+        quota = RETENTION_POLICIES[plan_tier(plan)]["quota_mb"] * 1024 * 1024
+        over = int(usage.get(user_id, 0)) - quota
+        if over > 0:
+            budget = limit - deleted
+            jobs = (
+                _finished_jobs(db)
+                .filter(Job.user_id == user_id)
+                .order_by(Job.created_at)
+                .limit(budget)
+                .all()
+            )
+            victims = []
+            for job in jobs:
+                if over <= 0:
+                    break
+                victims.append(job)
+                over -= job.storage_bytes or 0
+            _delete_jobs(db, victims, report)
+            deleted += len(victims)
+            if over > 0 and len(victims) == budget:
+                # out of budget with this user still over; pick them up next pass
+                break
+        _quota_cursor["user_id"] = user_id
+    if len(users) < RETENTION_BATCH_SIZE and _quota_cursor["user_id"] == users[-1][0]:
+        _quota_cursor["user_id"] = 0
+    return deleted
+
+
+# -----------------------
+# File garbage collection
+# -----------------------
+def _collect_unreferenced_blobs(db: Session, limit: int, report: Dict[str, Any]) -> None:
+    candidates = (
+        db.query(Blob.id, Blob.kind, Blob.sha256, Blob.ext)
+        .filter(Blob.ref_count <= 0)
+        .limit(limit)
+        .all()
+    )
+    gone = []
+    for blob_id, kind, sha256, ext in candidates:
+        # only if nobody took a reference since the SELECT
+        deleted = (
+            db.query(Blob)
+            .filter(Blob.id == blob_id, Blob.ref_count <= 0)
+            .delete(synchronize_session=False)
+        )
+        if deleted:
+            gone.append((kind, sha256, ext or ""))
+    db.commit()
+
+    # files go only after the rows are gone; put_bytes touches a file it
+    # reuses, so one picked up again in the meantime is left for the orphan scan
+    cutoff = time.time() - RETENTION_ORPHAN_GRACE_SECONDS
+    for kind, sha256, ext in gone:
+        try:
+            if os.path.getmtime(storage.blob_path(kind, sha256, ext)) > cutoff:
+                continue
+        except FileNotFoundError:
+            pass
+        freed = storage.delete_blob(kind, sha256, ext)
+        if freed:
+            report["reclaimed_bytes"] += freed
+            report["orphans_deleted"] += 1
+
+
+def _remove_file(path: str, report: Dict[str, Any]) -> None:
+    try:
+        size = os.path.getsize(path)
+        os.remove(path)
+    except FileNotFoundError:
+        return
+    report["reclaimed_bytes"] += size
+    report["orphans_deleted"] += 1
+
+
+def _scan_shard(db: Session, kind: str, shard: str, report: Dict[str, Any]) -> None:
+    shard_dir = os.path.join(storage.STORAGE_ROOTS[kind], shard)
+    if not os.path.isdir(shard_dir):
+        return
+    cutoff = time.time() - RETENTION_ORPHAN_GRACE_SECONDS
+
+    candidates = []  # (path, sha256)
+    for sub in os.listdir(shard_dir):
+        sub_dir = os.path.join(shard_dir, sub)
+        if not os.path.isdir(sub_dir):
+            continue
+        names = os.listdir(sub_dir)
+        report["files_scanned"] += len(names)
+        for name in names:
+            path = os.path.join(sub_dir, name)
+            try:
+                if os.path.getmtime(path) > cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            if name.startswith(".tmp-"):
+                _remove_file(path, report)
+            else:
+                # "<sha>.<ext>" blobs and "<sha>.<variant>.<ext>" derivatives
+                candidates.append((path, name[:64]))
+
+    for i in range(0, len(candidates), 500):
+        chunk = candidates[i:i + 500]
+        referenced = {
+            row[0]
+            for row in db.query(Blob.sha256)
+            .filter(Blob.kind == kind, Blob.ref_count > 0, Blob.sha256.in_({sha for _, sha in chunk}))
+            .all()
+        }
+        for path, sha256 in chunk:
+            if sha256 not in referenced:
+                _remove_file(path, report)
+
+    for sub in os.listdir(shard_dir):
+        try:
+            os.rmdir(os.path.join(shard_dir, sub))
+        except OSError:
+            pass
+    try:
+        os.rmdir(shard_dir)
+    except OSError:
+        pass
+
+
+def _next_legacy_files(kind: str, limit: int) -> List[str]:
+    """The next `limit` flat files of a kind's root, continuing the last pass's scan."""
+    entries = _legacy_scan.get(kind)
+    if entries is None:
+        root = storage.STORAGE_ROOTS[kind]
+        if not os.path.isdir(root):
+            return []
+        entries = _legacy_scan[kind] = os.scandir(root)
+    cutoff = time.time() - RETENTION_ORPHAN_GRACE_SECONDS
+    paths = []
+    for entry in entries:
+        try:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                paths.append(entry.path)
+        except FileNotFoundError:
+            continue
+        if len(paths) >= limit:
+            return paths
+    # root exhausted; the next call starts a fresh scan
+    entries.close()
+    _legacy_scan.pop(kind, None)
+    return paths
+
+
+def _scan_legacy_files(db: Session, kind: str, report: Dict[str, Any]) -> None:
+    """Flat files from before sharding are kept while a job or result points at them."""
+    paths = _next_legacy_files(kind, RETENTION_BATCH_SIZE)
+    report["files_scanned"] += len(paths)
+    column = Job.file_path if kind == "uploads" else ModelResult.heatmap_path
+    for i in range(0, len(paths), 50):
+        chunk = paths[i:i + 50]
+        # stored paths may be relative or absolute, so match on the filename
+        names = [os.path.basename(p) for p in chunk]
+        rows = db.query(column).filter(or_(*[column.endswith(n) for n in names])).all()
+        referenced = {os.path.basename(row[0]) for row in rows if row[0]}
+        for path, name in zip(chunk, names):
+            if name not in referenced:
+                _remove_file(path, report)
+
+
+def _scan_orphans(db: Session, report: Dict[str, Any]) -> None:
+    for kind in storage.KINDS:
+        idx = _scan_cursor[kind]
+        _scan_legacy_files(db, kind, report)
+        _scan_shard(db, kind, _SHARDS[idx], report)
+        report["shards"][kind] = _SHARDS[idx]
+        _scan_cursor[kind] = (idx + 1) % len(_SHARDS)
+
+
+# -----------------------
+# Entry points
+# -----------------------
+def run_retention_pass(db: Optional[Session] = None, batch_size: int = RETENTION_BATCH_SIZE) -> Dict[str, Any]:
+    """Run one bounded retention pass and return what it reclaimed."""
+    own_session = db is None
+    db = db or SessionLocal()
+    t0 = time.time()
+    report: Dict[str, Any] = {
+        "reclaimed_bytes": 0,
+        "orphans_deleted": 0,
+        "files_scanned": 0,
+        "jobs_deleted": 0,
+        "stale_jobs_failed": 0,
+        "shards": {},
+    }
+    try:
+        _fail_stale_jobs(db, report)
+        budget = batch_size
+        budget -= _expire_failed_jobs(db, budget, report)
+        if budget > 0:
+            budget -= _expire_old_jobs(db, budget, report)
+        if budget > 0:
+            _enforce_quotas(db, budget, report)
+        _collect_unreferenced_blobs(db, batch_size, report)
+        _scan_orphans(db, report)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        if own_session:
+            db.close()
+
+    report["scan_ms"] = round((time.time() - t0) * 1000.0, 2)
+    report["finished_at"] = datetime.utcnow().isoformat()
+    TOTALS["passes"] += 1
+    for key in ("reclaimed_bytes", "orphans_deleted", "jobs_deleted"):
+        TOTALS[key] += report[key]
+    LAST_REPORT.clear()
+    LAST_REPORT.update(report)
+    print(
+        f"[retention] reclaimed={report['reclaimed_bytes']}B orphans={report['orphans_deleted']} "
+        f"jobs={report['jobs_deleted']} scanned={report['files_scanned']} in {report['scan_ms']}ms"
+    )
+    return report
+
+
+def _loop(interval: int) -> None:
+    while not _stop.wait(interval):
+        try:
+            run_retention_pass()
+        except Exception as e:
+            print(f"[retention] Pass failed: {e}")
+
+
+def start_retention_thread(interval: int = RETENTION_INTERVAL_SECONDS) -> None:
+    global _thread
+    if _thread and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, args=(interval,), name="retention", daemon=True)
+    _thread.start()
+
+
+def stop_retention_thread() -> None:
+    _stop.set()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run upload/heatmap retention passes")
+    parser.add_argument("--once", action="store_true", help="run a single pass and exit")
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    args = parser.parse_args()
+    if args.once:
+        run_retention_pass(batch_size=args.batch_size)
+    else:
+        while True:
+            run_retention_pass(batch_size=args.batch_size)
+            time.sleep(RETENTION_INTERVAL_SECONDS)
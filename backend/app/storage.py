@@ -0,0 +1,242 @@
+# app/storage.py
+"""
+Content-addressable storage for uploads and heatmaps.
+
+Every blob is written once under a hash-sharded path:
+
+    <DATA_DIR>/<kind>/ab/cd/<sha256><ext>
+
+so identical bytes are only stored a single time and no directory holds more
+than a few hundred entries. This module only deals with the filesystem;
+reference counts live in the `blobs` table (see crud.acquire_blob / release_blob).
+"""
+
+import hashlib
+import io
+import os
+import re
+import tempfile
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, features
+
+from .config import DATA_DIR
+
+KINDS = ("uploads", "heatmaps")
+
+STORAGE_ROOTS = {kind: os.path.join(DATA_DIR, kind) for kind in KINDS}
+for _root in STORAGE_ROOTS.values():
+    os.makedirs(_root, exist_ok=True)
+
+UPLOAD_DIR = STORAGE_ROOTS["uploads"]
+HEATMAP_DIR = STORAGE_ROOTS["heatmaps"]
+
+# "<sha256>" or "<sha256>.<ext>"
+_BLOB_NAME_RE = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,5})?$")
+
+_FORMAT_EXT = {
+    "JPEG": ".jpg",
+    "PNG": ".png",
+    "WEBP": ".webp",
+    "GIF": ".gif",
+    "BMP": ".bmp",
+    "TIFF": ".tif",
+}
+
+
+# Downscaled copies served to the dashboard and job views: variant -> longest edge
+DERIVATIVE_SIZES = {"thumb": 256, "preview": 1024}
+
+if features.check("webp"):
+    DERIVATIVE_FORMAT, DERIVATIVE_EXT, DERIVATIVE_MEDIA_TYPE = "WEBP", ".webp", "image/webp"
+else:
+    DERIVATIVE_FORMAT, DERIVATIVE_EXT, DERIVATIVE_MEDIA_TYPE = "JPEG", ".jpg", "image/jpeg"
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def sniff_ext(data: bytes, fallback: str = ".jpg") -> str:
+    """
+    Canonical extension from the image header, so the same bytes always map to
+    the same blob no matter what the client called the file.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            return _FORMAT_EXT.get(img.format, fallback)
+    except Exception:
+        return fallback
+
+
+def blob_relpath(sha256: str, ext: str = "") -> str:
+    return os.path.join(sha256[:2], sha256[2:4], f"{sha256}{ext}")
+
+
+def blob_path(kind: str, sha256: str, ext: str = "") -> str:
+    return os.path.join(STORAGE_ROOTS[kind], blob_relpath(sha256, ext))
+
+
+def derivative_path(kind: str, sha256: str, variant: str) -> str:
+    return blob_path(kind, sha256, f".{variant}{DERIVATIVE_EXT}")
+
+
+def _write_atomic(path: str, write_fn) -> None:
+    shard_dir = os.path.dirname(path)
+    os.makedirs(shard_dir, exist_ok=True)
+    # write to a temp file in the same shard, then rename (atomic on POSIX)
+    fd, tmp_path = tempfile.mkstemp(dir=shard_dir, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fh:
+            write_fn(fh)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class InvalidImage(ValueError):
+    """Uploaded bytes that PIL can't read as an image."""
+
+
+def check_image(data: bytes) -> None:
+    """Raise InvalidImage unless `data` parses as an image (headers and structure, no full decode)."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.verify()
+    except Exception as e:
+        raise InvalidImage(f"not a supported image ({e.__class__.__name__})") from e
+
+
+def put_bytes(kind: str, data: bytes, ext: Optional[str] = None,
+              sha256: Optional[str] = None) -> Tuple[str, str, str]:
+    """
+    Store `data` under its content hash (pass `sha256` if already known).
+    Returns (sha256, ext, absolute_path). Writing the same bytes again is a no-op.
+    """
+    sha256 = sha256 or hash_bytes(data)
+    ext = ext or sniff_ext(data)
+    path = blob_path(kind, sha256, ext)
+    try:
+        # bump the mtime so retention doesn't collect a file being reused
+        os.utime(path)
+        return sha256, ext, path
+    except FileNotFoundError:
+        pass
+
+    _write_atomic(path, lambda fh: fh.write(data))
+    return sha256, ext, path
+
+
+def make_derivatives(kind: str, sha256: str, source) -> Dict[str, str]:
+    """
+    Write every DERIVATIVE_SIZES variant of a blob, largest first so each
+    step downsizes from the previous one. `source` is a path or a PIL image.
+    Variants that already exist are left alone. Returns variant -> path.
+    """
+    paths = {v: derivative_path(kind, sha256, v) for v in DERIVATIVE_SIZES}
+    missing = [v for v, p in paths.items() if not os.path.exists(p)]
+    if not missing:
+        return paths
+
+    largest = max(DERIVATIVE_SIZES[v] for v in missing)
+    if isinstance(source, Image.Image):
+        img = source.convert("RGB")
+    else:
+        with Image.open(source) as opened:
+            # let the JPEG decoder downscale while decoding when it can
+            opened.draft("RGB", (largest, largest))
+            img = opened.convert("RGB")
+
+    for variant in sorted(missing, key=lambda v: -DERIVATIVE_SIZES[v]):
+        size = DERIVATIVE_SIZES[variant]
+        img.thumbnail((size, size), Image.LANCZOS)
+        _write_atomic(paths[variant], lambda fh: _save_derivative(img, fh))
+    return paths
+
+
+def _save_derivative(img: Image.Image, fh) -> None:
+    if DERIVATIVE_FORMAT == "WEBP":
+        img.save(fh, format="WEBP", quality=80, method=4)
+    else:
+        img.save(fh, format="JPEG", quality=80, optimize=True, progressive=True)
+
+
+def parse_blob_path(path: Optional[str]) -> Optional[Tuple[str, str, str]]:
+    """
+    Inverse of blob_path: returns (kind, sha256, ext) or None for paths that
+    are not sharded blobs (legacy flat files, "N/A", ...).
+    """
+    if not path:
+        return None
+    m = _BLOB_NAME_RE.match(os.path.basename(path))
+    if not m:
+        return None
+    sha256, ext = m.group(1), m.group(2) or ""
+    path = os.path.abspath(path)
+    for kind in KINDS:
+        if path == os.path.abspath(blob_path(kind, sha256, ext)):
+            return kind, sha256, ext
+    return None
+
+
+def resolve(kind: str, filename: str) -> Optional[str]:
+    """
+    Map a public filename (as used in /api/uploads/<filename>) to a path on
+    disk. Falls back to the old flat layout for files stored before sharding.
+    """
+    m = _BLOB_NAME_RE.match(filename)
+    if m:
+        path = blob_path(kind, m.group(1), m.group(2) or "")
+        return path if os.path.isfile(path) else None
+
+    # legacy flat layout: plain basename only, no traversal
+    if os.path.basename(filename) != filename or filename.startswith("."):
+        return None
+    path = os.path.join(STORAGE_ROOTS[kind], filename)
+    return path if os.path.isfile(path) else None
+
+
+def resolve_derivative(kind: str, filename: str, variant: str) -> Optional[str]:
+    """
+    Path of a downscaled variant for a public filename. Blobs stored before
+    derivatives existed get theirs generated on first request; legacy flat
+    files have no content hash and are served as-is.
+    """
+    if variant not in DERIVATIVE_SIZES:
+        return None
+    m = _BLOB_NAME_RE.match(filename)
+    if not m:
+        return resolve(kind, filename)
+    path = derivative_path(kind, m.group(1), variant)
+    if os.path.isfile(path):
+        return path
+    original = blob_path(kind, m.group(1), m.group(2) or "")
+    if not os.path.isfile(original):
+        return None
+    return make_derivatives(kind, m.group(1), original)[variant]
+
+
+def delete_blob(kind: str, sha256: str, ext: str = "") -> int:
+    """
+    Remove a blob and its derivatives, then prune its shard directories if
+    they are now empty. Returns the number of bytes freed.
+    """
+    path = blob_path(kind, sha256, ext)
+    size = 0
+    for p in [path] + [derivative_path(kind, sha256, v) for v in DERIVATIVE_SIZES]:
+        try:
+            size += os.path.getsize(p)
+            os.remove(p)
+        except FileNotFoundError:
+            continue
+
+    shard_dir = os.path.dirname(path)
+    for _ in range(2):
+        try:
+            os.rmdir(shard_dir)
+        except OSError:
+            break
+        shard_dir = os.path.dirname(shard_dir)
+    return size
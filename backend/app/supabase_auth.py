@@ -1,13 +1,15 @@
 '''import os
+import threading
 import time
 import requests
+from collections import OrderedDict
 from typing import Dict, Any, Optional
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 
-from jose import jwt
+from jose import jwk, jwt
 
 from .database import SessionLocal
 from . import models
@@ -26,29 +28,35 @@ if not SUPABASE_URL:
 
 SUPABASE_URL = SUPABASE_URL.rstrip("/")
 
-# Correct JWKS endpoints
+# Correct JWKS endpoints; SUPABASE_JWKS_URL points at a stand-in server for local testing
 JWKS_CANDIDATES = [
-    f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json",   # Supabase standard
-    f"{SUPABASE_URL}/.well-known/jwks.json",           # fallback
+    url for url in (
+        os.environ.get("SUPABASE_JWKS_URL"),
+        f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json",   # Supabase standard
+        f"{SUPABASE_URL}/.well-known/jwks.json",           # fallback
+    ) if url
 ]
 
 # -----------------------------
 # JWKs CACHE
 # -----------------------------
-_jwks_cache = {"keys": None, "fetched_at": 0, "ttl": 3600}
+# Keys are parsed once and kept by kid. Shortly before the TTL runs out a
+# background thread refetches them while requests keep using the current set
+# (stale-while-revalidate), so no request waits on the network after startup.
+JWKS_TTL_SECONDS = int(os.environ.get("SUPABASE_JWKS_TTL_SECONDS", "3600"))
+JWKS_REFRESH_AHEAD_SECONDS = int(os.environ.get("SUPABASE_JWKS_REFRESH_AHEAD_SECONDS", "300"))
+# an unknown kid forces a refetch (key rotation), at most this often
+JWKS_MIN_REFETCH_SECONDS = 30
 
+_jwks_cache = {"keys": {}, "fetched_at": 0.0, "attempted_at": 0.0, "refreshing": False}
+_jwks_lock = threading.Lock()
 
-def _fetch_jwks():
+
+def _fetch_jwks() -> Dict[str, Any]:
     """
-    Fetch JWKS with fallback and caching.
+    Fetch JWKS with fallback and return (alg, parsed public key) by kid.
     Tries /auth/v1/.well-known/jwks.json first.
     """
-    now = time.time()
-
-    # return cached version
-    if _jwks_cache["keys"] and (now - _jwks_cache["fetched_at"] < _jwks_cache["ttl"]):
-        return _jwks_cache["keys"]
-
     last_exc = None
 
     for url in JWKS_CANDIDATES:
@@ -58,9 +66,12 @@ def _fetch_jwks():
             data = r.json()
 
             if "keys" in data:
-                _jwks_cache["keys"] = data["keys"]
-                _jwks_cache["fetched_at"] = now
-                return _jwks_cache["keys"]
+                keys = {}
+                for k in data["keys"]:
+                    if k.get("kid"):
+                        alg = k.get("alg", "RS256")
+                        keys[k["kid"]] = (alg, jwk.construct(k, alg))
+                return keys
 
             last_exc = RuntimeError(f"No 'keys' in JWKS at {url}")
 
@@ -68,10 +79,59 @@ def _fetch_jwks():
             last_exc = e
             continue
 
-    raise HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail=f"Failed to fetch JWKS: {last_exc}"
-    )
+    raise RuntimeError(f"Failed to fetch JWKS: {last_exc}")
+
+
+def _refresh_jwks() -> None:
+    try:
+        keys = _fetch_jwks()
+        with _jwks_lock:
+            _jwks_cache["keys"] = keys
+            _jwks_cache["fetched_at"] = time.time()
+    except Exception as e:
+        print(f"[supabase_auth] JWKS refresh failed, keeping cached keys: {e}")
+    finally:
+        with _jwks_lock:
+            _jwks_cache["refreshing"] = False
+
+
+def _start_refresh() -> bool:
+    """Kick off a background refresh unless one is already running."""
+    with _jwks_lock:
+        if _jwks_cache["refreshing"]:
+            return False
+        _jwks_cache["refreshing"] = True
+        _jwks_cache["attempted_at"] = time.time()
+    threading.Thread(target=_refresh_jwks, name="jwks-refresh", daemon=True).start()
+    return True
+
+
+def _get_signing_key(kid: str):
+    now = time.time()
+    with _jwks_lock:
+        keys = _jwks_cache["keys"]
+        age = now - _jwks_cache["fetched_at"]
+        since_attempt = now - _jwks_cache["attempted_at"]
+
+    if not keys:
+        # first use: nothing to serve stale, so fetch inline once
+        with _jwks_lock:
+            _jwks_cache["attempted_at"] = now
+        try:
+            keys = _fetch_jwks()
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(e))
+        with _jwks_lock:
+            _jwks_cache["keys"] = keys
+            _jwks_cache["fetched_at"] = now
+    elif age > JWKS_TTL_SECONDS - JWKS_REFRESH_AHEAD_SECONDS:
+        _start_refresh()
+
+    key = keys.get(kid)
+    if key is None and since_attempt > JWKS_MIN_REFETCH_SECONDS:
+        # possibly a rotated key: refresh in the background, this request fails
+        _start_refresh()
+    return key
 
 
 # -----------------------------
@@ -79,44 +139,93 @@ def _fetch_jwks():
 # -----------------------------
 bearer_scheme = HTTPBearer(auto_error=False)
 
+# token -> (exp, payload); a token verified once is trusted until it expires
+VERIFIED_TOKEN_CACHE_SIZE = int(os.environ.get("SUPABASE_VERIFIED_TOKEN_CACHE_SIZE", "10000"))
+_verified_tokens: "OrderedDict[str, tuple]" = OrderedDict()
+_verified_lock = threading.Lock()
+
+
+def _cached_payload(token: str) -> Optional[Dict[str, Any]]:
+    with _verified_lock:
+        entry = _verified_tokens.get(token)
+        if entry is None:
+            return None
+        exp, payload = entry
+        if exp <= time.time():
+            del _verified_tokens[token]
+            return None
+        _verified_tokens.move_to_end(token)
+        return payload
+
+
+def _remember_payload(token: str, payload: Dict[str, Any]) -> None:
+    exp = payload.get("exp")
+    if not exp:
+        return
+    with _verified_lock:
+        _verified_tokens[token] = (exp, payload)
+        _verified_tokens.move_to_end(token)
+        while len(_verified_tokens) > VERIFIED_TOKEN_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+
 
 def verify_supabase_token(token: str) -> Dict[str, Any]:
     """
     Decode a Supabase JWT using JWKS.
     """
-    header = jwt.get_unverified_header(token)
-    kid = header.get("kid")
+    payload = _cached_payload(token)
+    if payload is not None:
+        return payload
 
-    jwks = _fetch_jwks()
+    try:
+        header = jwt.get_unverified_header(token)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Token verification error: {e}"
+        )
 
-    key = next((k for k in jwks if k.get("kid") == kid), None)
-    if not key:
+    signing_key = _get_signing_key(header.get("kid"))
+    if signing_key is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid token: JWK with matching kid not found"
         )
 
-    public_key = jwt.construct_rsa_key(key)
-
+    # the algorithm comes from the key, never from the (unverified) token header
+    alg, public_key = signing_key
     try:
         payload = jwt.decode(
             token,
             public_key,
-            algorithms=[key.get("alg", "RS256")],
+            algorithms=[alg],
             issuer=SUPABASE_URL,
             options={"verify_aud": False},
         )
-        return payload
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail=f"Token verification error: {e}"
         )
 
+    _remember_payload(token, payload)
+    return payload
+
 
 # -----------------------------
 # DB USER MAPPING
 # -----------------------------
+# sub -> (expires_at, user dict); saves a DB session per request
+USER_MAP_TTL_SECONDS = int(os.environ.get("SUPABASE_USER_MAP_TTL_SECONDS", "300"))
+_user_map: Dict[str, tuple] = {}
+_user_map_lock = threading.Lock()
+
+
+def invalidate_supabase_user(sub: str) -> None:
+    with _user_map_lock:
+        _user_map.pop(sub, None)
+
+
 def _map_supabase_to_local_user(payload: Dict[str, Any]) -> Dict[str, Any]:
     """
     Maps a Supabase JWT payload to a local user record (auto-creates if needed).
@@ -125,6 +234,11 @@ def _map_supabase_to_local_user(payload: Dict[str, Any]) -> Dict[str, Any]:
     sub = payload.get("sub")
     email = payload.get("email")
 
+    with _user_map_lock:
+        entry = _user_map.get(sub)
+    if entry and entry[0] > time.time():
+        return entry[1]
+
     username = (
         payload.get("user_name")
         or payload.get("preferred_username")
@@ -147,7 +261,7 @@ def _map_supabase_to_local_user(payload: Dict[str, Any]) -> Dict[str, Any]:
             db.commit()
             db.refresh(user)
 
-        return {
+        mapped = {
             "id": user.id,
             "username": user.username,
             "email": user.email,
@@ -157,6 +271,10 @@ def _map_supabase_to_local_user(payload: Dict[str, Any]) -> Dict[str, Any]:
     finally:
         db.close()
 
+    with _user_map_lock:
+        _user_map[sub] = (time.time() + USER_MAP_TTL_SECONDS, mapped)
+    return mapped
+
 
 # -----------------------------
 # FASTAPI DEPENDENCIES
@@ -2,92 +2,256 @@
 import traceback
 import asyncio
 import os
-from .database import SessionLocal
-from . import crud
-from .config import CELERY_BROKER_URL, CELERY_RESULT_BACKEND, USE_CELERY
-from .models_interface import run_models_on_image  # must return {"models": [...], "consensus": {...}}
+import time
+from typing import Optional
+from .database import SessionLocal, engine
+from . import crud, events, memory, metrics, model_registry, profiling
+from .config import (
+    APP_ROLE,
+    CELERY_ACKS_LATE,
+    CELERY_BROKER_URL,
+    CELERY_CHILD_WARMUP,
+    CELERY_CHILD_THREADS,
+    CELERY_PREFETCH_MULTIPLIER,
+    CELERY_PRELOAD_MODELS,
+    CELERY_PRELOAD_WARMUP,
+    CELERY_RESULT_BACKEND,
+    CELERY_WORKER_CONCURRENCY,
+    JOB_MAX_ATTEMPTS,
+    METRICS_WORKER_PORT,
+    USE_CELERY,
+    WORKER_MAX_JOBS,
+    WORKER_MAX_RSS_MB,
+)
+from .consensus import compute_consensus
+from .metrics import DB_PERSIST_SECONDS, JOB_SECONDS, JOBS_TOTAL
+from .models_interface import (  # run_models_on_image must return {"models": [...], "consensus": {...}}
+    preload_models,
+    run_models_on_image,
+    set_inference_threads,
+    warm_up_models,
+)
 from datetime import datetime
 
-# Try to initialize Celery, fallback to None if Redis unavailable
+# Celery is only set up for the roles that use it (APP_ROLE) and nothing talks
+# to the broker at import; with USE_CELERY=auto the broker is probed lazily on
+# first dispatch (celery_available).
 celery = None
-try:
-    if USE_CELERY == "false":
+if APP_ROLE in ("api", "worker"):
+    try:
+        from celery import Celery
+        celery = Celery(
+            "tasks",
+            broker=CELERY_BROKER_URL,
+            backend=CELERY_RESULT_BACKEND,
+        )
+    except Exception as e:
+        print(f"Warning: Could not initialize Celery: {e}. Using sync mode.")
         celery = None
-    elif USE_CELERY == "true":
-        try:
-            from celery import Celery
-            celery = Celery(
-                "tasks",
-                broker=CELERY_BROKER_URL,
-                backend=CELERY_RESULT_BACKEND,
-            )
-            # Quick health check; may raise if Redis not reachable
-            celery.control.inspect(timeout=1).active()
-        except Exception as e:
-            print(f"Warning: Celery/Redis not available: {e}. Using sync mode.")
-            celery = None
-    else:
-        # auto mode: try to use Celery but don't crash
-        try:
-            from celery import Celery
-            test_celery = Celery(
-                "tasks",
-                broker=CELERY_BROKER_URL,
-                backend=CELERY_RESULT_BACKEND,
-            )
-            test_celery.control.inspect(timeout=1).active()
-            celery = test_celery
-        except Exception:
-            celery = None
-except Exception as e:
-    print(f"Warning: Could not initialize Celery: {e}. Using sync mode.")
-    celery = None
+
+# in auto mode a failed probe is retried after this long
+BROKER_RECHECK_SECONDS = 30
+_broker_check = {"ok": None, "checked_at": 0.0}
+
+
+def celery_available() -> bool:
+    """Whether jobs should go to Celery (falls back to in-process otherwise)."""
+    if celery is None:
+        return False
+    if USE_CELERY != "auto" or APP_ROLE == "worker":
+        return True
+    now = time.time()
+    if _broker_check["ok"] or (
+        _broker_check["ok"] is False and now - _broker_check["checked_at"] < BROKER_RECHECK_SECONDS
+    ):
+        return _broker_check["ok"]
+    try:
+        with celery.connection_for_write() as conn:
+            conn.ensure_connection(max_retries=1, timeout=1)
+        ok = True
+    except Exception as e:
+        print(f"[tasks] Celery broker not reachable ({e}); running analysis in-process")
+        ok = False
+    _broker_check.update(ok=ok, checked_at=now)
+    if ok:
+        events.configure(use_redis=True)
+    return ok
+
+
+_capacity_check = {"value": 0, "checked_at": 0.0}
+CAPACITY_RECHECK_SECONDS = 30
+
+
+def worker_capacity(refresh: bool = False) -> int:
+    """
+    Tasks the Celery workers run at once (sum of their pool sizes). With
+    refresh, the workers are asked again (up to 1s) once the last answer is
+    CAPACITY_RECHECK_SECONDS old. Falls back to CELERY_WORKER_CONCURRENCY
+    when no worker answers.
+    """
+    now = time.time()
+    if celery is None or not refresh or now - _capacity_check["checked_at"] < CAPACITY_RECHECK_SECONDS:
+        return _capacity_check["value"] or CELERY_WORKER_CONCURRENCY
+    total = 0
+    try:
+        stats = celery.control.inspect(timeout=1.0).stats() or {}
+        total = sum(int(s.get("pool", {}).get("max-concurrency") or 0) for s in stats.values())
+    except Exception as e:
+        print(f"[tasks] Could not ask workers for their concurrency: {e}")
+    if total != _capacity_check["value"]:
+        print(f"[tasks] Celery worker capacity: {total or 'unknown'}")
+    _capacity_check.update(value=total, checked_at=now)
+    return total or CELERY_WORKER_CONCURRENCY
+
+
+events.configure(use_redis=celery is not None and (USE_CELERY != "auto" or APP_ROLE == "worker"))
+
+if celery:
+    celery.conf.update(
+        worker_concurrency=CELERY_WORKER_CONCURRENCY,
+        worker_prefetch_multiplier=CELERY_PREFETCH_MULTIPLIER,
+        task_acks_late=CELERY_ACKS_LATE,
+        # with late acks, a child killed mid-task puts the job back on the queue
+        task_reject_on_worker_lost=CELERY_ACKS_LATE,
+        # replace children before leaked memory piles up (see app/memory.py);
+        # replacements are forked from the parent with its preloaded models
+        worker_max_tasks_per_child=WORKER_MAX_JOBS or None,
+        worker_max_memory_per_child=WORKER_MAX_RSS_MB * 1024 or None,  # KiB
+    )
+
+    from celery.signals import worker_init, worker_process_init
+
+    @worker_init.connect
+    def _preload_models_in_parent(**kwargs):
+        # runs in the main worker process before the prefork pool is created
+        model_registry.load()
+        if CELERY_PRELOAD_MODELS:
+            preload_models(warm_up=CELERY_PRELOAD_WARMUP)
+
+    @worker_process_init.connect
+    def _init_child(**kwargs):
+        # connections opened by the parent must not be shared with children
+        engine.dispose(close=False)
+        set_inference_threads(CELERY_CHILD_THREADS)
+        # after the fork, so framework thread pools start in this process
+        if CELERY_CHILD_WARMUP and not CELERY_PRELOAD_WARMUP:
+            warm_up_models()
+        # each child reloads on its own; swapped-in models are per-child
+        # copies until the worker is restarted and preloads them again
+        model_registry.start_watcher()
+        if METRICS_WORKER_PORT:
+            # one port per child: METRICS_WORKER_PORT + pool index
+            from billiard import current_process
+            metrics.serve(METRICS_WORKER_PORT + (current_process().index or 0))
 
 
 def _get_db():
     return SessionLocal()
 
 
-def run_analysis_sync(job_id: int, file_path: str):
+def _result_row(m):
+    """ModelResult columns from a runner result dict."""
+    # expect m contains keys: name, version, confidence_real, confidence_fake, label, time_ms, heatmap_path
+    timings = m.get("timings") or {}
+    return {
+        "model_name": m.get("name") or m.get("model_name") or "unknown",
+        "confidence_real": float(m.get("confidence_real", m.get("confidence", 0.0))),
+        "confidence_fake": float(m.get("confidence_fake", 1.0 - float(m.get("confidence", 0.0)))),
+        "label": m.get("label", "unknown"),
+        "heatmap_path": m.get("heatmap_path", "N/A"),
+        "heatmap_ready": bool(m.get("heatmap_ready", m.get("heatmap_path", "N/A") != "N/A")),
+        "version": m.get("version"),
+        "time_ms": m.get("time_ms"),
+        "load_ms": timings.get("load_ms"),
+        "decode_ms": timings.get("decode_ms"),
+        "preprocess_ms": timings.get("preprocess_ms"),
+        "inference_ms": timings.get("inference_ms"),
+        "heatmap_ms": timings.get("heatmap_ms"),
+    }
+
+
+def run_analysis_sync(job_id: int, file_path: str, profile: Optional[str] = None, takeover: bool = False):
     """
     Synchronous worker for local dev. This:
-      1. marks job 'processing'
+      1. claims the job ('processing'), or returns if it is already taken or
+         finished; `takeover` re-runs a job whose worker died (see crud.claim_job)
       2. runs models via run_models_on_image (async -> run with asyncio.run)
-      3. saves each model result via crud.add_model_result
-      4. marks job 'completed' (or 'failed' on error)
+      3. saves each model's result as it finishes (job status 'partial:k/n'
+         with a running consensus) and finally marks the job 'completed' via
+         crud.complete_job (or 'failed' on error)
+    `profile` ("trace"/"sample") captures a per-job trace, see app/profiling.py.
     """
     db = _get_db()
+    try:
+        claimed = crud.claim_job(job_id, db, takeover=takeover, max_attempts=JOB_MAX_ATTEMPTS)
+        if not claimed:
+            job = crud.get_job(job_id, db)
+            print(f"[tasks] Skipping job_id={job_id}: status is {job.status if job else 'missing'}")
+            if job and job.status == "failed":
+                events.publish(job_id, "status", {"status": "failed"})
+    except Exception:
+        db.close()
+        raise
+    if not claimed:
+        db.close()
+        return
+
+    t_job = time.perf_counter()
+    final_status = "failed"
+    profiling.start(job_id, profiling.resolve_mode(profile))
+    memory.job_started(job_id)
     try:
         print(f"[tasks] Starting analysis job_id={job_id}, file={file_path}")
-        # 1) mark job processing
-        crud.update_job_status(job_id, "processing", db)
+        # 1) job was marked processing when it was claimed
+        events.publish(job_id, "status", {"status": "processing"})
 
-        # 2) run the model pipeline (models_interface returns structured results)
-        try:
-            results = asyncio.run(run_models_on_image(file_path, job_id)) \
-                if callable(run_models_on_image) else asyncio.run(run_models_on_image(file_path))
-        except TypeError:
-            # fallback if run_models_on_image signature is (file_path,) not (file_path, job_id)
-            results = asyncio.run(run_models_on_image(file_path))
+        # 2) run the model pipeline (models_interface returns structured results).
+        #    Each model's result is persisted and pushed to watchers as soon as
+        #    it finishes; the job moves through "partial:k/n" with a running consensus.
+        saved = set()
+
+        def on_result(m, so_far, total):
+            partial = compute_consensus(so_far)
+            with DB_PERSIST_SECONDS.time(kind="partial"), \
+                    profiling.span(job_id, "persist partial result", cat="db", model=m.get("name")):
+                crud.save_partial_result(
+                    job_id, _result_row(m), len(so_far), total, db,
+                    verdict=partial["decision"], consensus_score=partial["score"],
+                )
+            saved.add(id(m))
+            events.publish(job_id, "model", m)
+            events.publish(job_id, "status", {
+                "status": f"partial:{len(so_far)}/{total}",
+                "verdict": partial["decision"],
+                "score": partial["score"],
+            })
+
+        with profiling.span(job_id, "run models", cat="pipeline"):
+            try:
+                results = asyncio.run(run_models_on_image(file_path, job_id, on_result=on_result)) \
+                    if callable(run_models_on_image) else asyncio.run(run_models_on_image(file_path))
+            except TypeError:
+                # fallback if run_models_on_image signature is (file_path,) not (file_path, job_id)
+                results = asyncio.run(run_models_on_image(file_path))
 
         if not results or "models" not in results:
             raise RuntimeError("Model runner returned unexpected result")
 
-        # 3) persist per-model results
-        for m in results["models"]:
-            # expect m contains keys: name, version, confidence_real, confidence_fake, label, time_ms, heatmap_path
-            crud.add_model_result(
-                job_id=job_id,
-                model_name=m.get("name") or m.get("model_name") or "unknown",
-                confidence_real=float(m.get("confidence_real", m.get("confidence", 0.0))),
-                confidence_fake=float(m.get("confidence_fake", 1.0 - float(m.get("confidence", 0.0)))),
-                label=m.get("label", "unknown"),
-                heatmap_path=m.get("heatmap_path", "N/A"),
-                db=db,
+        # 3) persist whatever was not saved incrementally and mark the job completed
+        rows = [_result_row(m) for m in results["models"] if id(m) not in saved]
+        consensus = results.get("consensus") or {}
+        with DB_PERSIST_SECONDS.time(kind="final"), profiling.span(job_id, "persist final", cat="db"):
+            crud.complete_job(
+                job_id, rows, db,
+                verdict=consensus.get("decision"),
+                consensus_score=consensus.get("score"),
             )
-
-        # 4) mark job completed
-        crud.update_job_status(job_id, "completed", db)
+        final_status = "completed"
+        events.publish(job_id, "status", {
+            "status": "completed",
+            "verdict": consensus.get("decision"),
+            "score": consensus.get("score"),
+        })
         print(f"[tasks] Completed job_id={job_id}")
 
     except Exception as e:
@@ -98,15 +262,22 @@ def run_analysis_sync(job_id: int, file_path: str):
             crud.update_job_status(job_id, "failed", db)
         except Exception:
             pass
+        events.publish(job_id, "status", {"status": "failed"})
     finally:
+        JOB_SECONDS.observe(time.perf_counter() - t_job, status=final_status)
+        JOBS_TOTAL.inc(status=final_status)
+        profiling.finish(job_id)
+        memory.job_finished(job_id)
         db.close()
 
 
 # Celery task wrapper (keeps same function signature). If celery is None we still define run_analysis as alias.
 if celery:
     @celery.task(bind=True, name="run_analysis")
-    def run_analysis(self, job_id: int, file_path: str):
-        return run_analysis_sync(job_id, file_path)
+    def run_analysis(self, job_id: int, file_path: str, profile: Optional[str] = None):
+        # with late acks, a task whose child died is delivered again
+        redelivered = bool((self.request.delivery_info or {}).get("redelivered"))
+        return run_analysis_sync(job_id, file_path, profile, takeover=redelivered)
 else:
-    def run_analysis(job_id: int, file_path: str):
-        return run_analysis_sync(job_id, file_path)
+    def run_analysis(job_id: int, file_path: str, profile: Optional[str] = None):
+        return run_analysis_sync(job_id, file_path, profile)
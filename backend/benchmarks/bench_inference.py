@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the inference pipeline in app/models_interface.py.
+
+Runs against stand-in models (benchmarks/standins.py) with the names, input
+sizes and frameworks of MODEL_REGISTRY, so no weights are needed, and
+measures:
+
+  preprocess   PIL fit/resize + array conversion per input size
+  predict      one forward pass per registered model
+  heatmap      occlusion heatmap per input size
+  end_to_end   run_models_on_image, per image size and concurrency level
+
+Results are written as JSON; --baseline compares p50s against an earlier
+run and exits non-zero when something regressed by more than --threshold.
+
+    cd backend
+    python -m benchmarks.bench_inference --out bench.json
+    python -m benchmarks.bench_inference --baseline bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# heatmaps written by the pipeline go to a scratch directory, not real storage
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="bench-inference-"))
+
+from PIL import Image
+
+from app import models_interface as mi
+from benchmarks.standins import install
+
+IMAGE_SIZES = (512, 1024, 2048)
+CONCURRENCY = (1, 2, 4)
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def _summary(latencies_ms, wall_s, ops):
+    return {
+        "n": len(latencies_ms),
+        "p50_ms": round(_percentile(latencies_ms, 50), 3),
+        "p95_ms": round(_percentile(latencies_ms, 95), 3),
+        "mean_ms": round(sum(latencies_ms) / max(1, len(latencies_ms)), 3),
+        "throughput_per_s": round(ops / wall_s, 3) if wall_s > 0 else 0.0,
+    }
+
+
+def _measure(fn, repeats, warmup=1):
+    for _ in range(warmup):
+        fn()
+    latencies = []
+    t_wall = time.perf_counter()
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+    return _summary(latencies, time.perf_counter() - t_wall, repeats)
+
+
+def _test_image(size):
+    # a gradient, so resizing/encoding work is closer to a photo than a flat fill
+    img = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+    return img
+
+
+def _write_image(tmp, size):
+    path = os.path.join(tmp, f"bench-{size}.jpg")
+    if not os.path.exists(path):
+        _test_image(size).save(path, "JPEG", quality=90)
+    return path
+
+
+def _predict_fn(entry, model):
+    size = int(entry["input_size"])
+    if mi._is_torch_entry(entry):
+        return lambda img: mi._predict_with_torch(model, mi._preprocess_for_torch(img, size))
+    return lambda img: mi._predict_with_keras(model, mi._preprocess_for_keras(img, size))
+
+
+# -----------------------
+# Benchmarks
+# -----------------------
+def bench_preprocess(image_sizes, repeats):
+    out = {}
+    input_sizes = sorted({int(e["input_size"]) for e in mi.MODEL_REGISTRY})
+    for image_size in image_sizes:
+        img = _test_image(image_size)
+        for input_size in input_sizes:
+            out[f"preprocess/keras/img{image_size}/in{input_size}"] = _measure(
+                lambda: mi._preprocess_for_keras(img, input_size), repeats
+            )
+            if mi.TORCH_AVAILABLE:
+                out[f"preprocess/torch/img{image_size}/in{input_size}"] = _measure(
+                    lambda: mi._preprocess_for_torch(img, input_size), repeats
+                )
+    return out
+
+
+def bench_predict(repeats):
+    out = {}
+    for entry in mi.MODEL_REGISTRY:
+        model = mi._load_model_entry(entry)
+        size = int(entry["input_size"])
+        img = _test_image(size)
+        if mi._is_torch_entry(entry):
+            inp = mi._preprocess_for_torch(img, size)
+            fn = lambda: mi._predict_with_torch(model, inp)
+        else:
+            inp = mi._preprocess_for_keras(img, size)
+            fn = lambda: mi._predict_with_keras(model, inp)
+        out[f"predict/{entry['name']}"] = _measure(fn, repeats)
+    return out
+
+
+def bench_heatmap(repeats):
+    out = {}
+    seen = set()
+    for entry in mi.MODEL_REGISTRY:
+        size = int(entry["input_size"])
+        if size in seen:
+            continue
+        seen.add(size)
+        model = mi._load_model_entry(entry)
+        img = _test_image(1024)
+        predict = _predict_fn(entry, model)
+        out[f"heatmap/in{size}"] = _measure(
+            lambda: mi._generate_occlusion_heatmap_generic(predict, img, size, target_class_idx=1),
+            repeats,
+            warmup=0,
+        )
+    return out
+
+
+def bench_end_to_end(image_sizes, concurrency_levels, jobs_per_level, tmp):
+    out = {}
+    for image_size in image_sizes:
+        path = _write_image(tmp, image_size)
+        asyncio.run(mi.run_models_on_image(path))  # warm caches
+        for concurrency in concurrency_levels:
+            def one_job(_):
+                t0 = time.perf_counter()
+                asyncio.run(mi.run_models_on_image(path))
+                return (time.perf_counter() - t0) * 1000.0
+
+            t_wall = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as ex:
+                latencies = list(ex.map(one_job, range(jobs_per_level)))
+            out[f"end_to_end/img{image_size}/c{concurrency}"] = _summary(
+                latencies, time.perf_counter() - t_wall, jobs_per_level
+            )
+    return out
+
+
+# -----------------------
+# Results
+# -----------------------
+def _meta(kind):
+    try:
+        rev = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip()
+    except Exception:
+        rev = ""
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_rev": rev,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "standins": kind,
+        "torch": bool(mi.TORCH_AVAILABLE),
+        "models": [(e["name"], e["framework"], e["input_size"], e["version"]) for e in mi.MODEL_REGISTRY],
+    }
+
+
+def compare(results, baseline, threshold):
+    """Print p50 deltas against a baseline; returns the names that regressed."""
+    regressed = []
+    print(f"\n{'benchmark':48} {'baseline p50':>13} {'now p50':>10} {'delta':>8}")
+    for name, now in results["results"].items():
+        before = baseline.get("results", {}).get(name)
+        if not before or not before.get("p50_ms"):
+            print(f"{name:48} {'-':>13} {now['p50_ms']:>10.2f} {'new':>8}")
+            continue
+        delta = (now["p50_ms"] - before["p50_ms"]) / before["p50_ms"]
+        flag = "  REGRESSED" if delta > threshold else ""
+        print(f"{name:48} {before['p50_ms']:>13.2f} {now['p50_ms']:>10.2f} {delta:>+8.1%}{flag}")
+        if delta > threshold:
+            regressed.append(name)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--standins", choices=("auto", "native", "numpy"), default="auto",
+                        help="native torch/keras stand-ins where installed (auto), or numpy everywhere")
+    parser.add_argument("--only", nargs="*", choices=("preprocess", "predict", "heatmap", "end_to_end"),
+                        help="run a subset of the benchmarks")
+    parser.add_argument("--image-sizes", type=int, nargs="*", default=list(IMAGE_SIZES))
+    parser.add_argument("--concurrency", type=int, nargs="*", default=list(CONCURRENCY))
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--heatmap-repeats", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=8, help="end-to-end jobs per concurrency level")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against this results JSON")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p50 slowdown counted as a regression")
+    args = parser.parse_args()
+
+    install(args.standins)
+    only = set(args.only or ("preprocess", "predict", "heatmap", "end_to_end"))
+    results = {"meta": _meta(args.standins), "results": {}}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if "preprocess" in only:
+            results["results"].update(bench_preprocess(args.image_sizes, args.repeats))
+        if "predict" in only:
+            results["results"].update(bench_predict(args.repeats))
+        if "heatmap" in only:
+            results["results"].update(bench_heatmap(args.heatmap_repeats))
+        if "end_to_end" in only:
+            results["results"].update(bench_end_to_end(args.image_sizes, args.concurrency, args.jobs, tmp))
+
+    print(f"\n{'benchmark':48} {'p50 ms':>10} {'p95 ms':>10} {'ops/s':>10}")
+    for name, r in results["results"].items():
+        print(f"{name:48} {r['p50_ms']:>10.2f} {r['p95_ms']:>10.2f} {r['throughput_per_s']:>10.2f}")
+
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(results, fh, indent=2)
+        print(f"\nwrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as fh:
+            baseline = json.load(fh)
+        regressed = compare(results, baseline, args.threshold)
+        if regressed:
+            print(f"\n{len(regressed)} benchmark(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Reader/writer contention benchmark for the database engine profiles.
+
+Simulates background jobs committing results while API requests read, and
+compares SQLite in rollback-journal mode with the WAL profile from
+app/database.py (or runs against DATABASE_URL with --url).
+
+    cd backend
+    python -m benchmarks.db_contention --writers 4 --readers 8 --seconds 5
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+
+from app.database import make_engine, pool_metrics
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def run_profile(label, engine, writers, readers, seconds):
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS bench_results"))
+        conn.execute(text(
+            "CREATE TABLE bench_results (id INTEGER PRIMARY KEY, job_id INTEGER, label VARCHAR(16), score FLOAT)"
+        ))
+
+    stop = threading.Event()
+    stats = {"writes": 0, "reads": 0, "errors": 0, "write_ms": [], "read_ms": []}
+    lock = threading.Lock()
+
+    def writer(n):
+        job_id = n * 1_000_000
+        while not stop.is_set():
+            job_id += 1
+            t0 = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    conn.execute(
+                        text("INSERT INTO bench_results (job_id, label, score) VALUES (:j, :l, :s)"),
+                        [{"j": job_id, "l": "fake", "s": 0.5} for _ in range(5)],
+                    )
+            except Exception:
+                with lock:
+                    stats["errors"] += 1
+                continue
+            with lock:
+                stats["writes"] += 1
+                stats["write_ms"].append((time.perf_counter() - t0) * 1000.0)
+
+    def reader(_n):
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text(
+                        "SELECT job_id, label, score FROM bench_results ORDER BY id DESC LIMIT 20"
+                    )).fetchall()
+            except Exception:
+                with lock:
+                    stats["errors"] += 1
+                continue
+            with lock:
+                stats["reads"] += 1
+                stats["read_ms"].append((time.perf_counter() - t0) * 1000.0)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    pool = pool_metrics(engine)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print(f"\n== {label}")
+    print(f"  writes/s: {stats['writes'] / seconds:8.1f}   p50 {_percentile(stats['write_ms'], 50):7.2f} ms   p99 {_percentile(stats['write_ms'], 99):7.2f} ms")
+    print(f"  reads/s:  {stats['reads'] / seconds:8.1f}   p50 {_percentile(stats['read_ms'], 50):7.2f} ms   p99 {_percentile(stats['read_ms'], 99):7.2f} ms")
+    print(f"  errors:   {stats['errors']}")
+    print(f"  pool:     {pool}")
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS bench_results"))
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--url", help="benchmark this database instead of temporary SQLite files")
+    args = parser.parse_args()
+
+    if args.url:
+        run_profile(args.url.split("://")[0], make_engine(args.url), args.writers, args.readers, args.seconds)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        rollback = make_engine(
+            f"sqlite:///{os.path.join(tmp, 'rollback.db')}", journal_mode="DELETE", synchronous="FULL"
+        )
+        run_profile("sqlite rollback journal (previous default)", rollback, args.writers, args.readers, args.seconds)
+        wal = make_engine(f"sqlite:///{os.path.join(tmp, 'wal.db')}")
+        run_profile("sqlite WAL + synchronous=NORMAL (profile)", wal, args.writers, args.readers, args.seconds)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test: login -> upload -> poll /api/jobs/{id} until a verdict.
+
+Starts the app in a child process with stand-in models (benchmarks/standins.py)
+and a scratch SQLite database, in one or both execution modes:
+
+  inprocess  admission dispatcher -> in-process worker threads
+  celery     admission dispatcher -> Celery, with an in-memory broker and a
+             thread-pool worker inside the API process (memory://)
+
+then ramps closed-loop clients through --concurrency levels. Each client
+logs in once and keeps uploading an image drawn from --image-mix, polling
+until the job completes. Per level it reports time-to-verdict (upload start
+to final status; first partial verdict as well), error and rejection rates
+and completed jobs per second. The saturation point is the level after
+which throughput stops growing by --knee while latency keeps rising.
+
+    cd backend
+    python -m benchmarks.loadtest --mode both --concurrency 1 2 4 8 --seconds 30
+    python -m benchmarks.loadtest --image-mix 512:6,1024:3,2048:1 --workers 4 --out load.json
+    python -m benchmarks.loadtest --url http://localhost:8000 --user me --password ...
+"""
+
+import argparse
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DONE_STATUSES = ("completed", "failed")
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100.0))]
+
+
+def _parse_mix(spec):
+    """"512:6,1024:3,2048:1" -> [(512, 6.0), (1024, 3.0), (2048, 1.0)]"""
+    mix = []
+    for part in spec.split(","):
+        size, _, weight = part.partition(":")
+        mix.append((int(size), float(weight or 1)))
+    return mix
+
+
+# -----------------------
+# Server (child process)
+# -----------------------
+def serve(mode, port, workers, standins):
+    """Run the app with stand-in models; blocks until terminated."""
+    import uvicorn
+
+    from benchmarks.standins import install
+
+    install(standins)
+    from app.main import app
+
+    if mode == "celery":
+        from celery.contrib.testing.worker import start_worker
+
+        from app.tasks import celery
+
+        # the memory transport only exists inside this process, so the worker does too
+        worker = start_worker(
+            celery, pool="threads", concurrency=workers, perform_ping_check=False, loglevel="WARNING",
+        )
+        worker.__enter__()
+
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning")
+
+
+def _server_env(mode, data_dir, workers, keep_limits):
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(data_dir, 'loadtest.db')}",
+        "DATA_DIR": data_dir,
+        "ADMISSION_MAX_RUNNING": str(workers),
+        "EVENTS_BACKEND": "memory",
+        # stand-ins replace the registry; a registry file would swap them back out
+        "MODEL_REGISTRY_FILE": "",
+        "PYTHONUNBUFFERED": "1",
+    })
+    if mode == "celery":
+        env.update({
+            "USE_CELERY": "true",
+            "APP_ROLE": "api",
+            "CELERY_BROKER_URL": "memory://",
+            "CELERY_RESULT_BACKEND": "cache+memory://",
+        })
+    else:
+        env.update({"USE_CELERY": "false", "APP_ROLE": "inprocess"})
+    if not keep_limits:
+        # measure the node, not the per-user rate limits
+        env.update({
+            "ADMISSION_MAX_QUEUED": "100000",
+            "ADMISSION_FREE_RATE_PER_MINUTE": "1000000",
+            "ADMISSION_FREE_BURST": "100000",
+            "ADMISSION_FREE_MAX_QUEUED": "100000",
+        })
+    return env
+
+
+def start_server(mode, port, workers, standins, keep_limits, data_dir):
+    env = _server_env(mode, data_dir, workers, keep_limits)
+    log_path = os.path.join(data_dir, f"server-{mode}.log")
+    log = open(log_path, "w")
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.loadtest", "--serve", mode, "--port", str(port),
+         "--workers", str(workers), "--standins", standins],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    base = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}, see {log_path}")
+        try:
+            if requests.get(f"{base}/api/health/db", timeout=1).ok:
+                print(f"[loadtest] {mode} server ready on {base} (log: {log_path})")
+                return proc, base
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    proc.terminate()
+    raise RuntimeError(f"server did not come up, see {log_path}")
+
+
+def stop_server(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# -----------------------
+# Client
+# -----------------------
+def make_images(mix, distinct):
+    """A few distinct JPEGs per size, so content-addressed storage doesn't dedupe everything."""
+    from PIL import Image
+
+    images = {}
+    rng = random.Random(0)
+    for size, _ in mix:
+        base = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+        variants = []
+        for _ in range(distinct):
+            img = base.copy()
+            img.paste(tuple(rng.randrange(256) for _ in range(3)), (0, 0, size // 8, size // 8))
+            buf = io.BytesIO()
+            img.save(buf, "JPEG", quality=90)
+            variants.append(buf.getvalue())
+        images[size] = variants
+    return images
+
+
+def ensure_users(base, count, password):
+    users = []
+    for i in range(count):
+        username = f"loadtest{i}"
+        requests.post(f"{base}/api/auth/register", json={
+            "username": username, "email": f"{username}@example.com", "password": password,
+        }, timeout=10)
+        users.append(username)
+    return users
+
+
+def client_loop(base, username, password, images, mix, deadline, args, record):
+    session = requests.Session()
+    try:
+        r = session.post(f"{base}/api/auth/login", json={"username": username, "password": password}, timeout=30)
+        r.raise_for_status()
+        session.headers["Authorization"] = f"Bearer {r.json()['access_token']}"
+    except Exception as e:
+        record({"outcome": "error", "stage": "login", "error": str(e)})
+        return
+
+    sizes = [s for s, _ in mix]
+    weights = [w for _, w in mix]
+    rng = random.Random(username)
+    while time.time() < deadline:
+        size = rng.choices(sizes, weights)[0]
+        content = rng.choice(images[size])
+        sample = {"size": size}
+        t0 = time.time()
+        try:
+            r = session.post(f"{base}/api/upload", files={"file": (f"load-{size}.jpg", content, "image/jpeg")},
+                             timeout=60)
+            sample["upload_ms"] = (time.time() - t0) * 1000.0
+            if r.status_code == 429:
+                sample.update(outcome="rejected", retry_after=r.headers.get("Retry-After"))
+                record(sample)
+                time.sleep(min(float(r.headers.get("Retry-After") or 1), 5.0))
+                continue
+            r.raise_for_status()
+            job_id = r.json()["jobId"]
+
+            while True:
+                if time.time() - t0 > args.job_timeout:
+                    sample.update(outcome="timeout")
+                    break
+                time.sleep(args.poll_interval)
+                job = session.get(f"{base}/api/jobs/{job_id}", timeout=30).json()
+                status = job.get("status") or ""
+                if "first_verdict_ms" not in sample and job.get("consensus", {}).get("decision") != "PENDING":
+                    sample["first_verdict_ms"] = (time.time() - t0) * 1000.0
+                if status in DONE_STATUSES:
+                    sample["verdict_ms"] = (time.time() - t0) * 1000.0
+                    sample["outcome"] = "ok" if status == "completed" else "failed"
+                    break
+        except Exception as e:
+            sample.update(outcome="error", error=str(e))
+        record(sample)
+
+
+def run_level(base, users, password, images, mix, concurrency, args):
+    samples = []
+    lock = threading.Lock()
+
+    def record(sample):
+        with lock:
+            samples.append(sample)
+
+    started = time.time()
+    deadline = started + args.seconds
+    threads = [
+        threading.Thread(
+            target=client_loop,
+            args=(base, users[i % len(users)], password, images, mix, deadline, args, record),
+            daemon=True,
+        )
+        for i in range(concurrency)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - started
+
+    ok = [s for s in samples if s.get("outcome") == "ok"]
+    attempts = [s for s in samples if s.get("stage") != "login"]
+    errors = [s for s in samples if s.get("outcome") in ("error", "failed", "timeout")]
+    rejected = [s for s in samples if s.get("outcome") == "rejected"]
+    verdict = [s["verdict_ms"] for s in ok]
+    first = [s["first_verdict_ms"] for s in ok if "first_verdict_ms" in s]
+    upload = [s["upload_ms"] for s in samples if "upload_ms" in s]
+    by_size = {}
+    for size, _ in mix:
+        sized = [s["verdict_ms"] for s in ok if s["size"] == size]
+        by_size[str(size)] = {"n": len(sized), "p50_ms": round(_percentile(sized, 50), 1)}
+
+    return {
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 2),
+        "uploads": len(attempts),
+        "completed": len(ok),
+        "errors": len(errors),
+        "rejected": len(rejected),
+        "error_rate": round(len(errors) / max(1, len(attempts)), 4),
+        "throughput_per_s": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "verdict_p50_ms": round(_percentile(verdict, 50), 1),
+        "verdict_p95_ms": round(_percentile(verdict, 95), 1),
+        "verdict_p99_ms": round(_percentile(verdict, 99), 1),
+        "first_verdict_p50_ms": round(_percentile(first, 50), 1),
+        "upload_p50_ms": round(_percentile(upload, 50), 1),
+        "by_size": by_size,
+        "sample_errors": sorted({s.get("error", s["outcome"]) for s in errors})[:5],
+    }
+
+
+def saturation_point(levels, knee):
+    """
+    Last concurrency level that still raised throughput by at least `knee`
+    (a fraction) over the previous one; past it, more clients only add latency.
+    """
+    if not levels:
+        return None
+    best = levels[0]
+    for prev, cur in zip(levels, levels[1:]):
+        if prev["throughput_per_s"] and cur["throughput_per_s"] < prev["throughput_per_s"] * (1 + knee):
+            break
+        best = cur
+    return {
+        "concurrency": best["concurrency"],
+        "throughput_per_s": best["throughput_per_s"],
+        "verdict_p95_ms": best["verdict_p95_ms"],
+        "max_throughput_per_s": max(level["throughput_per_s"] for level in levels),
+    }
+
+
+def _print_levels(mode, levels):
+    print(f"\n== {mode} ==")
+    print(f"{'clients':>7} {'uploads':>7} {'done':>6} {'err%':>6} {'429':>5} {'jobs/s':>7} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'first p50':>9}")
+    for r in levels:
+        print(f"{r['concurrency']:>7} {r['uploads']:>7} {r['completed']:>6} {r['error_rate'] * 100:>6.1f} "
+              f"{r['rejected']:>5} {r['throughput_per_s']:>7.2f} {r['verdict_p50_ms']:>9.0f} "
+              f"{r['verdict_p95_ms']:>9.0f} {r['verdict_p99_ms']:>9.0f} {r['first_verdict_p50_ms']:>9.0f}")
+        if r["sample_errors"]:
+            print(f"{'':>7} errors: {'; '.join(r['sample_errors'])}")
+
+
+def run_mode(mode, base, args, mix, images):
+    if args.user:
+        users, password = [args.user], args.password
+    else:
+        password = args.password or "loadtest-password"
+        users = ensure_users(base, args.users, password)
+
+    levels = []
+    for concurrency in args.concurrency:
+        print(f"[loadtest] {mode}: {concurrency} client(s) for {args.seconds}s")
+        level = run_level(base, users, password, images, mix, concurrency, args)
+        levels.append(level)
+        if level["error_rate"] > args.max_error_rate:
+            print(f"[loadtest] {mode}: error rate {level['error_rate']:.0%}, stopping the ramp")
+            break
+    _print_levels(mode, levels)
+    saturation = saturation_point(levels, args.knee)
+    if saturation:
+        print(f"saturation: ~{saturation['throughput_per_s']:.2f} jobs/s at {saturation['concurrency']} client(s) "
+              f"(p95 {saturation['verdict_p95_ms']:.0f} ms)")
+    return {"levels": levels, "saturation": saturation}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=("inprocess", "celery", "both"), default="inprocess")
+    parser.add_argument("--url", help="drive an already running app instead of starting one")
+    parser.add_argument("--user", help="existing account to use with --url")
+    parser.add_argument("--password")
+    parser.add_argument("--users", type=int, default=4, help="accounts to spread clients over")
+    parser.add_argument("--concurrency", type=int, nargs="*", default=[1, 2, 4, 8])
+    parser.add_argument("--seconds", type=float, default=30, help="duration of each concurrency level")
+    parser.add_argument("--image-mix", default="512:6,1024:3,2048:1", help="size:weight,...")
+    parser.add_argument("--distinct", type=int, default=8, help="distinct images per size")
+    parser.add_argument("--workers", type=int, default=2, help="ADMISSION_MAX_RUNNING / Celery worker threads")
+    parser.add_argument("--standins", choices=("auto", "native", "numpy"), default="auto")
+    parser.add_argument("--keep-admission-limits", action="store_true",
+                        help="keep the configured per-user rate limits (429s are counted as rejected)")
+    parser.add_argument("--poll-interval", type=float, default=0.25)
+    parser.add_argument("--job-timeout", type=float, default=300)
+    parser.add_argument("--max-error-rate", type=float, default=0.5, help="stop ramping above this error rate")
+    parser.add_argument("--knee", type=float, default=0.10,
+                        help="minimum throughput gain per level before calling it saturated")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--serve", choices=("inprocess", "celery"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.workers, args.standins)
+        return
+
+    mix = _parse_mix(args.image_mix)
+    images = make_images(mix, args.distinct)
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "cpu_count": os.cpu_count(),
+            "workers": args.workers,
+            "image_mix": args.image_mix,
+            "seconds_per_level": args.seconds,
+            "standins": args.standins,
+        },
+        "modes": {},
+    }
+
+    if args.url:
+        results["modes"]["external"] = run_mode("external", args.url.rstrip("/"), args, mix, images)
+    else:
+        modes = ("inprocess", "celery") if args.mode == "both" else (args.mode,)
+        for mode in modes:
+            data_dir = tempfile.mkdtemp(prefix=f"loadtest-{mode}-")
+            proc, base = start_server(mode, args.port, args.workers, args.standins,
+                                      args.keep_admission_limits, data_dir)
+            try:
+                results["modes"][mode] = run_mode(mode, base, args, mix, images)
+            finally:
+                stop_server(proc)
+
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(results, fh, indent=2)
+        print(f"\nwrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Tiny synthetic stand-ins for the models in MODEL_REGISTRY.
+
+They keep each entry's name, framework and input size, so the pipeline in
+app/models_interface.py runs its usual preprocessing, prediction and
+heatmap code without the real weights:
+
+  - native: a small torch / tf.keras network when that framework is installed
+  - numpy:  a Keras-like object with .predict (pooled random projection) that
+            exercises the Keras code path anywhere
+
+    from benchmarks.standins import install
+    restore = install()        # swaps MODEL_REGISTRY in place
+    ...
+    restore()
+"""
+
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+from app import models_interface as mi
+
+
+class NumpyStandIn:
+    """Keras-like model: average-pool to 16x16, project to 2 logits, softmax."""
+
+    def __init__(self, input_size: int, seed: int = 0):
+        self.input_size = input_size
+        rng = np.random.default_rng(seed)
+        self.weights = rng.standard_normal((16 * 16 * 3, 2)).astype(np.float32) * 0.05
+
+    def predict(self, x, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        n, h, w, c = x.shape
+        fh, fw = h // 16, w // 16
+        pooled = x[:, : fh * 16, : fw * 16, :].reshape(n, 16, fh, 16, fw, c).mean(axis=(2, 4))
+        logits = pooled.reshape(n, -1) @ self.weights
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
+
+
+def _torch_standin(input_size: int):
+    import torch
+
+    model = torch.nn.Sequential(
+        torch.nn.Conv2d(3, 8, kernel_size=3, stride=2, padding=1),
+        torch.nn.ReLU(),
+        torch.nn.AdaptiveAvgPool2d(4),
+        torch.nn.Flatten(),
+        torch.nn.Linear(8 * 4 * 4, 2),
+    )
+    return model.eval()
+
+
+def _keras_standin(input_size: int):
+    import tensorflow as tf
+
+    return tf.keras.Sequential([
+        tf.keras.layers.Input((input_size, input_size, 3)),
+        tf.keras.layers.Conv2D(8, 3, strides=2, activation="relu"),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(2, activation="softmax"),
+    ])
+
+
+def standin_registry(kind: str = "auto") -> List[Dict[str, Any]]:
+    """
+    Registry entries mirroring MODEL_REGISTRY, backed by stand-ins.
+    kind: "native" (torch/keras, fails if missing), "numpy", or "auto"
+    (native where the framework is installed, numpy otherwise).
+    """
+    mi._import_frameworks()
+    entries = []
+    for i, entry in enumerate(mi.MODEL_REGISTRY):
+        size = int(entry.get("input_size", 224))
+        is_torch = mi._is_torch_entry(entry)
+        native_ok = mi.TORCH_AVAILABLE if is_torch else mi.TF_AVAILABLE
+        use_native = kind == "native" or (kind == "auto" and native_ok)
+
+        if use_native and is_torch:
+            framework, loader = "torch", (lambda p, d, s=size: _torch_standin(s).to(d))
+        elif use_native:
+            framework, loader = "keras", (lambda p, d, s=size: _keras_standin(s))
+        else:
+            framework, loader = "keras", (lambda p, d, s=size, seed=i: NumpyStandIn(s, seed))
+
+        entries.append({
+            "name": entry["name"],
+            # any existing file satisfies the path lookup; the loader ignores it
+            "path": __file__,
+            "framework": framework,
+            "input_size": size,
+            "version": f"standin-{'native' if use_native else 'numpy'}",
+            "loader": loader,
+        })
+    return entries
+
+
+def install(kind: str = "auto") -> Callable[[], None]:
+    """Swap MODEL_REGISTRY for stand-ins; returns a function restoring the original."""
+    original = list(mi.MODEL_REGISTRY)
+    original_tf = mi.TF_AVAILABLE
+    registry = standin_registry(kind)
+
+    mi.MODEL_REGISTRY[:] = registry
+    if any(e["version"] == "standin-numpy" for e in registry):
+        # numpy stand-ins go down the Keras code path, which checks for TF
+        mi.TF_AVAILABLE = True
+    with mi._MODEL_CACHE_LOCK:
+        mi._MODEL_CACHE.clear()
+
+    def restore():
+        mi.MODEL_REGISTRY[:] = original
+        mi.TF_AVAILABLE = original_tf
+        with mi._MODEL_CACHE_LOCK:
+            mi._MODEL_CACHE.clear()
+
+    return restore
@@ -3,8 +3,9 @@ import dynamic from "next/dynamic";
 import ConsensusCard from "../../src/components/ConsensusCard";
 import ModelResultCard from "../../src/components/ModelResultCard";
 import useSWR from "swr";
-import { fetcher } from "../../src/lib/api";
+import { API_BASE, fetcher } from "../../src/lib/api";
 import { useRouter } from "next/router";
+import { useEffect, useState } from "react";
 import { Card } from "@/components/ui/card";
 import { Skeleton } from "@/components/ui/skeleton";
 import { Badge } from "@/components/ui/badge";
@@ -16,15 +17,81 @@ export default function ResultPage() {
   const router = useRouter();
   const { id } = router.query;
 
-  const { data: job, error } = useSWR(
+  // Progress is pushed over SSE; polling only kicks in if the stream fails.
+  const [streamFailed, setStreamFailed] = useState(false);
+
+  const { data: job, error, mutate } = useSWR(
     () => (id ? `/api/jobs/${id}` : null),
     fetcher,
-    { refreshInterval: 2000 }
+    { refreshInterval: streamFailed ? 2000 : 0 }
   );
 
+  useEffect(() => {
+    if (!id || typeof window === "undefined" || !("EventSource" in window)) {
+      setStreamFailed(true);
+      return;
+    }
+    const source = new EventSource(`${API_BASE}/api/jobs/${id}/events`);
+
+    source.addEventListener("job", (e) => {
+      const snapshot = JSON.parse((e as MessageEvent).data);
+      mutate(snapshot, false);
+      if (snapshot.status === "completed" || snapshot.status === "failed") {
+        source.close();
+      }
+    });
+    source.addEventListener("status", (e) => {
+      const { status, verdict, score } = JSON.parse((e as MessageEvent).data);
+      mutate((prev: any) => {
+        if (!prev) return prev;
+        if (!verdict) return { ...prev, status };
+        // running consensus, shaped like transform_job_for_frontend's
+        const explanation = [
+          `${prev.models?.length ?? 0} model(s) analyzed`,
+          `Majority vote: ${verdict.toLowerCase()}`,
+        ];
+        if (status?.startsWith("partial:")) {
+          explanation.push(
+            `Partial result (${status.slice("partial:".length)} models), more models still running`
+          );
+        }
+        return {
+          ...prev,
+          status,
+          consensus: { decision: verdict, score: score ?? 0.5, explanation },
+        };
+      }, false);
+    });
+    source.addEventListener("model", (e) => {
+      const model = JSON.parse((e as MessageEvent).data);
+      mutate(
+        (prev: any) =>
+          prev
+            ? {
+                ...prev,
+                models: [
+                  ...prev.models.filter((m: any) => m.model_name !== model.model_name),
+                  model,
+                ],
+              }
+            : prev,
+        false
+      );
+    });
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED) {
+        setStreamFailed(true);
+      }
+    };
+
+    return () => source.close();
+  }, [id, mutate]);
+
   const isLoading = !job && !error;
   const isProcessing =
-    job?.status === "pending" || job?.status === "processing";
+    job?.status === "pending" ||
+    job?.status === "processing" ||
+    job?.status?.startsWith("partial:");
 
   // ---------- LOADING UI ----------
   if (isLoading) {
@@ -96,7 +163,7 @@ export default function ResultPage() {
             {/* Image */}
             <Card className="p-3">
               <img
-                src={job.image?.thumbnail_url}
+                src={job.image?.preview_url ?? job.image?.thumbnail_url}
                 alt="Analyzed Image"
                 className="rounded-md w-full"
               />
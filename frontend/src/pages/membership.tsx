@@ -4,6 +4,7 @@ import dynamic from "next/dynamic";
 import { Button } from "@/components/ui/button";
 import { Shield, Zap, FileDown } from "lucide-react";
 import { useCallback, useState } from "react";
+import { getAuthHeaders } from "@/lib/api";
 
 const Navbar = dynamic(() => import("@/components/Navbar"), { ssr: false });
 
@@ -17,7 +18,7 @@ export default function Membership() {
       setLoadingPlan(plan);
       const res = await fetch(`${API}/create-checkout-session`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: { "Content-Type": "application/json", ...getAuthHeaders() },
         body: JSON.stringify({ plan }),
       });
 
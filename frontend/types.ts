@@ -3,6 +3,7 @@
   score: number;
   version?: string;
   heatmap_url?: string;
+  heatmap_full_url?: string;
   image_url?: string;
   run_time_ms?: number;
   labels?: any;
@@ -20,6 +21,8 @@ export interface JobResponse {
   created_at: string;
   image?: {
     thumbnail_url?: string;
+    preview_url?: string;
+    original_url?: string;
   };
   consensus?: Consensus;
   models: ModelResult[];